@@ -0,0 +1,226 @@
+"""
+کنترل پذیرش تطبیقی (adaptive concurrency limit) برای کارهای سنگین
+
+The limit on concurrent jobs is not configured but discovered, gradient
+style: a short-term latency average is compared with a baseline (the best
+recent latency, rising only slowly). While they agree the limit grows by
+about sqrt(limit) per window (additive increase); once latency inflates past
+``tolerance`` x baseline the limit is scaled down by the ratio
+(multiplicative decrease, at most by half).
+
+Jobs over the limit wait in a bounded queue for at most ``max_wait``
+seconds; a full queue or an expired wait is answered with 503 and a
+Retry-After estimate right away, instead of letting requests time out.
+
+The queue is shared fairly between tenants (users): weighted fair queuing
+gives each waiting job a virtual finish time of
+
+    max(virtual clock, tenant's previous finish) + 1 / weight
+
+and frees slots in that order, so a tenant with weight 2 gets twice the
+share of one with weight 1 and a client looping requests only delays its
+own jobs. A tenant may also hold at most ``tenant_queue_limit * weight``
+queued jobs.
+"""
+
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Hashable, List, Optional, Tuple
+
+from fastapi import HTTPException, status
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        name: str,
+        initial_limit: int = 2,
+        min_limit: int = 1,
+        max_limit: int = 16,
+        queue_limit: int = 32,
+        tenant_queue_limit: int = 4,
+        max_wait: float = 2.0,
+        tolerance: float = 1.5,
+        smoothing: float = 0.2,
+    ):
+        self.name = name
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(min(max(initial_limit, min_limit), max_limit))
+        self.queue_limit = queue_limit
+        self.tenant_queue_limit = tenant_queue_limit
+        self.max_wait = max_wait
+        self.tolerance = tolerance
+        self.smoothing = smoothing
+        self.in_flight = 0
+        # (virtual finish, sequence, waiter, tenant); cancelled waiters stay in
+        # the heap until popped, ``_queued`` counts the live ones
+        self._waiters: List[Tuple[float, int, asyncio.Future, Hashable]] = []
+        self._sequence = itertools.count()
+        self._queued = 0
+        self._tenant_queued: Dict[Hashable, int] = {}
+        self._tenant_finish: Dict[Hashable, float] = {}
+        self._virtual_time = 0.0
+        self._short_latency: Optional[float] = None
+        self._long_latency: Optional[float] = None
+        self.queue_wait = 0.0  # EWMA of time admitted jobs spent queued
+        self.admitted = 0
+        self.rejected: Dict[str, int] = {
+            "queue_full": 0,
+            "tenant_queue_full": 0,
+            "timeout": 0,
+        }
+
+    @property
+    def queued(self) -> int:
+        return self._queued
+
+    @asynccontextmanager
+    async def admit(
+        self, tenant: Hashable = None, weight: float = 1.0
+    ) -> AsyncIterator[None]:
+        """Hold one slot for the duration of the block, or raise 503"""
+        await self._acquire(tenant, weight)
+        started = time.monotonic()
+        completed = False
+        try:
+            yield
+            completed = True
+        finally:
+            self._release(time.monotonic() - started, completed)
+
+    async def _acquire(self, tenant: Hashable, weight: float) -> None:
+        if self.in_flight < int(self.limit) and not self._queued:
+            self.in_flight += 1
+            self._admitted(0.0)
+            return
+        if self._queued >= self.queue_limit:
+            self._reject("queue_full")
+        tenant_queued = self._tenant_queued.get(tenant, 0)
+        if tenant_queued >= math.ceil(self.tenant_queue_limit * weight):
+            self._reject("tenant_queue_full")
+
+        finish = (
+            max(self._virtual_time, self._tenant_finish.get(tenant, 0.0)) + 1 / weight
+        )
+        self._tenant_finish[tenant] = finish
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (finish, next(self._sequence), waiter, tenant))
+        self._queued += 1
+        self._tenant_queued[tenant] = tenant_queued + 1
+        enqueued = time.monotonic()
+        try:
+            await asyncio.wait({waiter}, timeout=self.max_wait)
+        except BaseException:
+            # Cancelled (client went away): give back a slot handed to us
+            self._abandon(waiter, tenant)
+            raise
+        if not waiter.done():
+            self._abandon(waiter, tenant)
+            self._reject("timeout")
+        self._admitted(time.monotonic() - enqueued)
+
+    def _abandon(self, waiter: asyncio.Future, tenant: Hashable) -> None:
+        if waiter.done() and not waiter.cancelled():
+            self.in_flight -= 1
+            self._wake()
+        else:
+            # Left in the heap; _wake skips it
+            waiter.cancel()
+            self._dequeued(tenant)
+
+    def _dequeued(self, tenant: Hashable) -> None:
+        self._queued -= 1
+        remaining = self._tenant_queued[tenant] - 1
+        if remaining:
+            self._tenant_queued[tenant] = remaining
+        else:
+            del self._tenant_queued[tenant]
+            # An idle tenant's finish time only matters while it is ahead of
+            # the virtual clock
+            if self._tenant_finish.get(tenant, 0.0) <= self._virtual_time:
+                self._tenant_finish.pop(tenant, None)
+
+    def _admitted(self, waited: float) -> None:
+        self.admitted += 1
+        self.queue_wait += (waited - self.queue_wait) * 0.1
+
+    def _reject(self, reason: str) -> None:
+        self.rejected[reason] += 1
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="سرور در حال حاضر مشغول است، لطفا چند لحظه دیگر تلاش کنید",
+            headers={"Retry-After": str(self.retry_after())},
+        )
+
+    def retry_after(self) -> int:
+        """Seconds until the current queue should have drained"""
+        latency = self._short_latency or 1.0
+        return max(1, math.ceil((self._queued + 1) * latency / max(self.limit, 1)))
+
+    def _release(self, latency: float, completed: bool) -> None:
+        self.in_flight -= 1
+        # Failed jobs often return early; their latency says nothing about load
+        if completed:
+            self._update_limit(latency)
+        self._wake()
+
+    def _wake(self) -> None:
+        while self._waiters and self.in_flight < int(self.limit):
+            finish, _, waiter, tenant = heapq.heappop(self._waiters)
+            if waiter.done():
+                continue
+            self._virtual_time = max(self._virtual_time, finish)
+            self._dequeued(tenant)
+            self.in_flight += 1
+            waiter.set_result(None)
+
+    def _update_limit(self, latency: float) -> None:
+        if self._short_latency is None or self._long_latency is None:
+            self._short_latency = self._long_latency = latency
+            return
+        self._short_latency += (latency - self._short_latency) * 0.1
+        # The baseline follows improvements at once but creeps up only slowly,
+        # so sustained overload cannot become the new normal
+        if latency < self._long_latency:
+            self._long_latency = latency
+        else:
+            self._long_latency += (latency - self._long_latency) * 0.002
+
+        gradient = max(
+            0.5,
+            min(1.0, self.tolerance * self._long_latency / self._short_latency),
+        )
+        # Only grow when latency is fine and the limit is actually in use
+        in_use = self.in_flight + 1 >= self.limit / 2
+        headroom = math.sqrt(self.limit) if gradient == 1.0 and in_use else 0.0
+        target = self.limit * gradient + headroom
+        limit = self.limit * (1 - self.smoothing) + target * self.smoothing
+        self.limit = min(max(limit, self.min_limit), self.max_limit)
+
+    def stats(self) -> dict:
+        return {
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "queued": self._queued,
+            "queue_limit": self.queue_limit,
+            "tenants_queued": len(self._tenant_queued),
+            "queue_wait_ms": round(self.queue_wait * 1000, 1),
+            "latency_short_ms": round((self._short_latency or 0) * 1000, 1),
+            "latency_long_ms": round((self._long_latency or 0) * 1000, 1),
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+        }
+
+    def reset(self) -> None:
+        """Forget in-flight jobs and waiters (e.g. in a forked worker)"""
+        self.in_flight = 0
+        self._waiters.clear()
+        self._queued = 0
+        self._tenant_queued.clear()
+        self._tenant_finish.clear()
+        self._virtual_time = 0.0
@@ -0,0 +1,124 @@
+import os
+import time
+from typing import Dict, Optional
+
+from sqlalchemy import event, exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, Pool
+
+
+class PoolMetrics:
+    """
+    آمار زنده‌ی connection pool برای تعیین اندازه‌ی مناسب آن
+
+    Counters are only touched from the event loop thread (SQLAlchemy's
+    greenlets run on it), so plain attribute updates are enough.
+    """
+
+    def __init__(self) -> None:
+        self.reset()
+
+    def reset(self) -> None:
+        self.checkouts = 0
+        self.checkins = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.slow_waits = 0
+        self.overflow_in_use = 0
+        self.overflow_peak = 0
+        self.checked_out_peak = 0
+
+    def record_wait(self, seconds: float, slow_threshold: float = 0.01) -> None:
+        self.wait_seconds_total += seconds
+        if seconds > self.wait_seconds_max:
+            self.wait_seconds_max = seconds
+        if seconds >= slow_threshold:
+            self.slow_waits += 1
+
+    def snapshot(self, pool: Optional[Pool] = None) -> Dict[str, float]:
+        data: Dict[str, float] = {
+            "pid": os.getpid(),
+            "checkouts": self.checkouts,
+            "checkins": self.checkins,
+            "connects": self.connects,
+            "invalidations": self.invalidations,
+            "timeouts": self.timeouts,
+            "wait_seconds_total": round(self.wait_seconds_total, 6),
+            "wait_seconds_avg": (
+                round(self.wait_seconds_total / self.checkouts, 6)
+                if self.checkouts
+                else 0.0
+            ),
+            "wait_seconds_max": round(self.wait_seconds_max, 6),
+            "slow_waits": self.slow_waits,
+            "overflow_peak": self.overflow_peak,
+            "checked_out_peak": self.checked_out_peak,
+        }
+        if isinstance(pool, AsyncAdaptedQueuePool):
+            data.update(
+                {
+                    "size": pool.size(),
+                    "checked_in": pool.checkedin(),
+                    "checked_out": pool.checkedout(),
+                    "overflow": max(pool.overflow(), 0),
+                    "max_overflow": pool._max_overflow,
+                    "timeout": pool.timeout(),
+                }
+            )
+        return data
+
+
+class InstrumentedAsyncQueuePool(AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool that records how long each checkout waited"""
+
+    metrics: PoolMetrics
+
+    def recreate(self) -> "InstrumentedAsyncQueuePool":
+        # engine.dispose() swaps in a fresh pool; keep counting into the same metrics
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            self.metrics.timeouts += 1
+            raise
+        finally:
+            self.metrics.record_wait(time.perf_counter() - start)
+
+        metrics = self.metrics
+        checked_out = self.checkedout()
+        if checked_out > metrics.checked_out_peak:
+            metrics.checked_out_peak = checked_out
+        overflow = max(self.overflow(), 0)
+        metrics.overflow_in_use = overflow
+        if overflow > metrics.overflow_peak:
+            metrics.overflow_peak = overflow
+        return connection
+
+
+def instrument_pool(pool: Pool, metrics: PoolMetrics) -> None:
+    """Attach checkout/checkin counters to ``pool``"""
+    if isinstance(pool, InstrumentedAsyncQueuePool):
+        pool.metrics = metrics
+
+    @event.listens_for(pool, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        metrics.connects += 1
+
+    @event.listens_for(pool, "checkout")
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        metrics.checkouts += 1
+
+    @event.listens_for(pool, "checkin")
+    def _on_checkin(dbapi_connection, connection_record):
+        metrics.checkins += 1
+
+    @event.listens_for(pool, "invalidate")
+    def _on_invalidate(dbapi_connection, connection_record, exception):
+        metrics.invalidations += 1
@@ -0,0 +1,217 @@
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional
+
+import sqlalchemy as sa
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.dml import UpdateBase
+
+logger = logging.getLogger(__name__)
+
+
+class ReplicaSet:
+    """
+    مجموعه‌ی replicaهای فقط‌خواندنی با انتخاب round-robin
+
+    A replica that fails a query or a health check is skipped for
+    ``retry_after`` seconds, or until the health check sees it answer again.
+    """
+
+    def __init__(
+        self,
+        engines: List[AsyncEngine],
+        retry_after: float = 30.0,
+        check_interval: float = 5.0,
+        check_timeout: float = 2.0,
+    ):
+        self.engines = engines
+        self.retry_after = retry_after
+        self.check_interval = check_interval
+        self.check_timeout = check_timeout
+        self._by_sync_engine: Dict[Engine, int] = {
+            e.sync_engine: i for i, e in enumerate(engines)
+        }
+        self._down_until = [0.0] * len(engines)
+        self._next = 0
+        self._task: Optional[asyncio.Task] = None
+        self.routed = [0] * len(engines)
+        self.failures = [0] * len(engines)
+        self.fallbacks = 0
+
+        for replica in engines:
+            event.listen(replica.sync_engine, "handle_error", self._on_error)
+
+    def __len__(self) -> int:
+        return len(self.engines)
+
+    def choose(self) -> Optional[Engine]:
+        """Next healthy replica's sync engine, or None if all are down"""
+        now = time.monotonic()
+        for _ in range(len(self.engines)):
+            index = self._next
+            self._next = (index + 1) % len(self.engines)
+            if self._down_until[index] <= now:
+                self.routed[index] += 1
+                return self.engines[index].sync_engine
+        return None
+
+    def is_replica(self, bind) -> bool:
+        return bind in self._by_sync_engine
+
+    def mark_down(self, bind: Engine, reason: object = None) -> None:
+        index = self._by_sync_engine.get(bind)
+        if index is None:
+            return
+        if self._down_until[index] <= time.monotonic():
+            logger.warning(f"Read replica {bind.url!r} marked down: {reason}")
+        self.failures[index] += 1
+        self._down_until[index] = time.monotonic() + self.retry_after
+
+    def mark_up(self, bind: Engine) -> None:
+        index = self._by_sync_engine.get(bind)
+        if index is not None and self._down_until[index]:
+            logger.info(f"Read replica {bind.url!r} is back")
+            self._down_until[index] = 0.0
+
+    def _on_error(self, context) -> None:
+        if context.is_disconnect and context.engine is not None:
+            self.mark_down(context.engine, context.original_exception)
+
+    async def check(self) -> None:
+        for replica in self.engines:
+            try:
+                async with replica.connect() as conn:
+                    await asyncio.wait_for(
+                        conn.execute(sa.text("SELECT 1")), self.check_timeout
+                    )
+                self.mark_up(replica.sync_engine)
+            except Exception as e:
+                self.mark_down(replica.sync_engine, e)
+
+    async def _run_health_checks(self) -> None:
+        while True:
+            await self.check()
+            await asyncio.sleep(self.check_interval)
+
+    def start(self) -> None:
+        if self.engines and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(
+                self._run_health_checks()
+            )
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for replica in self.engines:
+            await replica.dispose()
+
+    def stats(self) -> List[dict]:
+        now = time.monotonic()
+        return [
+            {
+                "url": replica.url.render_as_string(hide_password=True),
+                "healthy": self._down_until[i] <= now,
+                "routed": self.routed[i],
+                "failures": self.failures[i],
+            }
+            for i, replica in enumerate(self.engines)
+        ]
+
+
+class RoutingSession(Session):
+    """
+    Sends reads to a replica and everything else to the primary (``self.bind``).
+
+    Once a session has written (flush or DML) every later statement in it goes
+    to the primary, so a request always reads its own writes. Sessions can opt
+    out entirely with ``use_primary(session)``.
+    """
+
+    replicas: Optional[ReplicaSet] = None
+
+    def get_bind(self, mapper=None, *, clause=None, bind=None, **kw):
+        if bind is not None:
+            return bind
+        replicas = self.replicas
+        if not replicas:
+            return super().get_bind(mapper, clause=clause, **kw)
+
+        primary = self.bind
+        if self._flushing or isinstance(clause, UpdateBase):
+            self.info["wrote"] = True
+            return primary
+        if self.info.get("wrote") or self.info.get("use_primary"):
+            return primary
+        # Only plain SELECTs are safe on a replica; text() and FOR UPDATE are not
+        if not isinstance(clause, sa.Select) or clause._for_update_arg is not None:
+            return primary
+        return replicas.choose() or primary
+
+
+def use_primary(session) -> None:
+    """Pin every following statement of ``session`` to the primary"""
+    session.info["use_primary"] = True
+
+
+def _is_unavailable(error: exc.DBAPIError) -> bool:
+    return error.connection_invalidated or isinstance(
+        error, (exc.OperationalError, exc.InterfaceError)
+    )
+
+
+def _release_connection(session: Session, bind: Engine) -> None:
+    """
+    Drop ``bind``'s connection from the session's transaction.
+
+    A replica that disconnects mid-session leaves an invalidated connection
+    in the transaction, and commit() would fail on it with
+    PendingRollbackError after the read already succeeded on the primary.
+    Nothing was written through a replica, so its transaction is rolled back
+    and closed.
+    """
+    transaction = session._transaction
+    while transaction is not None:
+        entry = transaction._connections.pop(bind, None)
+        if entry is not None:
+            conn, trans, _, autoclose = entry
+            transaction._connections.pop(conn, None)
+            if transaction._parent is None:
+                trans.rollback()
+                if autoclose:
+                    conn.close()
+        transaction = transaction._parent
+
+
+@event.listens_for(RoutingSession, "do_orm_execute")
+def _read_with_fallback(orm_execute_state):
+    """Retry a failed replica read on the primary instead of failing the request"""
+    session = orm_execute_state.session
+    replicas = session.replicas
+    if (
+        not replicas
+        or not orm_execute_state.is_select
+        or "bind" in orm_execute_state.bind_arguments
+    ):
+        return None
+
+    target = session.get_bind(clause=orm_execute_state.statement)
+    if not replicas.is_replica(target):
+        return None
+    try:
+        return orm_execute_state.invoke_statement(bind_arguments={"bind": target})
+    except exc.DBAPIError as e:
+        if not _is_unavailable(e):
+            raise
+        replicas.mark_down(target, e)
+        replicas.fallbacks += 1
+        _release_connection(session, target)
+        return orm_execute_state.invoke_statement(bind_arguments={"bind": session.bind})
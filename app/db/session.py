@@ -1,22 +1,223 @@
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
-from sqlalchemy.orm import declarative_base
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    create_async_engine,
+    async_sessionmaker,
+)
+from sqlalchemy import URL, event, make_url
+from sqlalchemy.exc import DBAPIError
+import sqlalchemy as sa
+from sqlalchemy.orm import Session, declarative_base
 from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Awaitable, Callable, Optional
 import os
+import logging
+import random
 import asyncpg
 import asyncio
 from app.config import Settings, get_settings
+from app.db.pool_metrics import InstrumentedAsyncQueuePool, PoolMetrics, instrument_pool
+from app.db.routing import ReplicaSet, RoutingSession
+from app.tracing import tracer
 
 settings = get_settings()
+sql_logger = logging.getLogger("app.db.sql")
+
+
+def database_url(settings: Settings, host: Optional[str] = None) -> URL:
+    if settings.DATABASE_URL:
+        return make_url(settings.DATABASE_URL)
+    return URL.create(
+        "postgresql+asyncpg",
+        username=settings.POSTGRES_USER,
+        password=settings.POSTGRES_PASSWORD,
+        host=host or settings.POSTGRES_HOST,
+        port=settings.POSTGRES_PORT,
+        database=settings.POSTGRES_DB,
+        # SQLAlchemy-side cache of asyncpg prepared statements per connection
+        query={
+            "prepared_statement_cache_size": str(
+                settings.DB_PREPARED_STATEMENT_CACHE_SIZE
+            )
+        },
+    )
+
+
+def is_sqlite_file(url: URL) -> bool:
+    return url.get_backend_name() == "sqlite" and url.database not in (
+        None,
+        "",
+        ":memory:",
+    )
+
+
+def engine_options(settings: Settings, url: URL, readonly: bool = False) -> dict:
+    """Pool profile shared by every engine the app creates"""
+    if url.get_backend_name() == "sqlite":
+        # SQLite allows one writer at a time: a single pooled connection makes
+        # writers queue in the pool instead of failing with "database is locked"
+        return {
+            "poolclass": InstrumentedAsyncQueuePool,
+            "pool_size": settings.DB_SQLITE_READERS if readonly else 1,
+            "max_overflow": 0,
+            "pool_timeout": settings.DB_POOL_TIMEOUT,
+            "pool_recycle": -1,
+            "pool_pre_ping": False,
+            "echo": False,
+        }
+    options = {
+        "poolclass": InstrumentedAsyncQueuePool,
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+        # echo=True logs every statement synchronously; see _sample_sql_echo
+        "echo": False,
+    }
+    if url.drivername == "postgresql+asyncpg":
+        options["connect_args"] = {
+            "statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE
+        }
+    return options
+
+
+# ─────────────────────────────
+# 📊 شمارش اتصال‌ها به ازای هر درخواست
+# ─────────────────────────────
+class RequestDbStats:
+    """Pool checkouts and statements issued while serving one request"""
+
+    __slots__ = ("checkouts", "queries")
+
+    def __init__(self) -> None:
+        self.checkouts = 0
+        self.queries = 0
+
+
+_request_db_stats: ContextVar[Optional[RequestDbStats]] = ContextVar(
+    "request_db_stats", default=None
+)
+
+
+def start_request_db_stats() -> RequestDbStats:
+    """Begin counting for the current request (called from the HTTP middleware)"""
+    stats = RequestDbStats()
+    _request_db_stats.set(stats)
+    return stats
+
+
+def _count_checkout(dbapi_connection, connection_record, connection_proxy):
+    stats = _request_db_stats.get()
+    if stats is not None:
+        stats.checkouts += 1
+
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    stats = _request_db_stats.get()
+    if stats is not None:
+        stats.queries += 1
+
+
+def _sample_sql_echo(conn, cursor, statement, parameters, context, executemany):
+    # برای لاگ‌گیری کوئری‌ها، فقط درصدی از آن‌ها ثبت می‌شود
+    if random.random() < settings.DB_ECHO_SAMPLE_RATE:
+        sql_logger.info("%s %r", statement, parameters)
+
+
+def sqlite_pragmas(readonly: bool) -> Callable:
+    """Connect listener applying the embedded profile's pragmas"""
+    pragmas = [
+        # WAL: readers never block the writer and the writer never blocks them
+        ("journal_mode", "WAL"),
+        ("synchronous", settings.DB_SQLITE_SYNCHRONOUS),
+        ("mmap_size", settings.DB_SQLITE_MMAP_SIZE),
+        ("busy_timeout", settings.DB_SQLITE_BUSY_TIMEOUT_MS),
+        ("wal_autocheckpoint", settings.DB_SQLITE_WAL_AUTOCHECKPOINT),
+        ("temp_store", "MEMORY"),
+        ("foreign_keys", "ON"),
+    ]
+    if readonly:
+        # journal_mode is persisted in the file; only the writer sets it
+        pragmas = pragmas[1:] + [("query_only", "ON")]
+
+    def apply(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas:
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+    return apply
+
+
+def create_engine_for(
+    url: URL, metrics: PoolMetrics, readonly: bool = False
+) -> AsyncEngine:
+    """Create an engine with the shared pool profile and instrumentation"""
+    new_engine = create_async_engine(url, **engine_options(settings, url, readonly))
+    if url.get_backend_name() == "sqlite":
+        event.listen(new_engine.sync_engine, "connect", sqlite_pragmas(readonly))
+    instrument_pool(new_engine.sync_engine.pool, metrics)
+    event.listen(new_engine.sync_engine, "checkout", _count_checkout)
+    event.listen(new_engine.sync_engine, "before_cursor_execute", _count_query)
+    if settings.DB_ECHO:
+        event.listen(new_engine.sync_engine, "before_cursor_execute", _sample_sql_echo)
+    if tracer.enabled:
+        event.listen(
+            new_engine.sync_engine,
+            "before_cursor_execute",
+            tracer.before_cursor_execute,
+        )
+        event.listen(
+            new_engine.sync_engine, "after_cursor_execute", tracer.after_cursor_execute
+        )
+    return new_engine
+
+
+def replica_url(dsn: str) -> URL:
+    url = make_url(dsn)
+    if url.drivername == "postgresql+asyncpg":
+        url = url.update_query_dict(
+            {
+                "prepared_statement_cache_size": str(
+                    settings.DB_PREPARED_STATEMENT_CACHE_SIZE
+                )
+            }
+        )
+    return url
+
 
 # ساخت engine
-engine = create_async_engine(
-    f"postgresql+asyncpg://{settings.POSTGRES_USER}:{settings.POSTGRES_PASSWORD}@{settings.POSTGRES_HOST}:{settings.POSTGRES_PORT}/{settings.POSTGRES_DB}",
-    echo=True,  # برای لاگ‌گیری کوئری‌ها
+pool_metrics = PoolMetrics()
+primary_url = database_url(settings)
+engine = create_engine_for(primary_url, pool_metrics)
+
+# replicaهای فقط‌خواندنی (اختیاری)
+replica_urls = [replica_url(dsn) for dsn in settings.replica_dsns]
+readonly_replicas = False
+if not replica_urls and is_sqlite_file(primary_url):
+    # Embedded profile: reads go to a read-only pool on the same WAL file,
+    # routed exactly like replica reads (and always up to date)
+    replica_urls = [primary_url]
+    readonly_replicas = True
+replica_pool_metrics = [PoolMetrics() for _ in replica_urls]
+replicas = ReplicaSet(
+    [
+        create_engine_for(url, metrics, readonly=readonly_replicas)
+        for url, metrics in zip(replica_urls, replica_pool_metrics)
+    ],
+    retry_after=settings.DB_REPLICA_RETRY_AFTER,
+    check_interval=settings.DB_REPLICA_CHECK_INTERVAL,
 )
+RoutingSession.replicas = replicas
 
 # ساخت session factory
 async_session = async_sessionmaker(
-    bind=engine, class_=AsyncSession, expire_on_commit=False
+    bind=engine,
+    class_=AsyncSession,
+    sync_session_class=RoutingSession,
+    expire_on_commit=False,
 )
 
 # ─────────────────────────────
@@ -25,11 +226,29 @@ async_session = async_sessionmaker(
 Base = declarative_base()
 
 
+@event.listens_for(Session, "after_flush")
+def _mark_flush_write(session, flush_context):
+    session.info["pending_writes"] = True
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _mark_dml_write(orm_execute_state):
+    if not orm_execute_state.is_select:
+        orm_execute_state.session.info["pending_writes"] = True
+
+
+@event.listens_for(Session, "after_commit")
+@event.listens_for(Session, "after_rollback")
+def _clear_pending_writes(session):
+    session.info["pending_writes"] = False
+
+
 # ─────────────────────────────
 # ⛓️ Dependency برای FastAPI
 # ─────────────────────────────
 @asynccontextmanager
 async def get_db():
+    """Standalone session for code running outside a request (startup, scripts)"""
     async with async_session() as session:
         try:
             yield session
@@ -37,8 +256,81 @@ async def get_db():
             await session.close()
 
 
+async def get_session() -> AsyncIterator[AsyncSession]:
+    """
+    Request-scoped unit of work shared by every service call in a request.
+    AsyncSession only checks out a connection on first use, so requests that
+    never touch the database never take one from the pool.
+    Commits once when the handler succeeds, rolls back otherwise.
+    """
+    async with async_session() as session:
+        try:
+            yield session
+            await session.commit()
+        except Exception:
+            await session.rollback()
+            raise
+        for callback in session.info.pop("on_commit", []):
+            await callback()
+
+
+def on_commit(session: AsyncSession, callback: Callable[[], Awaitable[None]]) -> None:
+    """Run ``callback`` after the request-scoped transaction has committed"""
+    session.info.setdefault("on_commit", []).append(callback)
+
+
+async def release_connection(session: AsyncSession) -> None:
+    """
+    Return the pooled connection early if the session has only read so far.
+    Useful before slow non-DB work (bcrypt, image processing); the session
+    stays usable and checks out a new connection on its next query.
+    """
+    if session.in_transaction() and not session.info.get("pending_writes"):
+        await session.commit()
+
+
+# Latest revision in migrations/versions; bump together with new migrations
+SCHEMA_REVISION = "0002_hot_path_indexes"
+
+
+async def check_schema_version() -> str:
+    """
+    Make sure the database was migrated to SCHEMA_REVISION (one cheap query).
+    Schema changes are applied with `alembic upgrade head`, never at startup.
+    """
+    try:
+        async with engine.connect() as conn:
+            result = await conn.execute(
+                sa.text("SELECT version_num FROM alembic_version")
+            )
+            version = result.scalar()
+    except DBAPIError:
+        version = None
+
+    if version != SCHEMA_REVISION:
+        raise RuntimeError(
+            f"Database schema is at {version!r}, expected {SCHEMA_REVISION!r}; "
+            "run `alembic upgrade head` (or `alembic stamp 0001_initial_schema` "
+            "first on databases created by the old startup create_all)"
+        )
+    return version
+
+
+async def ping_database() -> None:
+    """One round trip to the primary; also opens the first pooled connection"""
+    async with engine.connect() as conn:
+        await conn.execute(sa.text("SELECT 1"))
+
+
 async def init_db():
     """Create database if it doesn't exist"""
+    if engine.dialect.name != "postgresql":
+        # SQLite creates the file on first connect; make sure its directory exists
+        if is_sqlite_file(engine.url):
+            os.makedirs(
+                os.path.dirname(os.path.abspath(engine.url.database)), exist_ok=True
+            )
+        return
     try:
         # Connect to postgres server
         sys_conn = await asyncpg.connect(
@@ -1,28 +1,187 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from typing import Optional
+import logging
+import time
+
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from app.routers import auth, image
-from app.db.session import engine
-from app.models import user
-
-# Create database tables
-user.Base.metadata.create_all(bind=engine)
-
-app = FastAPI(title="Face Detection API")
-
-# Configure CORS
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+from fastapi.responses import JSONResponse
+
+from app.config import Settings, get_settings
+from app.db.session import (
+    check_schema_version,
+    create_tables,
+    engine,
+    init_db,
+    ping_database,
+    replicas,
+    start_request_db_stats,
+)
+from app.profiling import ProfilingMiddleware
+from app.resources import ResourceRegistry
+from app.metrics import (
+    http_in_flight,
+    http_request_duration,
+    http_requests,
+    route_label,
 )
+from app.routers import auth, user, image, internal, metrics
+from app.services import cv_loader
+from app.services.user_cache import user_cache
+from app.tracing import tracer
+from app.utils.log_config import AccessLog, setup_logging
+from app.services.image_jobs import image_jobs
+from app.services.image_memory import image_memory
+from app.utils.security import password_hasher
+from app.utils.token_cache import token_cache
+
+logger = logging.getLogger(__name__)
+
+
+def build_resources(settings: Settings) -> ResourceRegistry:
+    """
+    منابع برنامه به ترتیب راه‌اندازی؛ بستن به ترتیب معکوس انجام می‌شود
+    """
+    resources = ResourceRegistry()
+
+    # First in, last out: records logged during shutdown are still written
+    log_listener = setup_logging(settings)
+    resources.add("logging", start=log_listener.start, stop=log_listener.stop)
+
+    async def start_database():
+        if settings.DB_AUTO_CREATE:
+            # First check and create database if it doesn't exist
+            await init_db()
+            await create_tables()
+            logger.info("Database and tables initialized successfully")
+        else:
+            version = await check_schema_version()
+            logger.info(f"Database schema at revision {version}")
+
+    resources.add(
+        "database", start=start_database, warm_up=ping_database, stop=engine.dispose
+    )
+    resources.add("replicas", start=replicas.start, stop=replicas.stop)
+    resources.add("user_cache", start=user_cache.start, stop=user_cache.stop)
+    resources.add("token_cache", stop=token_cache.clear)
+    resources.add("tracing", start=tracer.start, stop=tracer.stop)
+    if settings.METRICS_ENABLED:
+        resources.add(
+            "metrics", start=metrics.exporter.start, stop=metrics.exporter.stop
+        )
+
+    async def warm_up_password_hasher():
+        # First bcrypt call also pays for passlib's backend detection
+        await password_hasher.hash("warm-up")
+
+    resources.add(
+        "password_hasher",
+        warm_up=warm_up_password_hasher,
+        stop=password_hasher.shutdown,
+    )
+    resources.add("image_jobs", stop=image_jobs.shutdown)
+    resources.add("image_memory", start=image_memory.start, stop=image_memory.stop)
+    resources.add(
+        "cv_models",
+        start=None if settings.CV_LAZY_LOAD else cv_loader.preload,
+        warm_up=cv_loader.warm_up,
+        stop=cv_loader.close,
+    )
+    return resources
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    resources: ResourceRegistry = app.state.resources
+    try:
+        await resources.startup(warm_up=app.state.settings.WARM_UP_ON_STARTUP)
+    except Exception as e:
+        logger.error(f"Error initializing resources: {e}")
+        await resources.shutdown()
+        raise
+    logger.info("Resources ready", extra={"resources": resources.status()})
+    yield
+    await resources.shutdown()
+
+
+def create_app(settings: Optional[Settings] = None) -> FastAPI:
+    """
+    ساخت برنامه FastAPI؛ همه منابع در lifespan مدیریت می‌شوند
+    """
+    settings = settings or get_settings()
+    app = FastAPI(title="Face Detection API", lifespan=lifespan)
+    app.state.settings = settings
+    app.state.resources = build_resources(settings)
+
+    # Innermost, so it runs in the endpoint's task (see app.profiling)
+    app.add_middleware(ProfilingMiddleware, settings=settings)
+
+    # تنظیمات CORS
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],  # یا دامنه‌های مشخص
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
+    access_log = AccessLog.from_settings(settings)
+
+    # Middleware برای ثبت درخواست‌ها و خطاها
+    @app.middleware("http")
+    async def log_requests(request: Request, call_next):
+        start_time = time.perf_counter()
+        db_stats = start_request_db_stats()
+        http_in_flight.inc()
+        status_code = 500
+        try:
+            with tracer.start_trace(
+                f"{request.method} {request.url.path}", method=request.method
+            ) as root:
+                response = await call_next(request)
+                status_code = response.status_code
+                if root is not None:
+                    root.attrs["status"] = status_code
+                    root.attrs["route"] = route_label(request.scope)
+        except Exception as e:
+            access_log.log(
+                request, 500, time.perf_counter() - start_time, db_stats, error=e
+            )
+            raise
+        finally:
+            duration = time.perf_counter() - start_time
+            http_in_flight.dec()
+            route = route_label(request.scope)
+            http_requests.inc(
+                method=request.method, route=route, status=str(status_code)
+            )
+            http_request_duration.observe(duration, method=request.method, route=route)
+        access_log.log(request, status_code, duration, db_stats)
+        return response
+
+    # ثبت روترها
+    app.include_router(auth.router, prefix="/auth", tags=["authentication"])
+    app.include_router(user.router, prefix="/user", tags=["User"])
+    app.include_router(image.router, prefix="/image", tags=["Image Processing"])
+    if settings.INTERNAL_ENDPOINTS_ENABLED:
+        app.include_router(internal.router, prefix="/internal", tags=["Internal"])
+    if settings.METRICS_ENABLED:
+        app.include_router(metrics.router, tags=["Internal"])
 
-# Include routers
-app.include_router(auth.router, prefix="/auth", tags=["Authentication"])
-app.include_router(image.router, prefix="/image", tags=["Image Processing"])
+    @app.get("/")
+    async def root():
+        return {"message": "Welcome to Face Detection API"}
 
+    @app.get("/ready")
+    async def ready(request: Request):
+        """
+        آمادگی برای دریافت ترافیک (برای readiness probe)
+        503 until every resource has started, and warmed up if requested.
+        """
+        resources: ResourceRegistry = request.app.state.resources
+        return JSONResponse(
+            status_code=200 if resources.ready else 503,
+            content={"ready": resources.ready, "resources": resources.status()},
+        )
 
-@app.get("/")
-async def root():
-    return {"message": "Welcome to Face Detection API"}
+    return app
@@ -0,0 +1,326 @@
+"""
+شمارنده‌ها و هیستوگرام‌های درون‌برنامه‌ای با خروجی Prometheus
+
+Metrics are only updated from the event loop thread, so the hot path is a
+dict lookup and an add, with no locks. Values are kept under tuple label
+keys and only turned into label strings when a snapshot is taken.
+
+With several workers each one periodically writes its snapshot to
+``<METRICS_MULTIPROC_DIR>/<pid>.json``; /metrics merges all files. Counters
+and histograms of exited workers are kept so totals never go backwards,
+their gauges are dropped.
+"""
+
+import asyncio
+import json
+import logging
+import os
+from bisect import bisect_left
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+# Seconds; tuned for an API whose slowest path (bcrypt, face checks) is ~0.5s
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Bytes, 1 MiB to 2 GiB; image jobs peak at tens to hundreds of MiB
+MEMORY_BUCKETS = tuple(float(2**exponent) for exponent in range(20, 32))
+
+
+def _escape(value: object) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_string(key: LabelKey) -> str:
+    return ",".join(f'{name}="{_escape(value)}"' for name, value in key)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self.values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = tuple(labels.items())
+        self.values[key] = self.values.get(key, 0.0) + amount
+
+    def set(self, value: float, **labels) -> None:
+        """For collectors mirroring a total that is already counted elsewhere"""
+        self.values[tuple(labels.items())] = value
+
+    def samples(self) -> Dict[str, float]:
+        return {_label_string(key): value for key, value in self.values.items()}
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets))
+        # label key -> [count per bucket..., count above the last bucket, sum]
+        self.values: Dict[LabelKey, List[float]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(labels.items())
+        state = self.values.get(key)
+        if state is None:
+            state = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        state[bisect_left(self.buckets, value)] += 1
+        state[-1] += value
+
+    def samples(self) -> Dict[str, List[float]]:
+        return {_label_string(key): list(state) for key, state in self.values.items()}
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self._metrics: Dict[str, object] = {}
+        self._collectors: List[Callable[[], None]] = []
+
+    def counter(self, name: str, documentation: str) -> Counter:
+        return self._register(Counter(name, documentation))
+
+    def gauge(self, name: str, documentation: str) -> Gauge:
+        return self._register(Gauge(name, documentation))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, buckets))
+
+    def _register(self, metric):
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def add_collector(self, collector: Callable[[], None]) -> None:
+        """``collector`` refreshes gauges/counters right before every snapshot"""
+        if collector not in self._collectors:
+            self._collectors.append(collector)
+
+    def snapshot(self) -> dict:
+        for collector in self._collectors:
+            try:
+                collector()
+            except Exception as e:
+                logger.error(f"Metrics collector {collector.__name__} failed: {e}")
+        return {
+            name: {
+                "type": metric.kind,
+                "help": metric.documentation,
+                "buckets": list(getattr(metric, "buckets", ())),
+                "samples": metric.samples(),
+            }
+            for name, metric in self._metrics.items()
+        }
+
+
+def merge_snapshots(snapshots: List[Tuple[dict, bool]]) -> dict:
+    """Sums (snapshot, alive) pairs; gauges only count live processes"""
+    merged: dict = {}
+    for snapshot, alive in snapshots:
+        for name, metric in snapshot.items():
+            if metric["type"] == "gauge" and not alive:
+                continue
+            target = merged.setdefault(
+                name, {**metric, "samples": {}}
+            )  # type/help/buckets from the first process
+            for labels, value in metric["samples"].items():
+                if metric["type"] == "histogram":
+                    current = target["samples"].get(labels)
+                    target["samples"][labels] = (
+                        [a + b for a, b in zip(current, value)] if current else value
+                    )
+                else:
+                    target["samples"][labels] = (
+                        target["samples"].get(labels, 0.0) + value
+                    )
+    return merged
+
+
+def _with_label(labels: str, name: str, value: str) -> str:
+    extra = f'{name}="{value}"'
+    return f"{labels},{extra}" if labels else extra
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(snapshot: dict) -> str:
+    """Prometheus text exposition format 0.0.4"""
+    lines = []
+    for name, metric in sorted(snapshot.items()):
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        for labels, value in sorted(metric["samples"].items()):
+            if metric["type"] != "histogram":
+                braces = f"{{{labels}}}" if labels else ""
+                lines.append(f"{name}{braces} {_number(value)}")
+                continue
+            cumulative = 0
+            bounds = [*metric["buckets"], float("inf")]
+            for bound, count in zip(bounds, value[:-1]):
+                cumulative += count
+                le = _with_label(labels, "le", _number(bound))
+                lines.append(f"{name}_bucket{{{le}}} {cumulative}")
+            braces = f"{{{labels}}}" if labels else ""
+            lines.append(f"{name}_sum{braces} {_number(value[-1])}")
+            lines.append(f"{name}_count{braces} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+def route_label(scope: dict) -> str:
+    """
+    Route template of the matched endpoint, e.g. "/user/export"; the raw path
+    would give every user id its own time series.
+    """
+    route = scope.get("route")
+    template = getattr(route, "path", None)
+    if template is None:
+        return "<unmatched>"
+    # Depending on the FastAPI version route.path may lack the include_router
+    # prefix; put back the leading (literal) segments it does not cover
+    segments = scope["path"].strip("/").split("/")
+    own = len([part for part in template.strip("/").split("/") if part])
+    prefix = segments[: max(len(segments) - own, 0)]
+    if prefix and prefix != [""]:
+        return "/" + "/".join(prefix) + template
+    return template
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class MultiprocessExporter:
+    """
+    هر worker آمار خود را در یک فایل می‌نویسد تا /metrics همه را جمع کند
+    """
+
+    def __init__(
+        self,
+        registry: MetricsRegistry,
+        directory: Optional[str],
+        flush_interval: float = 5.0,
+    ):
+        self.registry = registry
+        self.directory = Path(directory) if directory else None
+        self.flush_interval = flush_interval
+        self._task: Optional[asyncio.Task] = None
+
+    def write(self) -> None:
+        if self.directory is None:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / f"{os.getpid()}.json"
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self.registry.snapshot()))
+        os.replace(tmp, path)
+
+    def collect(self) -> dict:
+        """Merged snapshot of every worker (just this one without a directory)"""
+        if self.directory is None:
+            return self.registry.snapshot()
+        self.write()
+        snapshots = []
+        for path in self.directory.glob("*.json"):
+            try:
+                snapshot = json.loads(path.read_text())
+            except (OSError, ValueError):
+                continue  # a worker is replacing its file right now
+            pid = int(path.stem)
+            snapshots.append((snapshot, pid == os.getpid() or _pid_alive(pid)))
+        return merge_snapshots(snapshots)
+
+    async def _flush_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                self.write()
+            except OSError as e:
+                logger.error(f"Could not write metrics snapshot: {e}")
+
+    def start(self) -> None:
+        if self.directory is not None and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(
+                self._flush_periodically()
+            )
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.directory is not None:
+            self.write()
+
+
+# نمونه سراسری
+metrics = MetricsRegistry()
+
+http_requests = metrics.counter(
+    "http_requests_total", "HTTP requests by method, route template and status"
+)
+http_request_duration = metrics.histogram(
+    "http_request_duration_seconds", "HTTP request latency by method and route"
+)
+http_in_flight = metrics.gauge(
+    "http_requests_in_flight", "HTTP requests currently being served"
+)
+image_bytes = metrics.counter(
+    "image_bytes_processed_total", "Bytes of uploaded images decoded"
+)
+detector_invocations = metrics.counter(
+    "detector_invocations_total", "Face detector / landmark model runs"
+)
+image_memory_estimated = metrics.histogram(
+    "image_memory_estimated_bytes",
+    "Expected peak memory of an image job, from its header",
+    MEMORY_BUCKETS,
+)
+image_memory_peak = metrics.histogram(
+    "image_memory_peak_bytes",
+    "Traced peak memory per image job and stage, an upper bound when jobs "
+    "overlap (IMAGE_MEMORY_TRACKING)",
+    MEMORY_BUCKETS,
+)
+image_memory_over_budget = metrics.counter(
+    "image_memory_over_budget_total",
+    "Images over IMAGE_MEMORY_BUDGET_MB by action (rejected / downscaled)",
+)
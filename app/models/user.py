@@ -1,8 +1,17 @@
 from datetime import datetime
-from sqlalchemy import Column, DateTime, Integer, String, Boolean, Text, ForeignKey
+from sqlalchemy import (
+    Column,
+    DateTime,
+    Integer,
+    String,
+    Boolean,
+    Text,
+    ForeignKey,
+    Index,
+)
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from app.db.session import Base
-from sqlalchemy.sql import func
+from sqlalchemy.sql import func, text
 
 
 class User(Base):
@@ -26,7 +35,7 @@ class User(Base):
     access_token: Mapped[str | None] = mapped_column(String, nullable=True)
     refresh_token: Mapped[str | None] = mapped_column(String, nullable=True)
     token_expires_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
-    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now())
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now)
     updated_at: Mapped[DateTime | None] = mapped_column(
         DateTime(timezone=True), onupdate=func.now(), nullable=True
     )
@@ -34,11 +43,31 @@ class User(Base):
         back_populates="user", cascade="all, delete-orphan"
     )
 
+    # Kept in sync with migrations/versions/0002_hot_path_indexes.py
+    __table_args__ = (
+        Index(
+            "ix_users_refresh_token",
+            "refresh_token",
+            postgresql_where=text("refresh_token IS NOT NULL"),
+            sqlite_where=text("refresh_token IS NOT NULL"),
+        ),
+        Index(
+            "ix_users_access_token",
+            "access_token",
+            postgresql_where=text("access_token IS NOT NULL"),
+            sqlite_where=text("access_token IS NOT NULL"),
+        ),
+    )
+
 
 class UserPhoto(Base):
     __tablename__ = "user_photos"
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     image_path = Column(String, nullable=False)
-    created_at = Column(DateTime, default=datetime.now())
+    created_at = Column(DateTime, default=datetime.now)
     user = relationship("User", back_populates="photos")
+
+    __table_args__ = (
+        Index("ix_user_photos_user_id_created_at", user_id, created_at.desc()),
+    )
@@ -0,0 +1,45 @@
+"""
+بارگذاری مدل‌ها پیش از fork و راه‌اندازی مجدد منابع در هر worker
+
+Used by gunicorn.conf.py. The master imports the app and loads the read-only
+CV models once; workers forked from it share those pages copy-on-write.
+Anything holding sockets or threads (DB pools, executors, FaceMesh graphs)
+is reset in each child and recreated lazily there.
+"""
+
+import gc
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def preload_shared() -> None:
+    """Runs once in the gunicorn master, after the app has been imported"""
+    from app.services import cv_loader
+
+    # Load only: running an inference here would start OpenCV/MediaPipe
+    # worker threads in the master, and those do not survive fork()
+    cv_loader.preload()
+
+    # Move everything allocated so far out of the collector's generations, so
+    # gc passes in the workers do not write to (and un-share) those pages
+    gc.collect()
+    gc.freeze()
+    logger.info(f"Preloaded models, {gc.get_freeze_count()} objects frozen")
+
+
+def reinit_after_fork() -> None:
+    """Runs in every worker right after fork()"""
+    from app.db.session import engine, replicas
+    from app.services import cv_loader
+    from app.services.image_jobs import image_jobs
+    from app.utils.security import password_hasher
+
+    # close=False: the parent still owns those sockets, only forget them here
+    engine.sync_engine.dispose(close=False)
+    for replica in replicas.engines:
+        replica.sync_engine.dispose(close=False)
+
+    password_hasher.reset_after_fork()
+    image_jobs.reset_after_fork()
+    cv_loader.reset_after_fork()
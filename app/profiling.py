@@ -0,0 +1,406 @@
+"""
+پروفایل نمونه‌برداری (sampling profiler) برای یک درخواست، به درخواست ادمین
+
+An admin adds ``X-Profile: 1`` to a request and gets an ``X-Profile-Id``
+response header back. While the request runs, a sampler thread reads
+``sys._current_frames()`` every PROFILING_INTERVAL_MS and keeps the stacks
+of the threads working for that request:
+
+* the event loop thread, but only while the loop is running the request's
+  own task (other requests share the loop and are left out);
+* executor threads (image jobs, bcrypt) while they run a job submitted by
+  the request; callers wrap the job with ``profiler.bind(fn)``.
+
+Nothing is traced or instrumented, so the request pays only for the GIL
+the sampler takes. When the request finishes the samples are written to
+PROFILES_DIR as ``<id>.speedscope.json`` (open in speedscope.app) and
+``<id>.collapsed.txt`` (flamegraph.pl / inferno), one thread per section,
+and served by ``GET /internal/profiles/{id}``.
+
+At most one request per worker is profiled at a time and at most
+PROFILING_MAX_PER_MINUTE per worker; other ``X-Profile`` requests run
+normally with an ``X-Profile-Skipped`` header saying why.
+"""
+
+import asyncio
+import collections
+import functools
+import json
+import logging
+import os
+import re
+import secrets
+import sys
+import threading
+import time
+from contextvars import ContextVar
+from pathlib import Path
+from types import CodeType
+from typing import Callable, Counter, Deque, Dict, List, Optional, Tuple, TypeVar
+
+from starlette.datastructures import Headers
+
+from app.config import Settings, get_settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+PROFILE_ID = re.compile(r"^[0-9]{8}T[0-9]{6}-[0-9]+-[0-9a-f]{8}$")
+FORMATS = {"speedscope": ".speedscope.json", "collapsed": ".collapsed.txt"}
+
+Stack = Tuple[CodeType, ...]
+
+try:
+    # Maps each running loop to the task it is stepping right now
+    from asyncio.tasks import _current_tasks
+except ImportError:  # pragma: no cover - CPython always has it
+    _current_tasks = {}
+
+
+class Profile:
+    def __init__(
+        self, profile_id: str, name: str, task: asyncio.Task, loop_thread: int
+    ):
+        self.profile_id = profile_id
+        self.name = name
+        self.task = task
+        self.loop = task.get_loop()
+        self.loop_thread = loop_thread
+        # Executor threads currently running one of this request's jobs
+        self.threads: Dict[int, str] = {}
+        # Wall time (ms) per thread and stack, root first
+        self.samples: Dict[str, Counter[Stack]] = collections.defaultdict(
+            collections.Counter
+        )
+        self.sample_count = 0
+        self.started = time.perf_counter()
+        self.duration = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _stack(self, frame) -> Stack:
+        codes = []
+        while frame is not None:
+            codes.append(frame.f_code)
+            frame = frame.f_back
+        codes.reverse()
+        return tuple(codes)
+
+    def _sample(self, weight_ms: float) -> None:
+        frames = sys._current_frames()
+        if _current_tasks.get(self.loop) is self.task:
+            frame = frames.get(self.loop_thread)
+            if frame is not None:
+                self.samples["event-loop"][self._stack(frame)] += weight_ms
+        for ident, label in dict(self.threads).items():
+            frame = frames.get(ident)
+            if frame is not None:
+                self.samples[label][self._stack(frame)] += weight_ms
+        self.sample_count += 1
+
+    def _run(
+        self,
+        interval: float,
+        max_seconds: float,
+        directory: Path,
+        written: Callable[[], None],
+    ) -> None:
+        last = time.perf_counter()
+        while not self._stop.wait(interval):
+            now = time.perf_counter()
+            # Weigh by the time actually elapsed; the GIL can delay a tick
+            self._sample((now - last) * 1000)
+            last = now
+            if now - self.started > max_seconds:
+                break
+        self.duration = time.perf_counter() - self.started
+        try:
+            self.write(directory)
+            written()
+        except Exception as e:
+            logger.error(f"Could not write profile {self.profile_id}: {e}")
+
+    def start(
+        self,
+        interval: float,
+        max_seconds: float,
+        directory: Path,
+        written: Callable[[], None],
+    ) -> None:
+        self._thread = threading.Thread(
+            target=self._run,
+            args=(interval, max_seconds, directory, written),
+            name="profiler",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    # ── export ──
+    @staticmethod
+    def _frame_name(code: CodeType) -> str:
+        return getattr(code, "co_qualname", code.co_name)
+
+    def collapsed(self) -> str:
+        lines = []
+        for label, stacks in self.samples.items():
+            for stack, weight in stacks.most_common():
+                names = ";".join(
+                    f"{self._frame_name(code)} ({os.path.basename(code.co_filename)})"
+                    for code in stack
+                )
+                lines.append(f"{label};{names} {max(round(weight), 1)}")
+        return "\n".join(lines) + "\n"
+
+    def speedscope(self) -> dict:
+        frames: List[dict] = []
+        index: Dict[CodeType, int] = {}
+
+        def frame_index(code: CodeType) -> int:
+            if code not in index:
+                index[code] = len(frames)
+                frames.append(
+                    {
+                        "name": self._frame_name(code),
+                        "file": code.co_filename,
+                        "line": code.co_firstlineno,
+                    }
+                )
+            return index[code]
+
+        profiles = []
+        for label, stacks in self.samples.items():
+            samples = [[frame_index(code) for code in stack] for stack in stacks]
+            weights = [round(weight, 3) for weight in stacks.values()]
+            profiles.append(
+                {
+                    "type": "sampled",
+                    "name": label,
+                    "unit": "milliseconds",
+                    "startValue": 0,
+                    "endValue": round(sum(weights), 3),
+                    "samples": samples,
+                    "weights": weights,
+                }
+            )
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": f"{self.name} ({self.duration * 1000:.0f} ms)",
+            "exporter": "app.profiling",
+            "activeProfileIndex": 0,
+            "shared": {"frames": frames},
+            "profiles": profiles,
+        }
+
+    def write(self, directory: Path) -> None:
+        directory.mkdir(parents=True, exist_ok=True)
+        base = directory / self.profile_id
+        # Write then rename, so a reader never sees half a file
+        for fmt, content in (
+            ("speedscope", json.dumps(self.speedscope())),
+            ("collapsed", self.collapsed()),
+        ):
+            path = Path(f"{base}{FORMATS[fmt]}")
+            tmp = path.with_name(path.name + ".tmp")
+            tmp.write_text(content, encoding="utf-8")
+            tmp.replace(path)
+        logger.info(
+            f"Profile {self.profile_id} written",
+            extra={
+                "profile_id": self.profile_id,
+                "samples": self.sample_count,
+                "duration_ms": round(self.duration * 1000, 1),
+            },
+        )
+
+
+_active_profile: ContextVar[Optional[Profile]] = ContextVar(
+    "active_profile", default=None
+)
+
+
+class Profiler:
+    def __init__(
+        self,
+        enabled: bool = True,
+        interval_ms: float = 5.0,
+        max_per_minute: int = 6,
+        max_seconds: float = 60.0,
+        keep: int = 100,
+        directory: str = "profiles",
+    ):
+        self.enabled = enabled
+        self.interval = interval_ms / 1000
+        self.max_per_minute = max_per_minute
+        self.max_seconds = max_seconds
+        self.keep = keep
+        self.directory = Path(directory)
+        self._recent: Deque[float] = collections.deque()
+        self._active: Optional[Profile] = None
+        self.started = 0
+        self.skipped: Dict[str, int] = {"busy": 0, "rate_limited": 0}
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> "Profiler":
+        return cls(
+            enabled=settings.PROFILING_ENABLED,
+            interval_ms=settings.PROFILING_INTERVAL_MS,
+            max_per_minute=settings.PROFILING_MAX_PER_MINUTE,
+            max_seconds=settings.PROFILING_MAX_SECONDS,
+            keep=settings.PROFILING_KEEP,
+            directory=settings.PROFILES_DIR,
+        )
+
+    def _admit(self) -> Optional[str]:
+        """None if a profile may start now, otherwise the reason it may not"""
+        if self._active is not None:
+            return "busy"
+        now = time.monotonic()
+        while self._recent and now - self._recent[0] > 60:
+            self._recent.popleft()
+        if len(self._recent) >= self.max_per_minute:
+            return "rate_limited"
+        self._recent.append(now)
+        return None
+
+    def start(self, name: str) -> Tuple[Optional[Profile], Optional[str]]:
+        """
+        Start profiling the current task (called on the event loop).
+        Returns (profile, None) or (None, reason it was skipped).
+        """
+        reason = self._admit()
+        if reason is not None:
+            self.skipped[reason] += 1
+            return None, reason
+        profile_id = "{}-{}-{}".format(
+            time.strftime("%Y%m%dT%H%M%S"), os.getpid(), secrets.token_hex(4)
+        )
+        profile = Profile(
+            profile_id, name, asyncio.current_task(), threading.get_ident()
+        )
+        self._active = profile
+        self.started += 1
+        _active_profile.set(profile)
+        profile.start(self.interval, self.max_seconds, self.directory, self._prune)
+        return profile, None
+
+    def stop(self, profile: Profile) -> None:
+        profile.stop()
+        if self._active is profile:
+            self._active = None
+
+    def _prune(self) -> None:
+        """Keep the newest ``keep`` profiles (runs on the sampler thread)"""
+        paths = sorted(self.directory.glob("*.speedscope.json"))
+        for path in paths[: max(len(paths) - self.keep, 0)]:
+            profile_id = path.name[: -len(FORMATS["speedscope"])]
+            for suffix in FORMATS.values():
+                self.directory.joinpath(profile_id + suffix).unlink(missing_ok=True)
+
+    def bind(self, fn: Callable[..., T]) -> Callable[..., T]:
+        """
+        Wrap a job about to be handed to an executor so the thread running it
+        is sampled as part of the current request's profile, if any.
+        """
+        profile = _active_profile.get()
+        if profile is None:
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            ident = threading.get_ident()
+            profile.threads[ident] = threading.current_thread().name
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                profile.threads.pop(ident, None)
+
+        return wrapper
+
+    def path_for(self, profile_id: str, fmt: str) -> Optional[Path]:
+        """The stored file for ``profile_id``, or None if there is none (yet)"""
+        if not PROFILE_ID.match(profile_id) or fmt not in FORMATS:
+            return None
+        path = self.directory / f"{profile_id}{FORMATS[fmt]}"
+        return path if path.is_file() else None
+
+    def profile_ids(self) -> List[str]:
+        return sorted(
+            (
+                path.name[: -len(FORMATS["speedscope"])]
+                for path in self.directory.glob("*.speedscope.json")
+            ),
+            reverse=True,
+        )
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "active": self._active.profile_id if self._active else None,
+            "started": self.started,
+            "skipped": dict(self.skipped),
+        }
+
+
+profiler = Profiler.from_settings(get_settings())
+
+
+def _is_admin(authorization: str, settings: Settings) -> bool:
+    # app.utils.security wraps its bcrypt jobs with profiler.bind
+    from app.utils.security import verify_access_token
+
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return False
+    try:
+        claims = verify_access_token(token, settings)
+    except Exception:
+        return False
+    return "admin" in (claims.get("scopes") or ())
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware for ``X-Profile: 1``; added innermost so it runs in the
+    same task as the endpoint (BaseHTTPMiddleware's call_next starts a new one)
+    """
+
+    def __init__(self, app, settings: Optional[Settings] = None):
+        self.app = app
+        self.settings = settings or get_settings()
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or not profiler.enabled
+            or Headers(scope=scope).get("x-profile") != "1"
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        if not _is_admin(Headers(scope=scope).get("authorization", ""), self.settings):
+            header = (b"x-profile-skipped", b"forbidden")
+            profile = None
+        else:
+            profile, reason = profiler.start(f"{scope['method']} {scope['path']}")
+            if profile is None:
+                header = (b"x-profile-skipped", reason.encode())
+            else:
+                header = (b"x-profile-id", profile.profile_id.encode())
+
+        async def send_with_header(message):
+            if message["type"] == "http.response.start":
+                message = {
+                    **message,
+                    "headers": [*message.get("headers", ()), header],
+                }
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_header)
+        finally:
+            if profile is not None:
+                profiler.stop(profile)
@@ -0,0 +1,110 @@
+"""
+رجیستری منابع برنامه که در lifespan راه‌اندازی و بسته می‌شوند
+
+Each resource (DB engine, executors, CV models, caches) registers a start,
+an optional warm-up and a stop callable. They are started in registration
+order and stopped in reverse order, so e.g. the DB engine outlives the cache
+that listens on it.
+"""
+
+import inspect
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+Hook = Callable[[], Union[None, Awaitable[None]]]
+
+
+async def _call(hook: Optional[Hook]) -> None:
+    if hook is None:
+        return
+    result = hook()
+    if inspect.isawaitable(result):
+        await result
+
+
+@dataclass
+class Resource:
+    name: str
+    start: Optional[Hook] = None
+    warm_up: Optional[Hook] = None
+    stop: Optional[Hook] = None
+    started: bool = False
+    warmed: bool = False
+    error: Optional[str] = None
+    timings: Dict[str, float] = field(default_factory=dict)
+
+
+class ResourceRegistry:
+    def __init__(self) -> None:
+        self._resources: List[Resource] = []
+        self.warm_up_requested = False
+
+    def add(
+        self,
+        name: str,
+        start: Optional[Hook] = None,
+        stop: Optional[Hook] = None,
+        warm_up: Optional[Hook] = None,
+    ) -> None:
+        self._resources.append(
+            Resource(name=name, start=start, warm_up=warm_up, stop=stop)
+        )
+
+    async def startup(self, warm_up: bool = False) -> None:
+        """
+        Start every resource; a failing start aborts startup. Warm-up failures
+        are logged and only reported through ``ready``, so a broken model does
+        not take the auth endpoints down with it.
+        """
+        self.warm_up_requested = warm_up
+        for resource in self._resources:
+            began = time.perf_counter()
+            await _call(resource.start)
+            resource.started = True
+            resource.timings["start"] = time.perf_counter() - began
+
+        if not warm_up:
+            return
+        for resource in self._resources:
+            if resource.warm_up is None:
+                continue
+            began = time.perf_counter()
+            try:
+                await _call(resource.warm_up)
+                resource.warmed = True
+            except Exception as e:
+                resource.error = f"{type(e).__name__}: {e}".strip()
+                logger.error(f"Warm-up of {resource.name} failed: {resource.error}")
+            resource.timings["warm_up"] = time.perf_counter() - began
+
+    async def shutdown(self) -> None:
+        for resource in reversed(self._resources):
+            if not resource.started:
+                continue
+            try:
+                await _call(resource.stop)
+            except Exception as e:
+                logger.error(f"Error shutting down {resource.name}: {e}")
+            resource.started = False
+
+    @property
+    def ready(self) -> bool:
+        return all(
+            r.started and (not self.warm_up_requested or r.warm_up is None or r.warmed)
+            for r in self._resources
+        )
+
+    def status(self) -> Dict[str, dict]:
+        return {
+            r.name: {
+                "started": r.started,
+                "warmed": r.warmed,
+                "error": r.error,
+                **{f"{k}_seconds": round(v, 4) for k, v in r.timings.items()},
+            }
+            for r in self._resources
+        }
@@ -1,9 +1,10 @@
 from typing_extensions import Annotated
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from sqlalchemy.orm import Session
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.db.session import get_db
+from app.db.session import get_session
 from app.models.user import User
+from app.services.user_cache import UserSnapshot
 from app.services.auth import (
     refresh_access_token,
     create_access_token,
@@ -24,15 +25,21 @@ from app.schemas.auth import (
 )
 from fastapi.security import OAuth2PasswordRequestForm
 from app.config import Settings
-from app.services.auth import update_user_tokens_in_db, get_user_by_username
-
+from app.utils.fast_json import FastJSONResponse, pick
+from app.utils.http_cache import cache_headers, etag_matches, make_etag, not_modified
+from app.services.auth import get_user_by_username
 
 router = APIRouter()
 
+USER_RESPONSE_FIELDS = tuple(UserResponse.model_fields)
+
 
 @router.post("/token")
-async def login_token(form_data: OAuth2PasswordRequestForm = Depends()):
-    user = await get_user_by_username(form_data.username)
+async def login_token(
+    form_data: OAuth2PasswordRequestForm = Depends(),
+    db: AsyncSession = Depends(get_session),
+):
+    user = await get_user_by_username(form_data.username, db)
     if not user:
         raise HTTPException(status_code=401, detail="Invalid credentials")
     settings = get_settings()
@@ -52,7 +59,7 @@ async def login_token(form_data: OAuth2PasswordRequestForm = Depends()):
 
 @router.post("/refresh", response_model=TokenResponse)
 async def refresh_token_endpoint(
-    refresh_token: str, db: AsyncSession = Depends(get_db)
+    refresh_token: str, db: AsyncSession = Depends(get_session)
 ):
     """
     مسیر دریافت Access Token جدید با Refresh Token
@@ -73,38 +80,29 @@ async def protected_route(current_user: dict = Depends(get_current_user)):
 
 
 @router.post("/register", response_model=dict)
-async def register(user_data: UserCreate, db: AsyncSession = Depends(get_db)) -> dict:
+async def register(
+    user_data: UserCreate, db: AsyncSession = Depends(get_session)
+) -> FastJSONResponse:
     """Register a new user and automatically log them in"""
     # Create the user
     user = await create_user(user_data, db)
 
     # Automatically log in the user
-    tokens = await create_tokens(user)
-    await update_user_tokens_in_db(
-        user, tokens["access_token"], tokens["refresh_token"], tokens.get("expires_at")
-    )
+    tokens = await create_tokens(user, db)
 
     # Return both user information and tokens
-    return {
-        "user": UserResponse(
-            id=user.id,
-            username=user.username,
-            email=user.email,
-            firstname=user.firstname,
-            lastname=user.lastname,
-            is_active=user.is_active,
-        ),
-        "tokens": TokenResponse(**tokens),
-    }
+    return FastJSONResponse(
+        {"user": pick(user, USER_RESPONSE_FIELDS), "tokens": tokens}
+    )
 
 
 @router.post("/login", response_model=TokenResponse)
 async def login(
     user_data: UserLogin,
-    settings: Settings = Depends(get_settings),
-) -> TokenResponse:
+    db: AsyncSession = Depends(get_session),
+) -> FastJSONResponse:
     """Login user and return tokens"""
-    user = await authenticate_user(user_data.username, user_data.password)
+    user = await authenticate_user(user_data.username, user_data.password, db)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -112,24 +110,21 @@ async def login(
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    tokens = await create_tokens(user)
-    await update_user_tokens_in_db(
-        user, tokens["access_token"], tokens["refresh_token"], tokens.get("expires_at")
-    )
+    tokens = await create_tokens(user, db)
 
-    return TokenResponse(**tokens)
+    return FastJSONResponse(tokens)
 
 
 @router.get("/me", response_model=UserResponse)
 async def read_users_me(
-    current_user: User = Depends(get_current_user),
-) -> UserResponse:
-    """Get current user information"""
-    return UserResponse(
-        id=current_user.id,
-        username=current_user.username,
-        email=current_user.email,
-        firstname=current_user.firstname,
-        lastname=current_user.lastname,
-        is_active=current_user.is_active,
-    )
+    request: Request,
+    current_user: UserSnapshot = Depends(get_current_user),
+) -> Response:
+    """Get current user information (supports If-None-Match)"""
+    # The snapshot is already in memory; updated_at alone has only second
+    # resolution on SQLite, so the (few) response fields go in as well
+    body = pick(current_user, USER_RESPONSE_FIELDS)
+    etag = make_etag("me", current_user.updated_at, *body.values())
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    return FastJSONResponse(body, headers=cache_headers(etag))
@@ -1,14 +1,18 @@
 from fastapi import APIRouter, UploadFile, File, Depends, HTTPException
-from app.services.image_quality import image_quality_checker
+from app.services.cv_loader import get_image_quality_checker
+from app.services.image_jobs import JobOwner, image_job_owner
 from app.services.auth import get_current_user
 from app.models.user import User
+from app.services.user_cache import UserSnapshot
 
 router = APIRouter()
 
 
 @router.post("/check-quality")
 async def check_image_quality(
-    image: UploadFile = File(...), current_user: User = Depends(get_current_user)
+    image: UploadFile = File(...),
+    current_user: UserSnapshot = Depends(get_current_user),
+    owner: JobOwner = Depends(image_job_owner),
 ):
     """
     بررسی کیفیت تصویر آپلود شده
@@ -18,7 +22,7 @@ async def check_image_quality(
         raise HTTPException(status_code=400, detail="فایل باید یک تصویر باشد")
 
     # بررسی کیفیت تصویر
-    quality_result = await image_quality_checker.check_image_quality(image)
+    quality_result = await get_image_quality_checker().check_image_quality(image, owner)
 
     if not quality_result["is_acceptable"]:
         raise HTTPException(
@@ -0,0 +1,71 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import FileResponse
+
+from app.db.session import engine, pool_metrics, replica_pool_metrics, replicas
+from app.profiling import profiler
+from app.services.auth import require_scopes
+from app.services.image_jobs import image_jobs
+from app.services.image_memory import image_memory
+
+# Pool, replica and load-shedding state is not for anonymous clients
+router = APIRouter(dependencies=[Depends(require_scopes("admin"))])
+
+
+@router.get("/db/pool")
+async def db_pool_stats():
+    """
+    آمار زنده‌ی connection pool این worker
+    """
+    return {
+        "primary": pool_metrics.snapshot(engine.sync_engine.pool),
+        "replicas": [
+            {**status, **metrics.snapshot(replica.sync_engine.pool)}
+            for status, metrics, replica in zip(
+                replicas.stats(), replica_pool_metrics, replicas.engines
+            )
+        ],
+        "replica_fallbacks": replicas.fallbacks,
+    }
+
+
+@router.get("/admission")
+async def admission_stats():
+    """
+    وضعیت کنترل پذیرش پردازش تصویر در این worker
+    """
+    return {"image": image_jobs.stats()}
+
+
+@router.get("/image-memory")
+async def image_memory_stats():
+    """
+    بودجه‌ی حافظه‌ی پردازش تصویر و تعداد کارهای اندازه‌گیری‌شده در این worker
+    """
+    return image_memory.stats()
+
+
+@router.get("/profiles")
+async def list_profiles():
+    """
+    پروفایل‌های ذخیره‌شده‌ی درخواست‌ها (جدیدترین اول)
+    """
+    return {"profiles": profiler.profile_ids(), **profiler.stats()}
+
+
+@router.get("/profiles/{profile_id}")
+async def get_profile(
+    profile_id: str,
+    format: str = Query("speedscope", pattern="^(speedscope|collapsed)$"),
+):
+    """
+    دریافت پروفایل یک درخواست؛ speedscope JSON یا collapsed stacks
+    404 while the profiled request is still running.
+    """
+    path = profiler.path_for(profile_id, format)
+    if path is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="پروفایل یافت نشد"
+        )
+    if format == "collapsed":
+        return FileResponse(path, media_type="text/plain; charset=utf-8")
+    return FileResponse(path, media_type="application/json", filename=path.name)
@@ -0,0 +1,104 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from app.config import get_settings
+from app.db.session import engine, pool_metrics, replica_pool_metrics, replicas
+from app.metrics import MultiprocessExporter, metrics, render
+from app.services.image_jobs import image_jobs
+from app.services.user_cache import user_cache
+from app.utils.security import password_hasher
+from app.utils.token_cache import token_cache
+
+router = APIRouter()
+
+settings = get_settings()
+exporter = MultiprocessExporter(
+    metrics,
+    settings.METRICS_MULTIPROC_DIR,
+    flush_interval=settings.METRICS_FLUSH_INTERVAL,
+)
+
+cache_hits = metrics.counter("cache_hits_total", "Cache hits by cache")
+cache_misses = metrics.counter("cache_misses_total", "Cache misses by cache")
+cache_size = metrics.gauge("cache_entries", "Entries currently cached")
+
+pool_checked_out = metrics.gauge(
+    "db_pool_connections_checked_out", "Connections currently checked out"
+)
+pool_overflow = metrics.gauge("db_pool_overflow", "Overflow connections currently open")
+pool_checkouts = metrics.counter("db_pool_checkouts_total", "Connection checkouts")
+pool_timeouts = metrics.counter(
+    "db_pool_timeouts_total", "Checkouts that timed out waiting for a connection"
+)
+pool_wait = metrics.counter(
+    "db_pool_wait_seconds_total", "Time spent waiting for a pooled connection"
+)
+
+executor_in_flight = metrics.gauge(
+    "executor_in_flight", "Tasks running or queued on a worker pool"
+)
+executor_queue_depth = metrics.gauge(
+    "executor_queue_depth", "Tasks waiting for a free thread"
+)
+executor_rejected = metrics.counter(
+    "executor_rejected_total", "Tasks rejected because the queue was full"
+)
+admission_limit = metrics.gauge(
+    "admission_concurrency_limit", "Current adaptive concurrency limit"
+)
+admission_queue_wait = metrics.gauge(
+    "admission_queue_wait_seconds", "Moving average of time admitted jobs waited"
+)
+admission_rejected = metrics.counter(
+    "admission_rejected_total", "Jobs shed with 503 by reason"
+)
+
+
+def collect_runtime_stats() -> None:
+    """Mirror the stats the caches, pools and executors already keep"""
+    for name, stats in (("user", user_cache.stats()), ("token", token_cache.stats())):
+        cache_hits.set(stats["hits"], cache=name)
+        cache_misses.set(stats["misses"], cache=name)
+        cache_size.set(stats["size"], cache=name)
+
+    pools = [("primary", pool_metrics, engine)]
+    pools += [
+        (f"replica-{i}", metrics_, replica)
+        for i, (metrics_, replica) in enumerate(
+            zip(replica_pool_metrics, replicas.engines)
+        )
+    ]
+    for name, pool_stats, pool_engine in pools:
+        snapshot = pool_stats.snapshot(pool_engine.sync_engine.pool)
+        pool_checked_out.set(snapshot.get("checked_out", 0), pool=name)
+        pool_overflow.set(snapshot.get("overflow", 0), pool=name)
+        pool_checkouts.set(snapshot["checkouts"], pool=name)
+        pool_timeouts.set(snapshot["timeouts"], pool=name)
+        pool_wait.set(snapshot["wait_seconds_total"], pool=name)
+
+    hasher = password_hasher.stats()
+    executor_in_flight.set(hasher["in_flight"], executor="bcrypt")
+    executor_queue_depth.set(hasher["queue_depth"], executor="bcrypt")
+    executor_rejected.set(hasher["rejected"], executor="bcrypt")
+
+    images = image_jobs.stats()
+    executor_in_flight.set(images["in_flight"], executor="image")
+    executor_queue_depth.set(images["queued"], executor="image")
+    executor_rejected.set(sum(images["rejected"].values()), executor="image")
+    admission_limit.set(images["limit"], executor="image")
+    admission_queue_wait.set(images["queue_wait_ms"] / 1000, executor="image")
+    for reason, count in images["rejected"].items():
+        admission_rejected.set(count, executor="image", reason=reason)
+
+
+metrics.add_collector(collect_runtime_stats)
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """
+    آمار برنامه در قالب متنی Prometheus (مجموع همه workerها)
+    """
+    return PlainTextResponse(
+        render(exporter.collect()), media_type="text/plain; version=0.0.4"
+    )
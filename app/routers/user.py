@@ -1,95 +1,71 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
+from fastapi import (
+    APIRouter,
+    UploadFile,
+    File,
+    HTTPException,
+    Depends,
+    Query,
+    Request,
+)
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from pathlib import Path
-import cv2
-import numpy as np
 from datetime import datetime
-from app.services.auth import get_current_user
+from app.services.auth import get_current_user, require_scopes
 from app.models.user import User
-from app.services.user_service import insert_user_photo_in_db
-import mediapipe as mp
-import numpy as np
+from app.services.user_cache import UserSnapshot
+from app.services.user_service import (
+    count_users,
+    insert_user_photo_in_db,
+    list_users_page,
+    store_user_photo,
+    stream_users,
+)
+from app.db.session import get_db, get_session
+from app.services.image_jobs import JobOwner, image_job_owner, image_jobs
+from app.services.image_memory import image_memory
+from app.utils.fast_json import FastJSONResponse, json_array_chunks, ndjson_chunks
+from app.utils.http_cache import cache_headers, etag_matches, make_etag, not_modified
+from sqlalchemy.ext.asyncio import AsyncSession
 import os
-from typing import List, TypedDict
+from typing import List, Optional
+from typing_extensions import TypedDict
 import base64
+import csv
+import io
 
 router = APIRouter()
 
-
-def is_blurry(image_np, threshold=50):
-    gray = cv2.cvtColor(image_np, cv2.COLOR_BGR2GRAY)
-    laplacian_var = cv2.Laplacian(gray, cv2.CV_64F, ksize=5).var()
-    return laplacian_var < threshold
-
-
-def is_frontal_face(image_np, angle_threshold=30):
-    mp_face_mesh = mp.solutions.face_mesh
-    with mp_face_mesh.FaceMesh(static_image_mode=True) as face_mesh:
-        results = face_mesh.process(cv2.cvtColor(image_np, cv2.COLOR_BGR2RGB))
-        if not results.multi_face_landmarks:
-            return False  # هیچ چهره‌ای پیدا نشد
-
-        # فقط اولین چهره را بررسی می‌کنیم
-        face_landmarks = results.multi_face_landmarks[0]
-        # نقاط کلیدی چشم چپ و راست و بینی
-        left_eye = face_landmarks.landmark[33]
-        right_eye = face_landmarks.landmark[263]
-        nose_tip = face_landmarks.landmark[1]
-
-        # محاسبه زاویه بین چشم‌ها و بینی (ساده‌شده)
-        dx = right_eye.x - left_eye.x
-        dy = right_eye.y - left_eye.y
-        angle = np.degrees(np.arctan2(dy, dx))
-
-        # افزایش آستانه زاویه برای پذیرش چهره‌های با زاویه بیشتر
-        return abs(angle) < angle_threshold
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+EXPORT_FIELDS = ["id", "mobile", "firstname", "lastname", "email", "created_at"]
 
 
 @router.post("/upload-photo/")
 async def upload_photo(
     user_id: int,
-    current_user: User = Depends(get_current_user),
+    current_user: UserSnapshot = Depends(get_current_user),
     file: UploadFile = File(...),
+    db: AsyncSession = Depends(get_session),
+    owner: JobOwner = Depends(image_job_owner),
 ):
-    # ذخیره فایل موقت
-    contents = await file.read()
-    image_np = cv2.imdecode(np.frombuffer(contents, np.uint8), cv2.IMREAD_COLOR)
-
-    # کنترل کیفیت با حساسیت کمتر
-    if is_blurry(image_np):
-        raise HTTPException(
-            status_code=400, detail="عکس کمی تار است، لطفا عکس واضح‌تری انتخاب کنید"
-        )
-    if not is_frontal_face(image_np):
-        raise HTTPException(
-            status_code=400, detail="لطفا عکس را با زاویه مناسب‌تری بگیرید"
-        )
-
+    # Cheap ownership check before any image work
     if current_user.id != user_id:
         raise HTTPException(
             status_code=400, detail="شما میتوانید فقط عکس خود را آپلود کنید"
         )
 
-    # ایجاد پوشه مخصوص کاربر
-    user_dir = Path(f"media/avatars/user_{user_id}")
-    user_dir.mkdir(parents=True, exist_ok=True)
-
-    # ذخیره عکس در پوشه کاربر
-    filename = f"{int(datetime.now().timestamp())}.jpg"
-    file_path = user_dir / filename
-    cv2.imwrite(str(file_path), image_np)
-
-    await insert_user_photo_in_db(user_id, str(file_path))
-
-    return {"message": "عکس با موفقیت ذخیره شد", "image_path": str(file_path)}
+    contents = await file.read()
+    plan = image_memory.plan("avatar", contents)
+    try:
+        file_path = await image_jobs.run(
+            store_user_photo, user_id, contents, plan, owner=owner
+        )
+    finally:
+        image_memory.record(plan)
 
+    await insert_user_photo_in_db(user_id, file_path, db)
 
-class ImageInfo(TypedDict):
-    filename: str
-    path: str
-    upload_date: str
-    size: int
-    timestamp: int
-    imageData: str
+    return {"message": "عکس با موفقیت ذخیره شد", "image_path": file_path}
 
 
 class ImageResponse(TypedDict):
@@ -100,13 +76,52 @@ class ImageResponse(TypedDict):
     imageData: str  # base64 encoded image
 
 
+def _read_image(file: Path) -> Optional[ImageResponse]:
+    try:
+        timestamp = int(file.stem)
+        # خواندن تصویر و تبدیل به base64
+        with open(file, "rb") as image_file:
+            image_data = base64.b64encode(image_file.read()).decode("utf-8")
+        return {
+            "filename": file.name,
+            "path": str(file),
+            "upload_date": datetime.fromtimestamp(timestamp).isoformat(),
+            "size": file.stat().st_size,
+            "imageData": f"data:image/jpeg;base64,{image_data}",
+        }
+    except (ValueError, OSError) as e:
+        print(f"Error processing file {file.name}: {str(e)}")
+        return None
+
+
+async def _images(files: List[Path]):
+    # One image is read and encoded at a time, off the event loop
+    for file in files:
+        image = await run_in_threadpool(_read_image, file)
+        if image is not None:
+            yield image
+
+
+def _images_etag(files: List[Path]) -> str:
+    # name, size and mtime of each file: a stat per photo, no reads
+    versions = []
+    for file in files:
+        try:
+            stat = file.stat()
+        except OSError:
+            continue
+        versions.append(f"{file.name}:{stat.st_size}:{stat.st_mtime_ns}")
+    return make_etag("images", *versions)
+
+
 @router.get("/images/{user_id}", response_model=List[ImageResponse])
 async def get_user_images(
+    request: Request,
     user_id: int,
-    current_user: User = Depends(get_current_user),
+    current_user: UserSnapshot = Depends(get_current_user),
 ):
     """
-    دریافت لیست تصاویر کاربر
+    دریافت لیست تصاویر کاربر (به صورت جریانی، هر تصویر یک chunk)
     """
     if current_user.id != user_id:
         raise HTTPException(
@@ -116,49 +131,75 @@ async def get_user_images(
     # مسیر پوشه کاربر
     user_dir = Path(f"media/avatars/user_{user_id}")
 
-    if not user_dir.exists():
-        return []
-
-    # دریافت لیست فایل‌های تصویر
-    image_files: List[ImageInfo] = []
-
-    # جستجوی همه فایل‌های تصویر در پوشه
-    for file in user_dir.glob("*.jpg"):
-        try:
-            timestamp = int(file.stem)
-
-            # خواندن تصویر و تبدیل به base64
-            with open(file, "rb") as image_file:
-                image_data = base64.b64encode(image_file.read()).decode("utf-8")
-
-            image_info: ImageInfo = {
-                "filename": file.name,
-                "path": str(file),
-                "upload_date": datetime.fromtimestamp(timestamp).isoformat(),
-                "size": file.stat().st_size,
-                "timestamp": timestamp,
-                "imageData": f"data:image/jpeg;base64,{image_data}",
-            }
-            image_files.append(image_info)
-
-        except (ValueError, OSError) as e:
-            print(f"Error processing file {file.name}: {str(e)}")
-            continue
-
-    # مرتب‌سازی بر اساس تاریخ آپلود (نزولی)
-    image_files = sorted(image_files, key=lambda x: x["timestamp"], reverse=True)
-
-    # تبدیل به فرمت پاسخ
-    response = [
-        {
-            "filename": img["filename"],
-            "path": img["path"],
-            "upload_date": img["upload_date"],
-            "size": img["size"],
-            "imageData": img["imageData"],
-        }
-        for img in image_files
-    ]
-
-    print(f"Found {len(response)} images for user {user_id}")
-    return response
+    # مرتب‌سازی بر اساس تاریخ آپلود (نزولی)؛ نام فایل همان timestamp است
+    files = sorted(
+        user_dir.glob("*.jpg") if user_dir.exists() else [],
+        key=lambda f: int(f.stem) if f.stem.isdigit() else 0,
+        reverse=True,
+    )
+    etag = _images_etag(files)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    if not files:
+        return FastJSONResponse([], headers=cache_headers(etag))
+    return StreamingResponse(
+        json_array_chunks(_images(files)),
+        media_type="application/json",
+        headers=cache_headers(etag),
+    )
+
+
+@router.get("/")
+async def list_users(
+    after_id: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    with_total: bool = False,
+    exact_total: bool = False,
+    admin_claims: dict = Depends(require_scopes("admin")),
+    db: AsyncSession = Depends(get_session),
+):
+    """
+    لیست کاربران با صفحه‌بندی keyset؛ برای صفحه بعد next_after_id را بفرستید
+    """
+    page = await list_users_page(db, after_id=after_id, limit=limit)
+    if with_total:
+        page["total"] = await count_users(db, estimate=not exact_total)
+    return FastJSONResponse(page)
+
+
+async def _export_rows(export_format: str, batch_size: int):
+    # The request-scoped session is already closed while the body streams,
+    # so the export owns a standalone session for the cursor's lifetime.
+    async with get_db() as session:
+        if export_format == "csv":
+            buffer = io.StringIO()
+            writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+            writer.writeheader()
+            yield buffer.getvalue()
+
+        async for batch in stream_users(session, batch_size=batch_size):
+            if export_format == "csv":
+                buffer = io.StringIO()
+                writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+                writer.writerows(batch)
+                yield buffer.getvalue()
+            else:
+                yield ndjson_chunks(batch)
+
+
+@router.get("/export")
+async def export_users(
+    export_format: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$"),
+    batch_size: int = Query(1000, ge=100, le=10000),
+    admin_claims: dict = Depends(require_scopes("admin")),
+):
+    """
+    خروجی کامل کاربران به صورت NDJSON یا CSV (به صورت جریانی)
+    """
+    return StreamingResponse(
+        _export_rows(export_format, batch_size),
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers={
+            "Content-Disposition": f'attachment; filename="users.{export_format}"'
+        },
+    )
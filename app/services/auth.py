@@ -5,6 +5,8 @@ from app.utils.security import (
     create_access_token,
     create_refresh_token,
     verify_password,
+    verify_access_token,
+    password_hasher,
 )
 from app.schemas.auth import (
     RegisterRequest,
@@ -12,7 +14,7 @@ from app.schemas.auth import (
     RegisterResponse,
     UserCreate,
 )
-from app.db.session import get_db
+from app.db.session import get_session, release_connection
 from app.models.user import User
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -28,7 +30,8 @@ from fastapi import Depends, HTTPException, status
 from typing_extensions import Annotated
 from datetime import datetime, timedelta
 import logging
-from app.services.user_service import get_user_by_id
+from app.services.user_service import load_user_snapshot, update_user_tokens_in_db
+from app.services.user_cache import UserSnapshot, user_cache
 from app.utils.security import create_access_token, create_refresh_token
 
 logger = logging.getLogger(__name__)
@@ -40,9 +43,9 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/token", auto_error=False)
 optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/token", auto_error=False)
 
 
-async def handle_verify_code(mobile: str, code: int) -> str:
+async def handle_verify_code(mobile: str, code: int, db: AsyncSession) -> str:
     """اعتبارسنجی کد تأیید و صدور توکن"""
-    user = await get_user_by_mobile(mobile)
+    user = await get_user_by_mobile(mobile, db)
 
     if not user or str(user.verification_code) != str(code):
         raise HTTPException(status_code=400, detail="Invalid verification code")
@@ -75,7 +78,7 @@ async def refresh_access_token(
         if not mobile:
             return None
 
-        user = await get_user_by_mobile(mobile)
+        user = await get_user_by_mobile(mobile, db)
         if not user or user.refresh_token != refresh_token:
             return None
 
@@ -101,102 +104,138 @@ async def refresh_access_token(
         raise HTTPException(status_code=401, detail="Invalid refresh token")
 
 
-async def get_user_by_mobile(mobile: str):
-    async with get_db() as session:
-        result = await session.execute(sa.select(User).where(User.mobile == mobile))
-        user = result.scalars().first()
-        return user
+async def get_user_by_mobile(mobile: str, db: AsyncSession):
+    result = await db.execute(sa.select(User).where(User.mobile == mobile))
+    user = result.scalars().first()
+    return user
 
 
-# Token validation and user extraction
-async def get_current_user(
-    token: str = Depends(oauth2_scheme),
-    db: AsyncSession = Depends(get_db),
-    settings: Settings = Depends(get_settings),
-) -> User:
-    """
-    احراز هویت کاربر از طریق توکن JWT و بازگرداندن شناسه کاربر.
-    این تابع برای API‌هایی استفاده می‌شود که نیاز به احراز هویت اجباری دارند.
-    """
-    credentials_exception = HTTPException(
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="اعتبار نشست شما منقضی شده است. لطفا دوباره وارد شوید.",
         headers={"WWW-Authenticate": "Bearer"},
     )
 
+
+# Token validation and claims extraction
+async def get_token_claims(
+    token: str = Depends(oauth2_scheme),
+    settings: Settings = Depends(get_settings),
+) -> dict:
+    """
+    اعتبارسنجی توکن JWT و بازگرداندن claims آن.
+    Verified tokens are served from the token cache until they expire.
+    """
     if not token:
         logger.warning("No token provided in request")
-        raise credentials_exception
+        raise _credentials_exception()
 
     try:
         # Remove 'Bearer ' prefix if present
         if token.startswith("Bearer "):
             token = token.split(" ")[1]
 
-        payload = jwt.decode(
-            token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM]
-        )
+        payload = verify_access_token(token, settings)
         sub = payload.get("sub")
 
         if not sub:
             logger.warning("Token is missing user_id")
-            raise credentials_exception
-
-        user_id = int(sub)
+            raise _credentials_exception()
 
-        # Check token expiration
-        exp = payload.get("exp")
-        if exp and datetime.now() > datetime.fromtimestamp(exp):
-            logger.warning(f"Token expired for user_id {user_id}")
-            raise credentials_exception
+        int(sub)
 
     except JWTError as e:
         logger.warning(f"JWT Error: {str(e)}")
-        raise credentials_exception
+        raise _credentials_exception()
     except ValueError as e:
         logger.warning(f"Invalid token format: {str(e)}")
-        raise credentials_exception
+        raise _credentials_exception()
+
+    return payload
+
+
+# Token validation and user extraction
+async def get_current_user(
+    claims: dict = Depends(get_token_claims),
+    db: AsyncSession = Depends(get_session),
+) -> UserSnapshot:
+    """
+    احراز هویت کاربر از طریق توکن JWT و بازگرداندن شناسه کاربر.
+    این تابع برای API‌هایی استفاده می‌شود که نیاز به احراز هویت اجباری دارند.
+    """
+    user_id = int(claims["sub"])
 
-    # Check if user exists in database
-    user = await get_user_by_id(user_id)
+    # Check if user exists (served from the in-process cache when possible)
+    user = await user_cache.get_or_load(
+        user_id, lambda uid: load_user_snapshot(uid, db)
+    )
     if user is None:
         logger.warning(f"User ID {user_id} from token not found in database")
-        raise credentials_exception
+        raise _credentials_exception()
+
+    # Don't hold a pooled connection while the handler does non-DB work
+    await release_connection(db)
 
     return user
 
 
+def require_scopes(*required: str):
+    """
+    Dependency factory: 403 unless the token carries every scope in ``required``
+    """
+
+    async def _check_scopes(claims: dict = Depends(get_token_claims)) -> dict:
+        granted = set(claims.get("scopes") or ())
+        if not granted.issuperset(required):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="شما به این بخش دسترسی ندارید",
+            )
+        return claims
+
+    return _check_scopes
+
+
+def is_admin_user(user: User, settings: Settings) -> bool:
+    if getattr(user, "is_admin", False):
+        return True
+    return user.username in settings.admin_usernames
+
+
 async def create_user(user_data: UserCreate, db: AsyncSession) -> User:
     """Create a new user with hashed password"""
-    hashed_password = hash_password(user_data.password)
     username = user_data.username
     # First check if user exists by mobile
-    user_result = await get_user_by_username(username)
+    user_result = await get_user_by_username(username, db)
     if user_result:
         print(
             f"User already exists with username {username}. Updating verification code."
         )
         return user_result
 
+    # Give the pooled connection back while bcrypt runs
+    await release_connection(db)
+    hashed_password = await password_hasher.hash(user_data.password)
+
     # User doesn't exist, create new user
     expires_at = datetime.now() + timedelta(minutes=5)
     current_time = datetime.now()
 
     try:
-        async with get_db() as session:
-            print(f"Creating new user with username {username}")
-            new_user = User(
-                username=username,
-                hashed_password=hashed_password,
-                verification_code_expires=expires_at,
-                updated_at=current_time,
-            )
+        print(f"Creating new user with username {username}")
+        new_user = User(
+            username=username,
+            hashed_password=hashed_password,
+            verification_code_expires=expires_at,
+            updated_at=current_time,
+        )
 
-            session.add(new_user)
-            await session.commit()
-            await session.refresh(new_user)
-            print(f"Successfully created new user with ID {new_user.id}")
-            return new_user
+        db.add(new_user)
+        # flush assigns the id; the request scope commits
+        await db.flush()
+        print(f"Successfully created new user with ID {new_user.id}")
+        return new_user
     except IntegrityError as e:
         print(f"Error creating user: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to create user: {str(e)}")
@@ -205,26 +244,39 @@ async def create_user(user_data: UserCreate, db: AsyncSession) -> User:
         raise HTTPException(status_code=500, detail=f"Failed to create user: {str(e)}")
 
 
-async def authenticate_user(username: str, password: str) -> Optional[User]:
+async def authenticate_user(
+    username: str, password: str, db: AsyncSession
+) -> Optional[User]:
     """Authenticate user and return user object"""
-    user = await get_user_by_username(username)
+    user = await get_user_by_username(username, db)
     print(f"authenticate_user: {user}")
     if not user:
         return None
-    if not verify_password(password, user.hashed_password):
+
+    # Give the pooled connection back while bcrypt runs
+    await release_connection(db)
+    is_valid, new_hash = await password_hasher.verify_and_update(
+        password, user.hashed_password
+    )
+    if not is_valid:
         return None
+    if new_hash:
+        # Stored hash was made with a different bcrypt cost; upgrade it silently
+        await db.execute(
+            sa.update(User).where(User.id == user.id).values(hashed_password=new_hash)
+        )
+        user.hashed_password = new_hash
     return user
 
 
-async def get_user_by_username(username: str) -> Optional[User]:
+async def get_user_by_username(username: str, db: AsyncSession) -> Optional[User]:
     """Get user by username"""
-    async with get_db() as session:
-        result = await session.execute(sa.select(User).where(User.username == username))
-        user = result.scalars().first()
-        return user
+    result = await db.execute(sa.select(User).where(User.username == username))
+    user = result.scalars().first()
+    return user
 
 
-async def create_tokens(user: User) -> dict:
+async def create_tokens(user: User, db: AsyncSession) -> dict:
     try:
         print(f"Creating tokens for user ID: {user.id}, mobile: {user.mobile}")
         settings = get_settings()
@@ -239,8 +291,8 @@ async def create_tokens(user: User) -> dict:
         scopes = ["user"]  # همه کاربران به اطلاعات پایه دسترسی دارند
 
         # اضافه کردن دسترسی‌های دیگر بر اساس نوع کاربر
-        if getattr(user, "is_admin", False):
-            scopes.extend(["products", "categories", "warehouses"])
+        if is_admin_user(user, settings):
+            scopes.extend(["admin", "products", "categories", "warehouses"])
         elif getattr(user, "is_supplier", False):
             scopes.extend(["products", "warehouses"])
 
@@ -257,10 +309,10 @@ async def create_tokens(user: User) -> dict:
             expires_delta=None,
         )
 
-        # Store tokens in the database
-        print(f"Storing tokens in database for user ID: {user.id}")
+        # Store tokens in the database (single UPDATE ... RETURNING)
         token_updated = await update_user_tokens_in_db(
-            username=user.username,
+            db,
+            user_id=user.id,
             access_token=access_token,
             refresh_token=refresh_token,
             token_expires_at=access_token_expires,
@@ -268,8 +320,6 @@ async def create_tokens(user: User) -> dict:
 
         if not token_updated:
             print(f"Warning: Failed to update tokens for user ID: {user.id}")
-        else:
-            print(f"Tokens created and stored successfully for user ID: {user.id}")
 
         return {
             "access_token": access_token,
@@ -280,50 +330,3 @@ async def create_tokens(user: User) -> dict:
     except Exception as e:
         print(f"Error creating tokens: {e}")
         raise
-
-
-async def update_user_tokens_in_db(
-    username: str, access_token: str, refresh_token: str, token_expires_at=None
-) -> bool:
-    """
-    توکن‌های کاربر را در دیتابیس به‌روزرسانی کند
-    """
-    try:
-        async with get_db() as session:
-            print(f"Updating tokens for username: {username}")
-
-            # First, get the user
-            result = await session.execute(
-                sa.select(User).where(User.username == username)
-            )
-            user = result.scalars().first()
-
-            if not user:
-                print(f"User with username {username} not found for token update")
-                return False
-
-            # Update tokens directly on the user object
-            user.access_token = access_token
-            user.refresh_token = refresh_token
-
-            if token_expires_at:
-                user.token_expires_at = token_expires_at
-
-            # Make sure to commit the changes
-            await session.commit()
-
-            # Verify the tokens were updated
-            result = await session.execute(
-                sa.select(User).where(User.username == username)
-            )
-            updated_user = result.scalars().first()
-
-            if updated_user and updated_user.access_token == access_token:
-                print(f"Tokens successfully updated for user {username}")
-                return True
-            else:
-                print(f"Failed to update tokens for user {username}")
-                return False
-    except Exception as e:
-        print(f"Error updating tokens in database: {e}")
-        return False
@@ -0,0 +1,76 @@
+"""
+دسترسی تنبل (lazy) به سرویس‌های مبتنی بر OpenCV و MediaPipe
+
+Importing this module is cheap: cv2, mediapipe and the Haar cascade are only
+loaded the first time an image route needs them, so auth-only cold starts
+(e.g. a serverless /auth/token call) never pay for them.
+"""
+
+import threading
+from types import ModuleType
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    from app.services.image_quality import ImageQualityChecker
+
+_lock = threading.Lock()
+_face_checks: Optional[ModuleType] = None
+_image_quality_checker: Optional["ImageQualityChecker"] = None
+
+
+def get_face_checks() -> ModuleType:
+    global _face_checks
+    if _face_checks is None:
+        with _lock:
+            if _face_checks is None:
+                from app.services import face_checks
+
+                _face_checks = face_checks
+    return _face_checks
+
+
+def get_image_quality_checker() -> "ImageQualityChecker":
+    global _image_quality_checker
+    if _image_quality_checker is None:
+        with _lock:
+            if _image_quality_checker is None:
+                from app.services.image_quality import ImageQualityChecker
+
+                _image_quality_checker = ImageQualityChecker()
+    return _image_quality_checker
+
+
+def is_loaded() -> bool:
+    return _face_checks is not None and _image_quality_checker is not None
+
+
+def preload() -> None:
+    """Load every CV dependency and model now (eager startup mode)"""
+    get_face_checks()
+    get_image_quality_checker()
+
+
+def warm_up() -> None:
+    """
+    یک inference ساختگی تا اولین درخواست واقعی هزینه‌ی راه‌اندازی را ندهد
+    Runs the Haar cascade and one FaceMesh graph on a blank frame.
+    """
+    import numpy as np
+
+    face_checks = get_face_checks()
+    blank = np.zeros((480, 480, 3), dtype=np.uint8)
+    get_image_quality_checker()._detect_face(blank)
+    face_checks.is_blurry(blank)
+    face_checks.is_frontal_face(blank)
+
+
+def reset_after_fork() -> None:
+    global _lock
+    _lock = threading.Lock()
+    if _face_checks is not None:
+        _face_checks.face_mesh_pool.reset_after_fork()
+
+
+def close() -> None:
+    if _face_checks is not None:
+        _face_checks.face_mesh_pool.close()
@@ -0,0 +1,110 @@
+import queue
+import threading
+from contextlib import contextmanager
+
+import cv2
+import mediapipe as mp
+import numpy as np
+
+from app.config import get_settings
+from app.tracing import traced
+
+
+class FaceMeshPool:
+    """
+    مخزن نمونه‌های FaceMesh برای استفاده مجدد بین درخواست‌ها
+
+    Building a FaceMesh graph costs far more than running it on one image.
+    Instances are not thread-safe, so each caller borrows one exclusively;
+    at most ``size`` are ever created.
+    """
+
+    def __init__(self, size: int = 2):
+        self.size = size
+        self._idle: "queue.LifoQueue" = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def acquire(self):
+        try:
+            face_mesh = self._idle.get_nowait()
+        except queue.Empty:
+            face_mesh = self._create_or_wait()
+        try:
+            yield face_mesh
+        finally:
+            self._idle.put(face_mesh)
+
+    def _create_or_wait(self):
+        with self._lock:
+            create = self._created < self.size
+            if create:
+                self._created += 1
+        if not create:
+            return self._idle.get()
+        try:
+            return mp.solutions.face_mesh.FaceMesh(static_image_mode=True)
+        except BaseException:
+            with self._lock:
+                self._created -= 1
+            raise
+
+    def reset_after_fork(self) -> None:
+        # Graphs built in the parent own threads that did not survive fork();
+        # drop them without calling close() and build fresh ones on demand
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        self._created = 0
+
+
+face_mesh_pool = FaceMeshPool(size=get_settings().FACE_MESH_POOL_SIZE)
+
+
+@traced("image.decode")
+def decode_image(contents: bytes, flags: int = cv2.IMREAD_COLOR):
+    """Decode uploaded bytes to a BGR array (None if the bytes are not an image)"""
+    return cv2.imdecode(np.frombuffer(contents, np.uint8), flags)
+
+
+@traced("image.imwrite")
+def save_image(path: str, image_np) -> bool:
+    return cv2.imwrite(path, image_np)
+
+
+@traced("image.blur_check")
+def is_blurry(image_np, threshold=50):
+    gray = cv2.cvtColor(image_np, cv2.COLOR_BGR2GRAY)
+    laplacian_var = cv2.Laplacian(gray, cv2.CV_64F, ksize=5).var()
+    return laplacian_var < threshold
+
+
+@traced("image.face_mesh")
+def is_frontal_face(image_np, angle_threshold=30):
+    with face_mesh_pool.acquire() as face_mesh:
+        results = face_mesh.process(cv2.cvtColor(image_np, cv2.COLOR_BGR2RGB))
+        if not results.multi_face_landmarks:
+            return False  # هیچ چهره‌ای پیدا نشد
+
+        # فقط اولین چهره را بررسی می‌کنیم
+        face_landmarks = results.multi_face_landmarks[0]
+        # نقاط کلیدی چشم چپ و راست و بینی
+        left_eye = face_landmarks.landmark[33]
+        right_eye = face_landmarks.landmark[263]
+        nose_tip = face_landmarks.landmark[1]
+
+        # محاسبه زاویه بین چشم‌ها و بینی (ساده‌شده)
+        dx = right_eye.x - left_eye.x
+        dy = right_eye.y - left_eye.y
+        angle = np.degrees(np.arctan2(dy, dx))
+
+        # افزایش آستانه زاویه برای پذیرش چهره‌های با زاویه بیشتر
+        return abs(angle) < angle_threshold
@@ -0,0 +1,108 @@
+"""
+اجرای پردازش تصویر روی thread pool جداگانه با کنترل پذیرش
+
+OpenCV and MediaPipe release the GIL, so image work runs on its own small
+pool instead of blocking the event loop; auth routes keep the loop and the
+bcrypt pool to themselves. Admission to this pool goes through an
+AdmissionController, which sheds excess load with 503 + Retry-After and
+shares the queue fairly between users, weighted by their token scopes.
+"""
+
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, Optional, TypeVar
+
+from fastapi import Depends
+
+from app.admission import AdmissionController
+from app.config import get_settings
+from app.profiling import profiler
+from app.services.auth import get_token_claims
+from app.tracing import span
+
+T = TypeVar("T")
+
+
+@dataclass(frozen=True)
+class JobOwner:
+    """Who a job is queued for, and that user's share of the pool"""
+
+    user_id: Optional[int] = None
+    weight: float = 1.0
+
+
+class ImageJobs:
+    def __init__(
+        self,
+        admission: AdmissionController,
+        scope_weights: Optional[Dict[str, float]] = None,
+    ):
+        self.admission = admission
+        # One thread per slot the limit can reach: an admitted job starts at
+        # once instead of waiting in the executor's FIFO queue, which the
+        # controller can neither see nor order fairly
+        self.max_workers = admission.max_limit
+        self.scope_weights = scope_weights or {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def weight_for(self, scopes: Iterable[str]) -> float:
+        return max((self.scope_weights.get(s, 1.0) for s in scopes), default=1.0)
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix="image"
+            )
+        return self._executor
+
+    async def run(self, fn: Callable[..., T], *args, owner: JobOwner = JobOwner()) -> T:
+        async with self.admission.admit(owner.user_id, owner.weight):
+            loop = asyncio.get_running_loop()
+            with span("image.job", job=fn.__name__):
+                # The worker thread sees this request's trace context
+                context = contextvars.copy_context()
+                return await loop.run_in_executor(
+                    self.executor, context.run, profiler.bind(fn), *args
+                )
+
+    def stats(self) -> dict:
+        return {"workers": self.max_workers, **self.admission.stats()}
+
+    def reset_after_fork(self) -> None:
+        """Forget the parent's executor; its threads do not exist in a forked child"""
+        self._executor = None
+        self.admission.reset()
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+settings = get_settings()
+image_jobs = ImageJobs(
+    AdmissionController(
+        "image",
+        initial_limit=settings.IMAGE_WORKERS,
+        min_limit=settings.IMAGE_CONCURRENCY_MIN,
+        max_limit=settings.IMAGE_CONCURRENCY_MAX,
+        queue_limit=settings.IMAGE_QUEUE_LIMIT,
+        tenant_queue_limit=settings.IMAGE_QUEUE_PER_USER,
+        max_wait=settings.IMAGE_QUEUE_TIMEOUT,
+    ),
+    scope_weights=settings.image_scope_weights,
+)
+
+
+async def image_job_owner(claims: dict = Depends(get_token_claims)) -> JobOwner:
+    """
+    Dependency: the requesting user as an image job owner.
+    Shares get_token_claims with get_current_user (resolved once per request).
+    """
+    return JobOwner(
+        user_id=int(claims["sub"]),
+        weight=image_jobs.weight_for(claims.get("scopes") or ()),
+    )
@@ -0,0 +1,344 @@
+"""
+بودجه و حساب‌رسی حافظه‌ی پردازش تصویر
+
+Image routes allocate far more than the upload: a 12 MP JPEG of 14 MB
+becomes a 36 MB BGR array, and the brightness check adds float64 weights
+and distances (~33 bytes per pixel) on top. The peak is predictable from
+the pixel count, which is read from the image header before decoding.
+
+Every request gets an ``ImageMemoryPlan`` on the event loop:
+
+* the estimate (upload + decoded pixels x the costliest stage of the
+  pipeline, see STAGE_BYTES_PER_PIXEL) is checked against
+  IMAGE_MEMORY_BUDGET_MB before the job is queued;
+* over budget, IMAGE_MEMORY_OVER_BUDGET=reject answers 413, ``downscale``
+  decodes at 1/2, 1/4 or 1/8 size instead (JPEG scales while decoding, so
+  the full-size array never exists);
+* images whose header could not be read are checked again after decoding.
+
+Downscaling only applies to the quality check, and its blur score is then
+measured on the reduced image: area averaging removes fine detail and
+noise, so the Laplacian variance shifts and a borderline image may be
+judged differently than at full size (the result carries ``reduction``).
+Avatars are always rejected over budget, since a reduced decode would
+change both the blur/FaceMesh verdict and the stored avatar's size.
+
+With IMAGE_MEMORY_TRACKING on, tracemalloc runs for the whole process and
+each stage of a job records the peak it allocated (NumPy and OpenCV output
+arrays are visible to tracemalloc, OpenCV/MediaPipe internal buffers are
+not). tracemalloc's peak is process-wide: only one job at a time is
+measured, but other jobs keep allocating on other threads meanwhile, so
+the traced peaks are upper bounds for the measured job (exact only when
+it ran alone). Results go to the image_memory_* metrics and to
+``memory.stage`` spans in traces.
+"""
+
+import math
+import struct
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from app.config import Settings, get_settings
+from app.metrics import (
+    detector_invocations,
+    image_bytes,
+    image_memory_estimated,
+    image_memory_over_budget,
+    image_memory_peak,
+)
+from app.tracing import span
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# Bytes per decoded pixel a stage allocates on top of the BGR image, measured
+# with tracemalloc on a 4000x3000 JPEG
+STAGE_BYTES_PER_PIXEL: Dict[str, int] = {
+    "decode": 3,  # the BGR array itself
+    "blur": 17,  # gray + CV_64F Laplacian + the temporary var() makes
+    "haar_cascade": 1,  # gray; the cascade's own image pyramid is untracked
+    "brightness": 33,  # gray + float64 distance and weights + np.average
+    "face_mesh": 3,  # RGB copy handed to MediaPipe
+    "imwrite": 0,
+}
+PIPELINES: Dict[str, Tuple[str, ...]] = {
+    "quality": ("decode", "blur", "haar_cascade", "brightness"),
+    "avatar": ("decode", "blur", "face_mesh", "imwrite"),
+}
+# Pipelines whose result survives a reduced decode (see the module docstring)
+DOWNSCALABLE = {"quality"}
+REDUCTIONS = (2, 4, 8)
+
+_JPEG_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD}
+_JPEG_STANDALONE = {0x01, 0xD8} | set(range(0xD0, 0xD8))
+
+
+def image_size(contents: bytes) -> Optional[Tuple[str, int, int]]:
+    """(format, width, height) from a JPEG/PNG/WebP/BMP header, without decoding"""
+    try:
+        if contents.startswith(b"\x89PNG\r\n\x1a\n") and contents[12:16] == b"IHDR":
+            width, height = struct.unpack(">II", contents[16:24])
+            return "png", width, height
+        if contents.startswith(b"\xff\xd8"):
+            return _jpeg_size(contents)
+        if contents.startswith(b"RIFF") and contents[8:12] == b"WEBP":
+            return _webp_size(contents)
+        if contents.startswith(b"BM"):
+            width, height = struct.unpack("<ii", contents[18:26])
+            return "bmp", abs(width), abs(height)
+    except struct.error:
+        pass
+    return None
+
+
+def _jpeg_size(contents: bytes) -> Optional[Tuple[str, int, int]]:
+    i = 2
+    while i + 4 <= len(contents):
+        if contents[i] != 0xFF:
+            return None
+        marker = contents[i + 1]
+        if marker == 0xFF:  # fill byte
+            i += 1
+            continue
+        if marker in _JPEG_STANDALONE:
+            i += 2
+            continue
+        if marker in _JPEG_SOF:
+            height, width = struct.unpack(">HH", contents[i + 5 : i + 9])
+            return "jpeg", width, height
+        (length,) = struct.unpack(">H", contents[i + 2 : i + 4])
+        i += 2 + length
+    return None
+
+
+def _webp_size(contents: bytes) -> Optional[Tuple[str, int, int]]:
+    chunk = contents[12:16]
+    if chunk == b"VP8 ":
+        width, height = struct.unpack("<HH", contents[26:30])
+        return "webp", width & 0x3FFF, height & 0x3FFF
+    if chunk == b"VP8L":
+        bits = int.from_bytes(contents[21:25], "little")
+        return "webp", (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b"VP8X":
+        width = int.from_bytes(contents[24:27], "little") + 1
+        height = int.from_bytes(contents[27:30], "little") + 1
+        return "webp", width, height
+    return None
+
+
+def _over_budget() -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail="ابعاد تصویر بیش از حد بزرگ است، لطفا تصویر کوچک‌تری انتخاب کنید",
+    )
+
+
+class ImageMemoryPlan:
+    """Budget decision and measurements for one image job"""
+
+    def __init__(self, memory: "ImageMemory", pipeline: str, contents: bytes):
+        self.memory = memory
+        self.pipeline = pipeline
+        self.upload_bytes = len(contents)
+        size = image_size(contents)
+        self.format, self.width, self.height = size or (None, None, None)
+        self.reduction = 1
+        self.downscaled = False
+        self.rejected = False
+        self.pixels = 0  # of the decoded image, once decoded
+        self.stages: Dict[str, Dict[str, int]] = {}
+        self.peak: Optional[int] = None  # traced, when this job was measured
+        # Counted on the job's thread; record() adds them to the metrics on
+        # the event loop, which keeps metric updates lock-free
+        self.bytes_decoded = 0
+        self.detectors: List[str] = []
+        self._measuring = False
+        self._base = 0
+
+    @property
+    def decode_flags(self) -> int:
+        # cv2 is loaded lazily (see cv_loader); this runs on the image pool
+        import cv2
+
+        if self.reduction == 1:
+            return cv2.IMREAD_COLOR
+        return getattr(cv2, f"IMREAD_REDUCED_COLOR_{self.reduction}")
+
+    def estimate(self, pixels: int, reduction: int = 1) -> int:
+        """Expected peak bytes of the pipeline for an image of ``pixels``"""
+        stages = PIPELINES[self.pipeline]
+        per_pixel = STAGE_BYTES_PER_PIXEL["decode"] + max(
+            STAGE_BYTES_PER_PIXEL[stage] for stage in stages
+        )
+        reduced = math.ceil(pixels / (reduction * reduction))
+        # Only JPEG scales while decoding; other formats are decoded at full
+        # size and resized, so the full BGR array exists for a moment
+        transient = 0 if reduction == 1 or self.format == "jpeg" else 3 * pixels
+        return self.upload_bytes + max(reduced * per_pixel, transient + 3 * reduced)
+
+    @property
+    def estimated_bytes(self) -> Optional[int]:
+        if self.pixels:
+            return self.estimate(self.pixels)
+        if self.width is None:
+            return None
+        return self.estimate(self.width * self.height, self.reduction)
+
+    def _fit(self, pixels: int) -> None:
+        """Apply the over-budget policy to an image of ``pixels`` (event loop or job)"""
+        budget = self.memory.budget
+        if not budget or self.estimate(pixels) <= budget:
+            return
+        if self.memory.over_budget == "downscale" and self.pipeline in DOWNSCALABLE:
+            for reduction in REDUCTIONS:
+                if self.estimate(pixels, reduction) <= budget:
+                    self.reduction = reduction
+                    self.downscaled = True
+                    return
+        self.rejected = True
+        raise _over_budget()
+
+    def decoded(self, image: "np.ndarray") -> "np.ndarray":
+        """Account for a decoded image; resizes or rejects if the header was unreadable"""
+        height, width = image.shape[:2]
+        if self.width is None:
+            self._fit(width * height)
+            if self.reduction > 1:
+                import cv2
+
+                image = cv2.resize(
+                    image,
+                    (max(width // self.reduction, 1), max(height // self.reduction, 1)),
+                    interpolation=cv2.INTER_AREA,
+                )
+                height, width = image.shape[:2]
+        self.pixels = width * height
+        return image
+
+    # ── measurement (on the job's thread) ──
+    @contextmanager
+    def measure(self) -> Iterator[None]:
+        """Measure the whole job with tracemalloc, if tracking is on and free"""
+        self._measuring = self.memory.acquire_tracking()
+        if self._measuring:
+            self._base = tracemalloc.get_traced_memory()[0]
+            self.peak = self.upload_bytes
+        try:
+            yield
+        finally:
+            if self._measuring:
+                self.memory.release_tracking()
+                self._measuring = False
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        with span("memory.stage", stage=name) as current:
+            if self._measuring:
+                start = tracemalloc.get_traced_memory()[0]
+                tracemalloc.reset_peak()
+            try:
+                yield
+            finally:
+                stats = {"estimated": self.pixels * STAGE_BYTES_PER_PIXEL[name]}
+                if self._measuring:
+                    peak = tracemalloc.get_traced_memory()[1]
+                    stats["traced"] = peak - start
+                    self.peak = max(self.peak, self.upload_bytes + peak - self._base)
+                self.stages[name] = stats
+                if current is not None:
+                    current.attrs.update(stats)
+
+
+class ImageMemory:
+    def __init__(
+        self,
+        budget_mb: float = 0,
+        over_budget: str = "reject",
+        tracking: bool = False,
+    ):
+        self.budget = int(budget_mb * 1024 * 1024)
+        self.over_budget = over_budget
+        self.tracking = tracking
+        self._lock = threading.Lock()
+        self.measured = 0
+        self.unmeasured = 0
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> "ImageMemory":
+        return cls(
+            budget_mb=settings.IMAGE_MEMORY_BUDGET_MB,
+            over_budget=settings.IMAGE_MEMORY_OVER_BUDGET,
+            tracking=settings.IMAGE_MEMORY_TRACKING,
+        )
+
+    def plan(self, pipeline: str, contents: bytes) -> ImageMemoryPlan:
+        """
+        Budget check for an upload, before any decoding (cv2 is not needed).
+        Raises HTTPException(413) when it cannot be made to fit.
+        """
+        plan = ImageMemoryPlan(self, pipeline, contents)
+        if plan.width is not None:
+            try:
+                plan._fit(plan.width * plan.height)
+            except HTTPException:
+                self.record(plan)
+                raise
+        return plan
+
+    def record(self, plan: ImageMemoryPlan) -> None:
+        """Report a finished job's numbers (on the event loop)"""
+        if plan.bytes_decoded:
+            image_bytes.inc(plan.bytes_decoded)
+        for detector in plan.detectors:
+            detector_invocations.inc(detector=detector)
+        estimated = plan.estimated_bytes
+        if estimated is not None:
+            image_memory_estimated.observe(estimated, pipeline=plan.pipeline)
+        if plan.rejected or plan.downscaled:
+            image_memory_over_budget.inc(
+                pipeline=plan.pipeline,
+                action="rejected" if plan.rejected else "downscaled",
+            )
+        if plan.peak is not None:
+            image_memory_peak.observe(plan.peak, pipeline=plan.pipeline, stage="total")
+            for name, stats in plan.stages.items():
+                image_memory_peak.observe(
+                    stats["traced"], pipeline=plan.pipeline, stage=name
+                )
+
+    def acquire_tracking(self) -> bool:
+        if not tracemalloc.is_tracing():
+            return False
+        if self._lock.acquire(blocking=False):
+            self.measured += 1
+            return True
+        self.unmeasured += 1
+        return False
+
+    def release_tracking(self) -> None:
+        self._lock.release()
+
+    def start(self) -> None:
+        if self.tracking and not tracemalloc.is_tracing():
+            # One frame per trace is enough for totals and keeps the overhead low
+            tracemalloc.start(1)
+
+    def stop(self) -> None:
+        if self.tracking and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def stats(self) -> dict:
+        return {
+            "budget_bytes": self.budget,
+            "over_budget": self.over_budget,
+            "tracking": tracemalloc.is_tracing(),
+            "measured": self.measured,
+            "unmeasured": self.unmeasured,
+        }
+
+
+image_memory = ImageMemory.from_settings(get_settings())
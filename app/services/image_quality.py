@@ -4,6 +4,10 @@ from typing import Tuple, Dict, Optional
 from fastapi import UploadFile, HTTPException
 import io
 
+from app.services.image_jobs import JobOwner, image_jobs
+from app.services.image_memory import ImageMemoryPlan, image_memory
+from app.tracing import span, traced
+
 
 class ImageQualityChecker:
     def __init__(self):
@@ -12,49 +16,83 @@ class ImageQualityChecker:
             cv2.data.haarcascades + "haarcascade_frontalface_default.xml"
         )
 
-    async def check_image_quality(self, image_file: UploadFile) -> Dict:
+    async def check_image_quality(
+        self, image_file: UploadFile, owner: JobOwner = JobOwner()
+    ) -> Dict:
         """
         بررسی کیفیت تصویر و اعمال معیارهای مختلف
         """
+        # خواندن تصویر از فایل آپلود شده
+        contents = await image_file.read()
+        # Rejected (413) here, before queueing, if the header says it won't fit
+        plan = image_memory.plan("quality", contents)
+        try:
+            return await image_jobs.run(
+                self.check_image_bytes, contents, plan, owner=owner
+            )
+        finally:
+            image_memory.record(plan)
+
+    def check_image_bytes(
+        self, contents: bytes, plan: Optional[ImageMemoryPlan] = None
+    ) -> Dict:
+        """CPU-bound part of check_image_quality; runs on the image pool"""
+        plan = plan or image_memory.plan("quality", contents)
         try:
-            # خواندن تصویر از فایل آپلود شده
-            contents = await image_file.read()
+            with plan.measure():
+                return self._check_decoded(contents, plan)
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(
+                status_code=500, detail=f"خطا در پردازش تصویر: {str(e)}"
+            )
+
+    def _check_decoded(self, contents: bytes, plan: ImageMemoryPlan) -> Dict:
+        plan.bytes_decoded += len(contents)
+        with plan.stage("decode"), span("image.decode", bytes=len(contents)):
             nparr = np.frombuffer(contents, np.uint8)
-            image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+            image = cv2.imdecode(nparr, plan.decode_flags)
+            if image is not None:
+                image = plan.decoded(image)
 
-            if image is None:
-                raise HTTPException(status_code=400, detail="تصویر نامعتبر است")
+        if image is None:
+            raise HTTPException(status_code=400, detail="تصویر نامعتبر است")
 
-            # انجام بررسی‌های مختلف
+        # انجام بررسی‌های مختلف
+        with plan.stage("blur"):
             blur_score = self._check_blur(image)
+        with plan.stage("haar_cascade"):
+            plan.detectors.append("haar_cascade")
             face_detected = self._detect_face(image)
+        with plan.stage("brightness"):
             brightness = self._check_brightness(image)
-            resolution = self._check_resolution(image)
-
-            # تنظیم پارامترهای بررسی کیفیت با حساسیت کمتر
-            is_blurry = blur_score < 30  # کاهش آستانه تار بودن
-            is_brightness_ok = 10 <= brightness <= 90  # افزایش محدوده روشنایی
-            is_resolution_ok = resolution >= 300  # کاهش حداقل رزولوشن
-
-            return {
-                "is_blurry": is_blurry,
-                "blur_score": blur_score,
-                "face_detected": face_detected,
-                "brightness": brightness,
-                "resolution": resolution,
-                "is_acceptable": (
-                    not is_blurry  # تصویر نباید خیلی تار باشد
-                    and face_detected  # باید چهره در تصویر وجود داشته باشد
-                    and is_brightness_ok  # روشنایی باید در محدوده مناسب باشد
-                    and is_resolution_ok  # حداقل رزولوشن 300 پیکسل
-                ),
-            }
+        # Of the uploaded image, not of a reduced decode
+        resolution = self._check_resolution(image) * plan.reduction
 
-        except Exception as e:
-            raise HTTPException(
-                status_code=500, detail=f"خطا در پردازش تصویر: {str(e)}"
-            )
+        # تنظیم پارامترهای بررسی کیفیت با حساسیت کمتر
+        is_blurry = blur_score < 30  # کاهش آستانه تار بودن
+        is_brightness_ok = 10 <= brightness <= 90  # افزایش محدوده روشنایی
+        is_resolution_ok = resolution >= 300  # کاهش حداقل رزولوشن
+
+        return {
+            "is_blurry": is_blurry,
+            "blur_score": blur_score,
+            "face_detected": face_detected,
+            "brightness": brightness,
+            "resolution": resolution,
+            # >1 when decoded at reduced size to fit the memory budget; the
+            # blur score was then measured on the reduced image
+            "reduction": plan.reduction,
+            "is_acceptable": (
+                not is_blurry  # تصویر نباید خیلی تار باشد
+                and face_detected  # باید چهره در تصویر وجود داشته باشد
+                and is_brightness_ok  # روشنایی باید در محدوده مناسب باشد
+                and is_resolution_ok  # حداقل رزولوشن 300 پیکسل
+            ),
+        }
 
+    @traced("quality.blur")
     def _check_blur(self, image: np.ndarray) -> float:
         """
         بررسی تار بودن تصویر با استفاده از لاپلاسین
@@ -64,6 +102,7 @@ class ImageQualityChecker:
         laplacian_var = cv2.Laplacian(gray, cv2.CV_64F, ksize=5).var()
         return laplacian_var
 
+    @traced("quality.haar_cascade")
     def _detect_face(self, image: np.ndarray) -> bool:
         """
         تشخیص وجود چهره در تصویر
@@ -79,6 +118,7 @@ class ImageQualityChecker:
         )
         return len(faces) > 0
 
+    @traced("quality.brightness")
     def _check_brightness(self, image: np.ndarray) -> float:
         """
         بررسی روشنایی تصویر
@@ -96,6 +136,7 @@ class ImageQualityChecker:
         )
         return float(np.average(gray, weights=weights))
 
+    @traced("quality.resolution")
     def _check_resolution(self, image: np.ndarray) -> int:
         """
         بررسی رزولوشن تصویر
@@ -104,5 +145,4 @@ class ImageQualityChecker:
         return min(width, height)
 
 
-# ایجاد یک نمونه از کلاس برای استفاده در برنامه
-image_quality_checker = ImageQualityChecker()
+# The shared instance is created on first use, see app.services.cv_loader
@@ -0,0 +1,287 @@
+import asyncio
+import logging
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from app.config import Settings, get_settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True, slots=True)
+class UserSnapshot:
+    """
+    نسخه سبک و فقط‌خواندنی از کاربر که در کش نگه داشته می‌شود.
+    Password hashes and tokens are deliberately left out.
+    """
+
+    id: int
+    username: str
+    mobile: Optional[str] = None
+    email: Optional[str] = None
+    firstname: Optional[str] = None
+    lastname: Optional[str] = None
+    is_active: bool = True
+    updated_at: Optional[datetime] = None
+
+    @classmethod
+    def from_row(cls, row) -> "UserSnapshot":
+        return cls(
+            id=row.id,
+            username=row.username,
+            mobile=row.mobile,
+            email=row.email,
+            firstname=row.firstname,
+            lastname=row.lastname,
+            is_active=bool(row.is_active),
+            updated_at=row.updated_at,
+        )
+
+
+InvalidationCallback = Callable[[int], Awaitable[None]]
+
+
+class InvalidationChannel(ABC):
+    """Fan-out of user ids whose cached snapshot must be dropped."""
+
+    @abstractmethod
+    async def start(self, callback: InvalidationCallback) -> None: ...
+
+    @abstractmethod
+    async def publish(self, user_id: int) -> None: ...
+
+    async def stop(self) -> None:
+        return None
+
+
+class LocalInvalidationChannel(InvalidationChannel):
+    """
+    In-process stand-in for the cross-worker channel.
+    Good enough for a single worker and for local tests.
+    """
+
+    def __init__(self) -> None:
+        self._subscribers: List[InvalidationCallback] = []
+
+    async def start(self, callback: InvalidationCallback) -> None:
+        self._subscribers.append(callback)
+
+    async def publish(self, user_id: int) -> None:
+        for callback in list(self._subscribers):
+            await callback(user_id)
+
+    async def stop(self) -> None:
+        self._subscribers.clear()
+
+
+class PostgresInvalidationChannel(InvalidationChannel):
+    """
+    Cross-worker invalidation over Postgres LISTEN/NOTIFY.
+    Uses two dedicated asyncpg connections so it never takes a slot from the pool.
+    """
+
+    def __init__(self, settings: Settings, channel: str = "user_cache_invalidate"):
+        self.settings = settings
+        self.channel = channel
+        self._listen_conn = None
+        self._notify_conn = None
+        self._notify_lock = asyncio.Lock()
+        self._callback: Optional[InvalidationCallback] = None
+
+    async def _connect(self):
+        import asyncpg
+
+        return await asyncpg.connect(
+            host=self.settings.POSTGRES_HOST,
+            port=self.settings.POSTGRES_PORT,
+            user=self.settings.POSTGRES_USER,
+            password=self.settings.POSTGRES_PASSWORD,
+            database=self.settings.POSTGRES_DB,
+        )
+
+    def _on_notify(self, connection, pid, channel, payload) -> None:
+        if self._callback is None:
+            return
+        try:
+            user_id = int(payload)
+        except ValueError:
+            logger.warning(f"Ignoring malformed invalidation payload: {payload!r}")
+            return
+        asyncio.get_running_loop().create_task(self._callback(user_id))
+
+    async def start(self, callback: InvalidationCallback) -> None:
+        self._callback = callback
+        self._listen_conn = await self._connect()
+        await self._listen_conn.add_listener(self.channel, self._on_notify)
+
+    async def publish(self, user_id: int) -> None:
+        async with self._notify_lock:
+            if self._notify_conn is None or self._notify_conn.is_closed():
+                self._notify_conn = await self._connect()
+            await self._notify_conn.execute(
+                "SELECT pg_notify($1, $2)", self.channel, str(user_id)
+            )
+
+    async def stop(self) -> None:
+        if self._listen_conn is not None:
+            await self._listen_conn.remove_listener(self.channel, self._on_notify)
+            await self._listen_conn.close()
+            self._listen_conn = None
+        if self._notify_conn is not None:
+            await self._notify_conn.close()
+            self._notify_conn = None
+
+
+class UserCache:
+    """
+    کش محدود (LRU + TTL) از UserSnapshot بر اساس شناسه کاربر.
+
+    All access happens on the event loop thread, so no locking is needed.
+    Concurrent misses for the same id share a single loader call.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 10000,
+        ttl_seconds: float = 60.0,
+        enabled: bool = True,
+        channel: Optional[InvalidationChannel] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+        self.channel = channel or LocalInvalidationChannel()
+        self._clock = clock
+        self._entries: "OrderedDict[int, tuple[float, UserSnapshot]]" = OrderedDict()
+        self._inflight: Dict[int, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> "UserCache":
+        if settings.USER_CACHE_INVALIDATION == "postgres":
+            channel: InvalidationChannel = PostgresInvalidationChannel(settings)
+        else:
+            channel = LocalInvalidationChannel()
+        return cls(
+            max_size=settings.USER_CACHE_MAX_SIZE,
+            ttl_seconds=settings.USER_CACHE_TTL_SECONDS,
+            enabled=settings.USER_CACHE_ENABLED,
+            channel=channel,
+        )
+
+    def get(self, user_id: int) -> Optional[UserSnapshot]:
+        if not self.enabled:
+            return None
+        entry = self._entries.get(user_id)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, snapshot = entry
+        if self._clock() >= expires_at:
+            del self._entries[user_id]
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(user_id)
+        self.hits += 1
+        return snapshot
+
+    def set(self, snapshot: UserSnapshot) -> None:
+        if not self.enabled:
+            return
+        self._entries[snapshot.id] = (self._clock() + self.ttl_seconds, snapshot)
+        self._entries.move_to_end(snapshot.id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def get_or_load(
+        self,
+        user_id: int,
+        loader: Callable[[int], Awaitable[Optional[UserSnapshot]]],
+    ) -> Optional[UserSnapshot]:
+        """Return the cached snapshot, calling ``loader`` once on a miss."""
+        if not self.enabled:
+            return await loader(user_id)
+
+        snapshot = self.get(user_id)
+        if snapshot is not None:
+            return snapshot
+
+        pending = self._inflight.get(user_id)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[user_id] = future
+        try:
+            snapshot = await loader(user_id)
+            # Only cache if nobody invalidated the id while we were loading
+            if snapshot is not None and self._inflight.get(user_id) is future:
+                self.set(snapshot)
+            future.set_result(snapshot)
+            return snapshot
+        except BaseException as e:
+            future.set_exception(e)
+            # Make sure an unobserved exception doesn't get logged by asyncio
+            future.exception()
+            raise
+        finally:
+            if self._inflight.get(user_id) is future:
+                del self._inflight[user_id]
+
+    def discard(self, user_id: int) -> None:
+        """Drop an entry locally without notifying other workers."""
+        if self._entries.pop(user_id, None) is not None:
+            self.invalidations += 1
+        self._inflight.pop(user_id, None)
+
+    async def invalidate(self, user_id: int) -> None:
+        """Drop an entry here and on every other worker."""
+        self.discard(user_id)
+        try:
+            await self.channel.publish(user_id)
+        except Exception as e:
+            logger.error(f"Failed to publish user cache invalidation: {e}")
+
+    async def _on_remote_invalidation(self, user_id: int) -> None:
+        self.discard(user_id)
+
+    async def start(self) -> None:
+        await self.channel.start(self._on_remote_invalidation)
+
+    async def stop(self) -> None:
+        await self.channel.stop()
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._inflight.clear()
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+            "pid": os.getpid(),
+        }
+
+
+# نمونه سراسری کش کاربران
+user_cache = UserCache.from_settings(get_settings())
@@ -1,70 +1,121 @@
 from app.models.user import User
 from app.models.user import UserPhoto
-from app.db.session import get_db
+from app.db.session import on_commit
 import sqlalchemy as sa
 from fastapi import HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import List, Dict, Any
+from typing import AsyncIterator, List, Dict, Any, Optional
 from pathlib import Path
 from datetime import datetime
+from app.services.cv_loader import get_face_checks
+from app.services.image_memory import ImageMemoryPlan, image_memory
+from app.services.user_cache import UserSnapshot, user_cache
 
+# فقط ستون‌هایی که در لیست کاربران نمایش داده می‌شوند (بدون رمز و توکن‌ها)
+USER_LIST_COLUMNS = (
+    User.id,
+    User.mobile,
+    User.firstname,
+    User.lastname,
+    User.email,
+    User.created_at,
+)
 
-async def count_users() -> int:
+
+def user_row_to_dict(row) -> Dict[str, Any]:
+    # datetimes are left to the JSON encoder (app.utils.fast_json)
+    return row._asdict()
+
+
+async def count_users(db: AsyncSession, estimate: bool = False) -> int:
     """
     تعداد کاربران موجود در دیتابیس را بازگرداند
+    With ``estimate`` on Postgres, reads the planner estimate from pg_class
+    instead of scanning the table.
     """
     try:
-        async with get_db() as session:
-            result = await session.execute(sa.select(sa.func.count()).select_from(User))
-            count = result.scalar()
-            return count
+        if estimate and db.get_bind().dialect.name == "postgresql":
+            result = await db.execute(
+                sa.text(
+                    "SELECT reltuples::bigint FROM pg_class "
+                    "WHERE oid = to_regclass(:table)"
+                ),
+                {"table": User.__tablename__},
+            )
+            estimated = result.scalar()
+            # reltuples is -1 (or missing) until the table has been analyzed
+            if estimated is not None and estimated >= 0:
+                return int(estimated)
+
+        result = await db.execute(sa.select(sa.func.count()).select_from(User))
+        count = result.scalar()
+        return count
     except Exception as e:
         print(f"Error counting users: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to count users: {str(e)}")
 
 
-async def get_all_users() -> List[Dict[str, Any]]:
+async def get_all_users(db: AsyncSession) -> List[Dict[str, Any]]:
     """
     لیست تمام کاربران موجود در دیتابیس را بازگرداند
+    Prefer list_users_page / stream_users for anything but small tables.
     """
     try:
-        async with get_db() as session:
-            result = await session.execute(sa.select(User))
-            users = result.scalars().all()
-
-            # Convert users to dict for response
-            users_list = []
-            for user in users:
-                created_at_str = None
-                if user.created_at:
-                    # Convert to string safely
-                    created_at_str = str(user.created_at)
-
-                users_list.append(
-                    {
-                        "id": user.id,
-                        "mobile": user.mobile,
-                        "firstname": user.firstname,
-                        "lastname": user.lastname,
-                        "email": user.email,
-                        "created_at": created_at_str,
-                    }
-                )
-
-            return users_list
+        result = await db.execute(sa.select(*USER_LIST_COLUMNS).order_by(User.id))
+        return [user_row_to_dict(row) for row in result]
     except Exception as e:
         print(f"Error listing users: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to list users: {str(e)}")
 
 
-async def get_user_by_id(user_id: int) -> User:
+async def list_users_page(
+    db: AsyncSession, after_id: int = 0, limit: int = 100
+) -> Dict[str, Any]:
+    """
+    یک صفحه از کاربران با صفحه‌بندی keyset روی id
+    Costs the same on page 1 and page 10,000, unlike OFFSET.
+    """
+    try:
+        result = await db.execute(
+            sa.select(*USER_LIST_COLUMNS)
+            .where(User.id > after_id)
+            .order_by(User.id)
+            .limit(limit)
+        )
+        items = [user_row_to_dict(row) for row in result]
+    except Exception as e:
+        print(f"Error listing users: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to list users: {str(e)}")
+
+    return {
+        "items": items,
+        "next_after_id": items[-1]["id"] if len(items) == limit else None,
+    }
+
+
+async def stream_users(
+    db: AsyncSession, batch_size: int = 1000
+) -> AsyncIterator[List[Dict[str, Any]]]:
+    """
+    همه کاربران را دسته به دسته با server-side cursor برمی‌گرداند
+    Only one batch is held in memory at a time.
+    """
+    result = await db.stream(
+        sa.select(*USER_LIST_COLUMNS)
+        .order_by(User.id)
+        .execution_options(yield_per=batch_size)
+    )
+    async for partition in result.partitions(batch_size):
+        yield [user_row_to_dict(row) for row in partition]
+
+
+async def get_user_by_id(user_id: int, db: AsyncSession) -> User:
     """
     اطلاعات یک کاربر را بر اساس آیدی بازگرداند
     """
     try:
-        async with get_db() as session:
-            result = await session.execute(sa.select(User).where(User.id == user_id))
-            user = result.scalars().first()
+        result = await db.execute(sa.select(User).where(User.id == user_id))
+        user = result.scalars().first()
 
         if not user:
             raise HTTPException(
@@ -79,89 +130,93 @@ async def get_user_by_id(user_id: int) -> User:
         raise HTTPException(status_code=500, detail=f"Failed to get user: {str(e)}")
 
 
-async def update_user_tokens_in_db(
-    user_id: int, access_token: str, refresh_token: str, token_expires_at=None
-) -> bool:
+async def load_user_snapshot(user_id: int, db: AsyncSession) -> Optional[UserSnapshot]:
     """
-    توکن‌های کاربر را در دیتابیس به‌روزرسانی کند
+    فقط ستون‌های مورد نیاز احراز هویت را می‌خواند (بدون رمز و توکن‌ها)
     """
-    try:
-        async with get_db() as session:
-            print(f"Updating tokens for user ID: {user_id}")
-
-            # First, get the user
-            result = await session.execute(sa.select(User).where(User.id == user_id))
-            user = result.scalars().first()
-
-            if not user:
-                print(f"User with ID {user_id} not found for token update")
-                return False
+    result = await db.execute(
+        sa.select(
+            User.id,
+            User.username,
+            User.mobile,
+            User.email,
+            User.firstname,
+            User.lastname,
+            User.is_active,
+            User.updated_at,
+        ).where(User.id == user_id)
+    )
+    row = result.first()
+    return UserSnapshot.from_row(row) if row else None
 
-            # Update tokens directly on the user object
-            user.access_token = access_token
-            user.refresh_token = refresh_token
 
-            if token_expires_at:
-                user.token_expires_at = token_expires_at
-
-            # Make sure to commit the changes
-            await session.commit()
-
-            # Verify the tokens were updated
-            result = await session.execute(sa.select(User).where(User.id == user_id))
-            updated_user = result.scalars().first()
+async def update_user_tokens_in_db(
+    db: AsyncSession,
+    user_id: int,
+    access_token: str,
+    refresh_token: str,
+    token_expires_at=None,
+) -> bool:
+    """
+    توکن‌های کاربر را با یک دستور UPDATE ... RETURNING ذخیره می‌کند
+    Runs inside the caller's transaction; committing is left to the request scope.
+    """
+    values = {"access_token": access_token, "refresh_token": refresh_token}
+    if token_expires_at:
+        values["token_expires_at"] = token_expires_at
 
-            if updated_user and updated_user.access_token == access_token:
-                print(f"Tokens successfully updated for user {user_id}")
-                return True
-            else:
-                print(f"Failed to update tokens for user {user_id}")
-                return False
-    except Exception as e:
-        print(f"Error updating tokens in database: {e}")
+    result = await db.execute(
+        sa.update(User).where(User.id == user_id).values(**values).returning(User.id)
+    )
+    if result.scalar_one_or_none() is None:
+        print(f"User with ID {user_id} not found for token update")
         return False
 
+    on_commit(db, lambda: user_cache.invalidate(user_id))
+    return True
 
-async def get_user_with_tokens(user_id: int) -> Dict[str, Any]:
+
+async def get_user_with_tokens(user_id: int, db: AsyncSession) -> Dict[str, Any]:
     """
     اطلاعات کاربر را همراه با توکن‌ها بازگرداند
     """
     try:
-        async with get_db() as session:
-            result = await session.execute(sa.select(User).where(User.id == user_id))
-            user = result.scalars().first()
-
-            if not user:
-                raise HTTPException(
-                    status_code=404, detail=f"User with ID {user_id} not found"
-                )
-
-            created_at_str = str(user.created_at) if user.created_at else None
-            token_expires_at_str = (
-                str(user.token_expires_at) if user.token_expires_at else None
-            )
+        result = await db.execute(
+            sa.select(
+                *USER_LIST_COLUMNS,
+                User.access_token,
+                User.refresh_token,
+                User.token_expires_at,
+            ).where(User.id == user_id)
+        )
+        user = result.first()
 
-            # Only return first 10 chars of tokens for security
-            access_token_preview = (
-                user.access_token[:10] + "..." if user.access_token else None
-            )
-            refresh_token_preview = (
-                user.refresh_token[:10] + "..." if user.refresh_token else None
+        if not user:
+            raise HTTPException(
+                status_code=404, detail=f"User with ID {user_id} not found"
             )
 
-            return {
-                "id": user.id,
-                "mobile": user.mobile,
-                "firstname": user.firstname,
-                "lastname": user.lastname,
-                "email": user.email,
-                "created_at": created_at_str,
-                "access_token_preview": access_token_preview,
-                "refresh_token_preview": refresh_token_preview,
-                "has_access_token": user.access_token is not None,
-                "has_refresh_token": user.refresh_token is not None,
-                "token_expires_at": token_expires_at_str,
-            }
+        # Only return first 10 chars of tokens for security
+        access_token_preview = (
+            user.access_token[:10] + "..." if user.access_token else None
+        )
+        refresh_token_preview = (
+            user.refresh_token[:10] + "..." if user.refresh_token else None
+        )
+
+        return {
+            "id": user.id,
+            "mobile": user.mobile,
+            "firstname": user.firstname,
+            "lastname": user.lastname,
+            "email": user.email,
+            "created_at": user.created_at,
+            "access_token_preview": access_token_preview,
+            "refresh_token_preview": refresh_token_preview,
+            "has_access_token": user.access_token is not None,
+            "has_refresh_token": user.refresh_token is not None,
+            "token_expires_at": user.token_expires_at,
+        }
     except HTTPException:
         raise
     except Exception as e:
@@ -171,13 +226,65 @@ async def get_user_with_tokens(user_id: int) -> Dict[str, Any]:
         )
 
 
-async def insert_user_photo_in_db(user_id: int, photo_path: str) -> bool:
+def store_user_photo(
+    user_id: int, contents: bytes, plan: Optional[ImageMemoryPlan] = None
+) -> str:
+    """
+    کنترل کیفیت و ذخیره‌ی عکس کاربر روی دیسک؛ مسیر فایل را برمی‌گرداند
+    CPU-bound and blocking (decode, blur, FaceMesh, imwrite); shared by
+    upload_photo and the bulk importer, which runs it on a thread pool.
+    Without a ``plan`` the memory budget is checked here; avatars over it
+    are always rejected (413), never decoded at reduced size.
+    """
+    face_checks = get_face_checks()
+    plan = plan or image_memory.plan("avatar", contents)
+
+    with plan.measure():
+        with plan.stage("decode"):
+            plan.bytes_decoded += len(contents)
+            image_np = face_checks.decode_image(contents, plan.decode_flags)
+            if image_np is not None:
+                image_np = plan.decoded(image_np)
+        if image_np is None:
+            raise HTTPException(status_code=400, detail="تصویر نامعتبر است")
+
+        # کنترل کیفیت با حساسیت کمتر
+        with plan.stage("blur"):
+            blurry = face_checks.is_blurry(image_np)
+        if blurry:
+            raise HTTPException(
+                status_code=400,
+                detail="عکس کمی تار است، لطفا عکس واضح‌تری انتخاب کنید",
+            )
+        with plan.stage("face_mesh"):
+            plan.detectors.append("face_mesh")
+            frontal = face_checks.is_frontal_face(image_np)
+        if not frontal:
+            raise HTTPException(
+                status_code=400, detail="لطفا عکس را با زاویه مناسب‌تری بگیرید"
+            )
+
+        # ایجاد پوشه مخصوص کاربر
+        user_dir = Path(f"media/avatars/user_{user_id}")
+        user_dir.mkdir(parents=True, exist_ok=True)
+
+        # ذخیره عکس در پوشه کاربر
+        filename = f"{int(datetime.now().timestamp())}.jpg"
+        file_path = user_dir / filename
+        with plan.stage("imwrite"):
+            face_checks.save_image(str(file_path), image_np)
+    return str(file_path)
+
+
+async def insert_user_photo_in_db(
+    user_id: int, photo_path: str, db: AsyncSession
+) -> bool:
     try:
-        async with get_db() as session:
-            new_photo = UserPhoto(user_id=user_id, image_path=photo_path)
-            session.add(new_photo)
-            await session.commit()
-            return True
+        new_photo = UserPhoto(user_id=user_id, image_path=photo_path)
+        db.add(new_photo)
+        # The request-scoped session commits once the handler returns
+        await db.flush()
+        return True
     except Exception as e:
         print(f"Error inserting user photo in database: {e}")
         return False
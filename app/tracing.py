@@ -0,0 +1,209 @@
+"""
+ردیابی سبک درخواست‌ها (request tracing) با نمونه‌برداری در ابتدای درخواست
+
+A request is sampled once, when it starts (TRACING_SAMPLE_RATE). Unsampled
+requests, and everything when TRACING_ENABLED is off, pay one ContextVar
+lookup per span. Sampled traces are handed to a writer thread and appended
+to TRACING_FILE in the Chrome trace event format, which chrome://tracing,
+Perfetto (ui.perfetto.dev) and speedscope open directly. Each trace gets its
+own row (tid), nested spans show up as children of the span enclosing them.
+"""
+
+import functools
+import itertools
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from app.config import Settings, get_settings
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class Span:
+    __slots__ = ("trace", "name", "span_id", "parent_id", "start_ns", "end_ns", "attrs")
+
+    def __init__(self, trace: "Trace", name: str, parent_id: int, attrs: dict):
+        self.trace = trace
+        self.name = name
+        self.span_id = next(trace.ids)
+        self.parent_id = parent_id
+        self.attrs = attrs
+        self.start_ns = time.perf_counter_ns()
+        self.end_ns = 0
+
+    def finish(self) -> None:
+        self.end_ns = time.perf_counter_ns()
+        self.trace.spans.append(self)
+
+
+class Trace:
+    __slots__ = ("trace_id", "spans", "ids")
+
+    def __init__(self, trace_id: int):
+        self.trace_id = trace_id
+        self.spans: List[Span] = []
+        self.ids = itertools.count(1)
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+class Tracer:
+    def __init__(
+        self,
+        enabled: bool = False,
+        sample_rate: float = 0.01,
+        path: str = "logs/traces-{pid}.json",
+    ):
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.path = path
+        self._trace_ids = itertools.count(1)
+        self._queue: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self.sampled = 0
+        self.exported_spans = 0
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> "Tracer":
+        return cls(
+            enabled=settings.TRACING_ENABLED,
+            sample_rate=settings.TRACING_SAMPLE_RATE,
+            path=settings.TRACING_FILE,
+        )
+
+    @contextmanager
+    def start_trace(self, name: str, **attrs):
+        """Root span of a request; yields None when the request is not sampled"""
+        if not self.enabled or random.random() >= self.sample_rate:
+            yield None
+            return
+        self.sampled += 1
+        root = Span(Trace(next(self._trace_ids)), name, 0, attrs)
+        token = _current_span.set(root)
+        try:
+            yield root
+        except BaseException as e:
+            root.attrs["error"] = type(e).__name__
+            raise
+        finally:
+            _current_span.reset(token)
+            root.finish()
+            self._queue.put(root.trace)
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        parent = _current_span.get()
+        if parent is None:
+            yield None
+            return
+        child = Span(parent.trace, name, parent.span_id, attrs)
+        token = _current_span.set(child)
+        try:
+            yield child
+        except BaseException as e:
+            child.attrs["error"] = type(e).__name__
+            raise
+        finally:
+            _current_span.reset(token)
+            child.finish()
+
+    def traced(self, name: str):
+        """Decorator form of span() for plain (sync) functions"""
+
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if _current_span.get() is None:
+                    return fn(*args, **kwargs)
+                with self.span(name):
+                    return fn(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    # ── DB instrumentation (SQLAlchemy cursor events) ──
+    def before_cursor_execute(
+        self, conn, cursor, statement, parameters, context, executemany
+    ):
+        parent = _current_span.get()
+        if parent is not None and context is not None:
+            context._trace_span = Span(
+                parent.trace, "db.query", parent.span_id, {"sql": statement[:200]}
+            )
+
+    def after_cursor_execute(
+        self, conn, cursor, statement, parameters, context, executemany
+    ):
+        span = getattr(context, "_trace_span", None)
+        if span is not None:
+            span.finish()
+            context._trace_span = None
+
+    # ── export ──
+    def _events(self, trace: Trace) -> List[Dict]:
+        pid = os.getpid()
+        return [
+            {
+                "name": span.name,
+                "cat": span.name.split(".", 1)[0],
+                "ph": "X",
+                "ts": span.start_ns / 1000,
+                "dur": (span.end_ns - span.start_ns) / 1000,
+                "pid": pid,
+                "tid": trace.trace_id,
+                "args": {**span.attrs, "span": span.span_id, "parent": span.parent_id},
+            }
+            for span in sorted(trace.spans, key=lambda s: s.start_ns)
+        ]
+
+    def _write_loop(self) -> None:
+        path = Path(self.path.format(pid=os.getpid()))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            # The trace event format allows the closing "]" to be missing, so
+            # the file stays valid while it grows
+            if f.tell() == 0:
+                f.write("[\n")
+            while True:
+                trace = self._queue.get()
+                if trace is _STOP:
+                    break
+                try:
+                    for event in self._events(trace):
+                        f.write(json.dumps(event, default=str) + ",\n")
+                        self.exported_spans += 1
+                    f.flush()
+                except Exception as e:
+                    logger.error(f"Could not export trace: {e}")
+
+    def start(self) -> None:
+        if self.enabled and self._thread is None:
+            self._thread = threading.Thread(
+                target=self._write_loop, name="trace-writer", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join(timeout=5)
+            self._thread = None
+
+
+# نمونه سراسری
+tracer = Tracer.from_settings(get_settings())
+span = tracer.span
+traced = tracer.traced
@@ -0,0 +1,58 @@
+"""
+سریال‌سازی سریع پاسخ‌ها با orjson
+
+Handlers that build their payload from column tuples or dicts return
+``FastJSONResponse`` directly, which skips FastAPI's response-model
+validation and ``jsonable_encoder`` pass; ``response_model`` stays on the
+route for the OpenAPI schema. datetime/date/UUID/dataclasses are encoded by
+orjson itself (RFC 3339, e.g. ``2024-05-01T12:30:00``).
+
+Large bodies are produced chunk by chunk with ``json_array_chunks`` /
+``ndjson_chunks`` and a ``StreamingResponse``.
+"""
+
+from typing import Any, AsyncIterable, AsyncIterator, Iterable, Sequence
+
+import orjson
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, BaseModel):
+        return value.model_dump()
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(content, default=_default, option=OPTIONS)
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def pick(obj: Any, fields: Sequence[str]) -> dict:
+    """The response model's fields read straight off a row / snapshot"""
+    return {name: getattr(obj, name) for name in fields}
+
+
+async def json_array_chunks(items: AsyncIterable[Any]) -> AsyncIterator[bytes]:
+    """A JSON array written one element per chunk"""
+    separator = b"["
+    async for item in items:
+        yield separator + dumps(item)
+        separator = b","
+    yield b"[]" if separator == b"[" else b"]"
+
+
+def ndjson_chunks(batch: Iterable[Any]) -> bytes:
+    return b"".join(
+        orjson.dumps(item, default=_default, option=OPTIONS | orjson.OPT_APPEND_NEWLINE)
+        for item in batch
+    )
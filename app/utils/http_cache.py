@@ -0,0 +1,46 @@
+"""
+درخواست‌های شرطی (ETag / If-None-Match) برای داده‌هایی که کم تغییر می‌کنند
+
+ETags are weak and built from cheap version markers (updated_at, file
+names/sizes/mtimes), never from the response body, so a matching
+If-None-Match is answered with 304 before the expensive work starts.
+Responses are per user, hence ``private``; ``no-cache`` makes clients
+revalidate on every poll, which now costs a header round trip.
+"""
+
+import hashlib
+from typing import Optional
+
+from fastapi import Request, Response
+
+CACHE_CONTROL = "private, no-cache"
+
+
+def make_etag(*parts: object) -> str:
+    digest = hashlib.blake2b(
+        "\x1f".join(str(part) for part in parts).encode(), digest_size=12
+    ).hexdigest()
+    return f'W/"{digest}"'
+
+
+def _opaque(tag: str) -> str:
+    # If-None-Match uses weak comparison: W/"x" matches "x"
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header: Optional[str] = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    wanted = _opaque(etag)
+    return any(_opaque(tag.strip()) == wanted for tag in header.split(","))
+
+
+def cache_headers(etag: str) -> dict:
+    return {"ETag": etag, "Cache-Control": CACHE_CONTROL, "Vary": "Authorization"}
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers=cache_headers(etag))
@@ -0,0 +1,179 @@
+"""
+لاگ‌گیری غیرمسدودکننده: رکوردها در صف قرار می‌گیرند و یک thread جداگانه
+آن‌ها را در کنسول و فایل می‌نویسد
+
+Request handlers only pay for building the record and a queue put; all
+formatting to text and disk/console I/O happens on the QueueListener thread.
+"""
+
+import json
+import logging
+import queue
+import random
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Optional
+
+from app.config import Settings
+
+# Never written to the logs, even if someone adds them to the allowlist
+SENSITIVE_HEADERS = frozenset(
+    {"authorization", "cookie", "set-cookie", "proxy-authorization", "x-api-key"}
+)
+
+# Attributes every LogRecord has; anything else came in through ``extra=``
+_RECORD_ATTRS = frozenset(logging.LogRecord("", 0, "", 0, "", None, None).__dict__) | {
+    "message",
+    "asctime",
+    "taskName",
+}
+
+
+class JsonFormatter(logging.Formatter):
+    """One compact JSON object per line; ``extra=`` fields become top-level keys"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(
+                timespec="milliseconds"
+            ),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                data[key] = value
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data["exc"] = record.exc_text
+        return json.dumps(data, ensure_ascii=False, default=str, separators=(",", ":"))
+
+
+class _QueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Unlike the stock prepare(), leave formatting to the listener thread;
+        # only the traceback must be rendered here (it references live frames)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def build_formatter(settings: Settings) -> logging.Formatter:
+    if settings.LOG_FORMAT == "text":
+        return logging.Formatter(
+            "%(asctime)s - %(levelname)s - %(name)s - %(message)s",
+            datefmt="%Y-%m-%d %H:%M:%S",
+        )
+    return JsonFormatter()
+
+
+def setup_logging(settings: Settings) -> QueueListener:
+    """
+    لاگرهای "app" را به صف متصل می‌کند و listener را (بدون start) برمی‌گرداند
+    Calling it again replaces the previous queue handler instead of adding one.
+    """
+    formatter = build_formatter(settings)
+    handlers = [logging.StreamHandler()]
+    if settings.LOG_FILE:
+        handlers.append(
+            RotatingFileHandler(
+                settings.LOG_FILE,
+                maxBytes=10 * 1024 * 1024,  # 10 مگابایت
+                backupCount=5,  # تعداد فایل‌های پشتیبان
+                encoding="utf-8",
+            )
+        )
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    app_logger = logging.getLogger("app")
+    for handler in list(app_logger.handlers):
+        if isinstance(handler, QueueHandler):
+            app_logger.removeHandler(handler)
+    app_logger.addHandler(_QueueHandler(log_queue))
+    app_logger.setLevel(settings.LOG_LEVEL.upper())
+    app_logger.propagate = False
+
+    return QueueListener(log_queue, *handlers, respect_handler_level=True)
+
+
+class AccessLog:
+    """
+    یک خط JSON برای هر درخواست
+    Requests that end with status >= 400 or an exception are always logged,
+    successful ones with probability ``sample_rate``. Only allowlisted
+    headers are included.
+    """
+
+    def __init__(self, sample_rate: float = 1.0, headers: tuple = ()):
+        self.sample_rate = sample_rate
+        self.headers = tuple(
+            h.strip().lower()
+            for h in headers
+            if h.strip() and h.strip().lower() not in SENSITIVE_HEADERS
+        )
+        self.logger = logging.getLogger("app.access")
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> "AccessLog":
+        return cls(
+            sample_rate=settings.LOG_SUCCESS_SAMPLE_RATE,
+            headers=tuple(settings.LOG_HEADER_ALLOWLIST.split(",")),
+        )
+
+    def log(
+        self,
+        request,
+        status_code: int,
+        duration: float,
+        db_stats=None,
+        error: Optional[BaseException] = None,
+    ) -> None:
+        failed = error is not None or status_code >= 400
+        if not failed and (
+            self.sample_rate <= 0 or random.random() >= self.sample_rate
+        ):
+            return
+
+        fields = {
+            "method": request.method,
+            "path": request.url.path,
+            "status": status_code,
+            "duration_ms": round(duration * 1000, 2),
+            "client": request.client.host if request.client else None,
+        }
+        if db_stats is not None:
+            fields["db_checkouts"] = db_stats.checkouts
+            fields["db_queries"] = db_stats.queries
+        if self.headers:
+            fields["headers"] = {
+                name: request.headers[name]
+                for name in self.headers
+                if name in request.headers
+            }
+        if not failed:
+            fields["sampled"] = self.sample_rate
+
+        message = (
+            f"{request.method} {request.url.path} {status_code} "
+            f"{fields['duration_ms']}ms"
+        )
+        if error is not None:
+            self.logger.error(
+                f"{message} {type(error).__name__}: {error}",
+                extra=fields,
+                exc_info=error,
+            )
+        elif status_code >= 500:
+            self.logger.error(message, extra=fields)
+        elif status_code >= 400:
+            self.logger.warning(message, extra=fields)
+        else:
+            self.logger.info(message, extra=fields)
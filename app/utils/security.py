@@ -2,18 +2,33 @@ from typing_extensions import Annotated
 
 
 from datetime import datetime, timedelta
-from jose import jwt, JWTError
+from jose import jwt, JWTError, ExpiredSignatureError
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
-from typing import Union, Optional
+from typing import Callable, Union, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
 
 from app.config import Settings
 
 from random import randint
 from app.db.session import get_db
 from app.config import get_settings
+from app.utils.token_cache import token_cache, token_digest
+from app.profiling import profiler
+from app.tracing import span
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+settings = get_settings()
+
+# Pinning min and max rounds to the configured cost makes needs_update() flag
+# hashes made with any other cost, so they get rehashed on the next login.
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__min_rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__max_rounds=settings.BCRYPT_ROUNDS,
+)
 
 
 def hash_password(password: str) -> str:
@@ -26,6 +41,97 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 
+class PasswordHasher:
+    """
+    اجرای bcrypt روی یک thread pool محدود تا event loop مسدود نشود.
+
+    bcrypt releases the GIL, so a small thread pool gives real parallelism.
+    At most ``max_workers + queue_limit`` calls are admitted at once; beyond
+    that callers get a fast 503 with Retry-After instead of queueing forever.
+    """
+
+    def __init__(
+        self, context: CryptContext, max_workers: int = 2, queue_limit: int = 16
+    ):
+        self.context = context
+        self.max_workers = max_workers
+        self.queue_limit = queue_limit
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pending = 0
+        self.rejected = 0
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix="bcrypt"
+            )
+        return self._executor
+
+    @property
+    def queue_depth(self) -> int:
+        return max(self._pending - self.max_workers, 0)
+
+    async def _run(self, fn: Callable, *args):
+        if self._pending >= self.max_workers + self.queue_limit:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="سرور در حال حاضر مشغول است، لطفا چند لحظه دیگر تلاش کنید",
+                headers={"Retry-After": "1"},
+            )
+        self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            # Includes time spent queued for a free bcrypt thread
+            with span(f"bcrypt.{fn.__name__}", queued=self.queue_depth):
+                return await loop.run_in_executor(
+                    self.executor, profiler.bind(fn), *args
+                )
+        finally:
+            self._pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self.context.hash, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(self.context.verify, plain_password, hashed_password)
+
+    async def verify_and_update(
+        self, plain_password: str, hashed_password: str
+    ) -> Tuple[bool, Optional[str]]:
+        """Returns (valid, new_hash); new_hash is set when the stored cost is stale"""
+        return await self._run(
+            self.context.verify_and_update, plain_password, hashed_password
+        )
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.max_workers,
+            "in_flight": self._pending,
+            "queue_depth": self.queue_depth,
+            "queue_limit": self.queue_limit,
+            "rejected": self.rejected,
+        }
+
+    def reset_after_fork(self) -> None:
+        """Forget the parent's executor; its threads do not exist in a forked child"""
+        self._executor = None
+        self._pending = 0
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+password_hasher = PasswordHasher(
+    pwd_context,
+    max_workers=settings.PASSWORD_HASH_WORKERS,
+    queue_limit=settings.PASSWORD_HASH_QUEUE_LIMIT,
+)
+
+
 def create_access_token(
     data: dict,
     settings: Annotated[Settings, Depends(get_settings)],
@@ -41,6 +147,28 @@ def create_access_token(
     return encoded_jwt
 
 
+def verify_access_token(token: str, settings: Settings) -> dict:
+    """
+    Verify a JWT and return its claims, using the verified-token cache
+    Raises JWTError if the token is invalid, expired or revoked
+    """
+    with span("auth.jwt_verify") as current:
+        digest = token_digest(token)
+        if token_cache.is_revoked(digest):
+            raise JWTError("Token has been revoked")
+
+        claims = token_cache.get(digest)
+        if current is not None:
+            current.attrs["cached"] = claims is not None
+        if claims is not None:
+            return claims
+
+        # jwt.decode already rejects tokens whose exp has passed
+        claims = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        token_cache.put(digest, claims)
+        return claims
+
+
 def decode_access_token(token: str, settings: Settings) -> dict:
     """
     Decode and validate JWT token
@@ -59,9 +187,7 @@ def decode_access_token(token: str, settings: Settings) -> dict:
         if token.startswith("Bearer "):
             token = token.split(" ")[1]
 
-        payload = jwt.decode(
-            token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM]
-        )
+        payload = verify_access_token(token, settings)
 
         # Validate required fields
         if not payload.get("sub"):
@@ -71,17 +197,14 @@ def decode_access_token(token: str, settings: Settings) -> dict:
                 headers={"WWW-Authenticate": "Bearer"},
             )
 
-        # Check expiration
-        exp = payload.get("exp")
-        if exp and datetime.now() > datetime.fromtimestamp(exp):
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Token has expired",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-
-        return payload
+        return dict(payload)
 
+    except ExpiredSignatureError:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token has expired",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
     except JWTError as e:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -0,0 +1,147 @@
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+from app.config import Settings, get_settings
+
+logger = logging.getLogger(__name__)
+
+RevocationHook = Callable[[bytes, Optional[str]], None]
+
+
+def token_digest(token: str) -> bytes:
+    return hashlib.sha256(token.encode("utf-8")).digest()
+
+
+class VerifiedTokenCache:
+    """
+    کش توکن‌های JWT که امضای آن‌ها قبلا بررسی شده است.
+
+    Maps sha256(token) to the verified claims until the token's ``exp``, so a
+    burst of requests with the same bearer token only pays for one HMAC check
+    and one JSON parse. Returned claims are shared; treat them as read-only.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 10000,
+        enabled: bool = True,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.max_size = max_size
+        self.enabled = enabled
+        self._clock = clock
+        self._entries: "OrderedDict[bytes, tuple[float, dict]]" = OrderedDict()
+        # digest -> exp, kept until the token would have expired anyway
+        self._revoked: Dict[bytes, float] = {}
+        self._hooks: List[RevocationHook] = []
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.revocations = 0
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> "VerifiedTokenCache":
+        return cls(
+            max_size=settings.TOKEN_CACHE_MAX_SIZE,
+            enabled=settings.TOKEN_CACHE_ENABLED,
+        )
+
+    def get(self, digest: bytes) -> Optional[dict]:
+        if not self.enabled:
+            return None
+        entry = self._entries.get(digest)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, claims = entry
+        if self._clock() >= expires_at:
+            del self._entries[digest]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(digest)
+        self.hits += 1
+        return claims
+
+    def put(self, digest: bytes, claims: dict) -> None:
+        exp = claims.get("exp")
+        # Tokens without exp are never cached, they would live forever
+        if not self.enabled or not isinstance(exp, (int, float)):
+            return
+        self._entries[digest] = (float(exp), claims)
+        self._entries.move_to_end(digest)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def is_revoked(self, digest: bytes) -> bool:
+        if not self._revoked:
+            return False
+        exp = self._revoked.get(digest)
+        if exp is None:
+            return False
+        if self._clock() >= exp:
+            del self._revoked[digest]
+            return False
+        return True
+
+    def revoke(self, token: str, exp: Optional[float] = None) -> None:
+        """
+        ابطال یک توکن پیش از انقضای آن
+        ``exp`` defaults to the cached claims' exp, or one day from now.
+        """
+        digest = token_digest(token)
+        entry = self._entries.pop(digest, None)
+        sub = None
+        if entry is not None:
+            exp = exp or entry[0]
+            sub = entry[1].get("sub")
+        self._revoked[digest] = float(exp or self._clock() + 86400)
+        self.revocations += 1
+        self._purge_revoked()
+        for hook in list(self._hooks):
+            try:
+                hook(digest, sub)
+            except Exception as e:
+                logger.error(f"Token revocation hook failed: {e}")
+
+    def drop_subject(self, sub: str) -> int:
+        """Forget every cached token of a subject; they are re-verified next time."""
+        stale = [
+            d for d, (_, claims) in self._entries.items() if claims.get("sub") == sub
+        ]
+        for digest in stale:
+            del self._entries[digest]
+        return len(stale)
+
+    def add_revocation_hook(self, hook: RevocationHook) -> None:
+        """Register a callback run after every revoke(), e.g. to fan out to other workers."""
+        self._hooks.append(hook)
+
+    def _purge_revoked(self) -> None:
+        now = self._clock()
+        for digest in [d for d, exp in self._revoked.items() if exp <= now]:
+            del self._revoked[digest]
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            "evictions": self.evictions,
+            "revocations": self.revocations,
+            "revoked": len(self._revoked),
+        }
+
+
+# نمونه سراسری کش توکن‌ها
+token_cache = VerifiedTokenCache.from_settings(get_settings())
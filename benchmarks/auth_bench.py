@@ -0,0 +1,193 @@
+"""
+micro-benchmark مسیر داغ احراز هویت
+
+Covers token creation/verification, bcrypt at several costs, the
+get_token_claims -> get_current_user dependency chain with a stubbed DB
+session, and the whole create_tokens path. No database or server needed.
+
+Usage:
+    python benchmarks/auth_bench.py                     # compare to baseline
+    python benchmarks/auth_bench.py --save-baseline     # record this machine
+    python benchmarks/auth_bench.py --filter jwt --json out.json
+    python -m benchmarks.auth_bench                     # same, as a module
+
+Exits with status 1 when a benchmark regressed against the baseline.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import sys
+from collections import namedtuple
+from datetime import timedelta
+from pathlib import Path
+from types import SimpleNamespace
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from passlib.context import CryptContext  # noqa: E402
+
+from app.config import get_settings  # noqa: E402
+from app.services.auth import (  # noqa: E402
+    create_tokens,
+    get_current_user,
+    get_token_claims,
+)
+from app.services.user_cache import user_cache  # noqa: E402
+from app.utils.security import (  # noqa: E402
+    create_access_token,
+    create_refresh_token,
+    decode_access_token,
+)
+from app.utils.token_cache import token_cache  # noqa: E402
+
+from benchmarks.harness import (  # noqa: E402
+    Runner,
+    compare,
+    load_baseline,
+    results_json,
+    save_baseline,
+)
+
+BASELINE = Path(__file__).resolve().parent / "baselines" / "auth.json"
+BCRYPT_COSTS = (4, 10, 12)
+
+UserRow = namedtuple(
+    "UserRow",
+    "id username mobile email firstname lastname is_active updated_at",
+)
+
+
+class StubResult:
+    def __init__(self, row):
+        self._row = row
+
+    def first(self):
+        return self._row
+
+    def scalar_one_or_none(self):
+        return self._row.id if self._row else None
+
+
+class StubSession:
+    """Just enough of AsyncSession for the auth services, without a database"""
+
+    def __init__(self, row):
+        self.row = row
+
+    @property
+    def info(self) -> dict:
+        # Fresh per access so on_commit callbacks do not pile up between ops
+        return {}
+
+    async def execute(self, statement, *args, **kwargs):
+        return StubResult(self.row)
+
+    def in_transaction(self) -> bool:
+        return False
+
+
+def register(runner: Runner) -> None:
+    settings = get_settings()
+    claims = {"sub": "1", "username": "bench", "scopes": ["user"]}
+    token = create_access_token(claims, settings, timedelta(minutes=30))
+    bearer = f"Bearer {token}"
+    row = UserRow(1, "bench", None, None, "Bench", "User", True, None)
+    db = StubSession(row)
+    user = SimpleNamespace(id=1, username="bench", mobile=None)
+
+    runner.bench(
+        "jwt.create_access_token",
+        lambda: create_access_token(claims, settings, timedelta(minutes=30)),
+    )
+    runner.bench(
+        "jwt.create_refresh_token",
+        lambda: create_refresh_token(claims, settings, None),
+    )
+
+    def decode_cold():
+        token_cache.clear()
+        decode_access_token(token, settings)
+
+    runner.bench("jwt.decode_access_token.cold", decode_cold)
+    runner.bench(
+        "jwt.decode_access_token.cached",
+        lambda: decode_access_token(token, settings),
+        setup=lambda: decode_access_token(token, settings),
+    )
+
+    for cost in BCRYPT_COSTS:
+        context = CryptContext(schemes=["bcrypt"], bcrypt__rounds=cost)
+        hashed = context.hash("correct horse battery staple")
+        runner.bench(
+            f"bcrypt.hash.rounds={cost}",
+            lambda c=context: c.hash("correct horse battery staple"),
+        )
+        runner.bench(
+            f"bcrypt.verify.rounds={cost}",
+            lambda c=context, h=hashed: c.verify("correct horse battery staple", h),
+        )
+
+    async def current_user_cached():
+        await get_current_user(await get_token_claims(bearer, settings), db)
+
+    async def current_user_uncached():
+        user_cache.discard(1)
+        await get_current_user(await get_token_claims(bearer, settings), db)
+
+    runner.bench("auth.get_current_user.cached", current_user_cached)
+    runner.bench("auth.get_current_user.db_stub", current_user_uncached)
+
+    async def tokens():
+        await create_tokens(user, db)
+
+    runner.bench("auth.create_tokens", tokens)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--filter", help="only run benchmarks containing this")
+    parser.add_argument("--round-time", type=float, default=0.2)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--baseline", type=Path, default=BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--threshold", type=float, default=0.15)
+    parser.add_argument("--json", dest="json_path")
+    args = parser.parse_args()
+
+    runner = Runner(
+        round_time=args.round_time,
+        repeat=args.repeat,
+        name_filter=args.filter,
+        out=sys.stdout,
+    )
+    # create_tokens prints on every call; keep the report readable
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        register(runner)
+    runner.close()
+
+    if args.json_path:
+        Path(args.json_path).write_text(
+            json.dumps(results_json(runner.results), indent=2)
+        )
+    if args.save_baseline:
+        save_baseline(args.baseline, runner.results)
+        print(f"baseline written to {args.baseline}")
+        return
+
+    baseline = load_baseline(args.baseline)
+    if not baseline:
+        print(f"no baseline at {args.baseline}; run with --save-baseline first")
+        return
+    regressions = compare(runner.results, baseline, time_threshold=args.threshold)
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    if regressions:
+        sys.exit(1)
+    print("no regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""
+هارنس ساده‌ی micro-benchmark: ns/op، تخصیص حافظه و مقایسه با baseline
+
+Each benchmark is calibrated so one round takes about ``round_time``
+seconds, then timed for ``repeat`` rounds; the median round is reported.
+Allocations are measured in a separate pass under tracemalloc (which slows
+code down a lot, so it never overlaps the timing pass):
+
+    peak_bytes      peak traced memory above the starting point during one op
+    retained_bytes  memory still held after ``alloc_ops`` ops, per op (leaks)
+
+A baseline is a JSON file {name: {"ns_per_op": .., "peak_bytes": ..}};
+numbers are machine specific, so record it on the machine that compares.
+"""
+
+import asyncio
+import gc
+import inspect
+import json
+import statistics
+import sys
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, TextIO, Union
+
+Op = Callable[[], Union[None, Awaitable[None]]]
+
+
+@dataclass
+class Result:
+    name: str
+    ns_per_op: float
+    spread_pct: float
+    ops: int
+    peak_bytes: int
+    retained_bytes: float
+
+
+class Runner:
+    def __init__(
+        self,
+        round_time: float = 0.2,
+        repeat: int = 5,
+        alloc_ops: int = 200,
+        name_filter: Optional[str] = None,
+        out: Optional[TextIO] = None,
+    ):
+        self.round_time = round_time
+        self.repeat = repeat
+        self.alloc_ops = alloc_ops
+        self.name_filter = name_filter
+        # Bound now, so code under test may redirect sys.stdout
+        self.out = out or sys.stdout
+        self.loop = asyncio.new_event_loop()
+        self.results: List[Result] = []
+
+    def _call(self, fn: Op, n: int) -> float:
+        """Seconds to run fn n times; coroutines run on one shared loop"""
+        if inspect.iscoroutinefunction(fn):
+
+            async def batch():
+                start = time.perf_counter()
+                for _ in range(n):
+                    await fn()
+                return time.perf_counter() - start
+
+            return self.loop.run_until_complete(batch())
+        start = time.perf_counter()
+        for _ in range(n):
+            fn()
+        return time.perf_counter() - start
+
+    def _calibrate(self, fn: Op) -> int:
+        n = 1
+        while True:
+            elapsed = self._call(fn, n)
+            if elapsed >= self.round_time / 10 or n >= 1_000_000:
+                return max(1, int(n * self.round_time / max(elapsed, 1e-9)))
+            n *= 10
+
+    def _allocations(self, fn: Op, ops: int) -> tuple:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            self._call(fn, 1)  # first call may fill caches
+            base, _ = tracemalloc.get_traced_memory()
+            peaks = []
+            for _ in range(min(ops, 20)):
+                tracemalloc.reset_peak()
+                start, _ = tracemalloc.get_traced_memory()
+                self._call(fn, 1)
+                _, peak = tracemalloc.get_traced_memory()
+                peaks.append(peak - start)
+            self._call(fn, ops)
+            gc.collect()
+            current, _ = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        return int(statistics.median(peaks)), max(current - base, 0) / (ops + 20)
+
+    def bench(self, name: str, fn: Op, setup: Optional[Callable[[], None]] = None):
+        if self.name_filter and self.name_filter not in name:
+            return None
+        if setup is not None:
+            setup()
+        n = self._calibrate(fn)
+        rounds = [self._call(fn, n) / n * 1e9 for _ in range(self.repeat)]
+        median = statistics.median(rounds)
+        spread = (max(rounds) - min(rounds)) / median * 100 if median else 0.0
+        peak, retained = self._allocations(fn, min(self.alloc_ops, n * self.repeat))
+        result = Result(name, median, spread, n * self.repeat, peak, retained)
+        self.results.append(result)
+        print(format_result(result), file=self.out, flush=True)
+        return result
+
+    def close(self) -> None:
+        self.loop.close()
+
+
+def format_ns(ns: float) -> str:
+    for unit, scale in (("s", 1e9), ("ms", 1e6), ("µs", 1e3)):
+        if ns >= scale:
+            return f"{ns / scale:.2f}{unit}"
+    return f"{ns:.0f}ns"
+
+
+def format_result(r: Result) -> str:
+    return (
+        f"{r.name:<40} {format_ns(r.ns_per_op):>10}/op ±{r.spread_pct:4.1f}%  "
+        f"peak {r.peak_bytes:>8} B  retained {r.retained_bytes:>7.1f} B/op"
+    )
+
+
+def load_baseline(path: Path) -> Dict[str, dict]:
+    return json.loads(path.read_text()) if path.exists() else {}
+
+
+def save_baseline(path: Path, results: List[Result]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    data = load_baseline(path)
+    data.update(
+        {
+            r.name: {"ns_per_op": round(r.ns_per_op, 1), "peak_bytes": r.peak_bytes}
+            for r in results
+        }
+    )
+    path.write_text(json.dumps(data, indent=2, sort_keys=True) + "\n")
+
+
+def compare(
+    results: List[Result],
+    baseline: Dict[str, dict],
+    time_threshold: float = 0.15,
+    alloc_threshold: float = 0.25,
+) -> List[str]:
+    """Human readable regressions; empty if everything is within thresholds"""
+    regressions = []
+    for r in results:
+        base = baseline.get(r.name)
+        if not base:
+            continue
+        change = r.ns_per_op / base["ns_per_op"] - 1
+        if change > time_threshold:
+            regressions.append(
+                f"{r.name}: {format_ns(base['ns_per_op'])} -> "
+                f"{format_ns(r.ns_per_op)} (+{change * 100:.0f}%)"
+            )
+        # Small absolute growth (a few objects) is noise, not a regression
+        allowed = base["peak_bytes"] * (1 + alloc_threshold) + 256
+        if r.peak_bytes > allowed:
+            regressions.append(
+                f"{r.name}: peak {base['peak_bytes']} B -> {r.peak_bytes} B"
+            )
+    return regressions
+
+
+def results_json(results: List[Result]) -> List[dict]:
+    return [asdict(r) for r in results]
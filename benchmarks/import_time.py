@@ -0,0 +1,109 @@
+"""
+گزارش زمان import برای سنجش cold start
+
+Runs `python -X importtime` in fresh interpreters and reports:
+  * auth_only  - `import main` (what a serverless /auth/token cold start pays)
+  * cv_preload - `import main` + loading OpenCV, MediaPipe and the Haar cascade
+  * top modules by cumulative import time for each scenario
+
+Usage:
+    python -m benchmarks.import_time [--repeat 5] [--top 15] [--json report.json]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+ROOT = Path(__file__).resolve().parent.parent
+
+SCENARIOS = {
+    "auth_only": "import main",
+    "cv_preload": "import main; from app.services import cv_loader; cv_loader.preload()",
+}
+
+
+def run_importtime(code: str) -> Tuple[float, List[Tuple[str, int, int]]]:
+    """Returns (total_ms, [(module, self_us, cumulative_us), ...])"""
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+
+    modules = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        modules.append((name.rstrip(), int(self_us), int(cumulative_us)))
+    # Top-level imports are the ones indented by a single space
+    total_us = sum(c for name, _, c in modules if not name.startswith("  "))
+    return total_us / 1000.0, modules
+
+
+def measure(code: str, repeat: int, top: int) -> Dict:
+    totals = []
+    modules: List[Tuple[str, int, int]] = []
+    for _ in range(repeat):
+        total_ms, modules = run_importtime(code)
+        totals.append(total_ms)
+    heaviest = sorted(modules, key=lambda m: m[2], reverse=True)[:top]
+    return {
+        "median_ms": round(statistics.median(totals), 1),
+        "min_ms": round(min(totals), 1),
+        "max_ms": round(max(totals), 1),
+        "runs": len(totals),
+        "top_cumulative": [
+            {"module": name.strip(), "cumulative_ms": round(cum / 1000.0, 1)}
+            for name, _, cum in heaviest
+        ],
+        "heavy_modules_loaded": sorted(
+            {
+                name.strip()
+                for name, _, _ in modules
+                if name.strip() in ("cv2", "mediapipe", "numpy")
+            }
+        ),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--json", dest="json_path")
+    args = parser.parse_args()
+
+    report = {
+        "python": sys.version.split()[0],
+        "scenarios": {
+            name: measure(code, args.repeat, args.top)
+            for name, code in SCENARIOS.items()
+        },
+    }
+
+    for name, result in report["scenarios"].items():
+        print(
+            f"{name:<12} median {result['median_ms']:>8.1f} ms "
+            f"(min {result['min_ms']:.1f}, max {result['max_ms']:.1f}, "
+            f"n={result['runs']})  heavy: {', '.join(result['heavy_modules_loaded']) or '-'}"
+        )
+        for module in result["top_cumulative"]:
+            print(f"    {module['cumulative_ms']:>8.1f} ms  {module['module']}")
+
+    if args.json_path:
+        Path(args.json_path).write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+هزینه‌ی سریال‌سازی پاسخ‌ها به ازای هر endpoint: قبل و بعد از fast_json
+
+"before" reproduces what FastAPI did with the old handlers: pydantic
+validation + serialization for routes with a response model, and
+jsonable_encoder + stdlib json for plain dicts. "after" is the
+app.utils.fast_json path the handlers use now. Payloads are synthetic but
+shaped like the real responses.
+
+Usage:
+    python benchmarks/serialization_bench.py [--filter users.list] [--json out.json]
+"""
+
+import argparse
+import base64
+import json
+import os
+import sys
+from collections import namedtuple
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+from pydantic import TypeAdapter  # noqa: E402
+
+from app.routers.auth import USER_RESPONSE_FIELDS  # noqa: E402
+from app.routers.user import ImageResponse  # noqa: E402
+from app.schemas.auth import TokenResponse, UserResponse  # noqa: E402
+from app.services.user_cache import UserSnapshot  # noqa: E402
+from app.utils.fast_json import dumps, ndjson_chunks, pick  # noqa: E402
+
+from benchmarks.harness import Runner, format_ns, results_json  # noqa: E402
+
+UserRow = namedtuple("UserRow", "id mobile firstname lastname email created_at")
+
+
+def old_user_row_to_dict(row) -> dict:
+    return {
+        "id": row.id,
+        "mobile": row.mobile,
+        "firstname": row.firstname,
+        "lastname": row.lastname,
+        "email": row.email,
+        "created_at": str(row.created_at) if row.created_at else None,
+    }
+
+
+def user_rows(count: int) -> List[UserRow]:
+    now = datetime.now()
+    return [
+        UserRow(
+            i,
+            f"0912{i:07d}",
+            "نام",
+            f"Lastname {i}",
+            f"user{i}@example.com",
+            now - timedelta(minutes=i),
+        )
+        for i in range(1, count + 1)
+    ]
+
+
+def plain_json(content) -> bytes:
+    """FastAPI's path for routes without a response model"""
+    return JSONResponse(jsonable_encoder(content)).body
+
+
+def cases():
+    snapshot = UserSnapshot(
+        id=1,
+        username="bench",
+        mobile="09120000000",
+        email="bench@example.com",
+        firstname="نام",
+        lastname="خانوادگی",
+        is_active=True,
+        updated_at=datetime.now(),
+    )
+    tokens = {
+        "access_token": "a" * 180,
+        "refresh_token": "r" * 180,
+        "token_type": "bearer",
+        "expires_at": datetime.now(),
+    }
+    user_adapter = TypeAdapter(UserResponse)
+    token_adapter = TypeAdapter(TokenResponse)
+    dict_adapter = TypeAdapter(dict)
+    images_adapter = TypeAdapter(List[ImageResponse])
+
+    def me_before():
+        model = UserResponse(**pick(snapshot, USER_RESPONSE_FIELDS))
+        user_adapter.dump_json(user_adapter.validate_python(model))
+
+    yield "auth.me", me_before, lambda: dumps(pick(snapshot, USER_RESPONSE_FIELDS))
+
+    def login_before():
+        model = TokenResponse(**tokens)
+        token_adapter.dump_json(token_adapter.validate_python(model))
+
+    yield "auth.login", login_before, lambda: dumps(tokens)
+
+    def register_before():
+        content = {
+            "user": UserResponse(**pick(snapshot, USER_RESPONSE_FIELDS)),
+            "tokens": TokenResponse(**tokens),
+        }
+        dict_adapter.dump_json(dict_adapter.validate_python(content))
+
+    yield "auth.register", register_before, lambda: dumps(
+        {"user": pick(snapshot, USER_RESPONSE_FIELDS), "tokens": tokens}
+    )
+
+    for size in (100, 1000):
+        rows = user_rows(size)
+
+        def list_before(rows=rows):
+            items = [old_user_row_to_dict(row) for row in rows]
+            plain_json({"items": items, "next_after_id": items[-1]["id"]})
+
+        def list_after(rows=rows):
+            items = [row._asdict() for row in rows]
+            dumps({"items": items, "next_after_id": items[-1]["id"]})
+
+        yield f"users.list[{size}]", list_before, list_after
+
+    batch = user_rows(1000)
+
+    def export_before():
+        "".join(
+            json.dumps(old_user_row_to_dict(row), ensure_ascii=False) + "\n"
+            for row in batch
+        )
+
+    def export_after():
+        ndjson_chunks([row._asdict() for row in batch])
+
+    yield "users.export[1000]", export_before, export_after
+
+    image_data = base64.b64encode(os.urandom(150_000)).decode()
+    images = [
+        {
+            "filename": f"{1700000000 + i}.jpg",
+            "path": f"media/avatars/user_1/{1700000000 + i}.jpg",
+            "upload_date": datetime.fromtimestamp(1700000000 + i).isoformat(),
+            "size": 150_000,
+            "imageData": f"data:image/jpeg;base64,{image_data}",
+        }
+        for i in range(5)
+    ]
+
+    def images_before():
+        images_adapter.dump_json(images_adapter.validate_python(images))
+
+    def images_after():
+        # What json_array_chunks does, minus the async iteration
+        b"[" + b",".join(dumps(image) for image in images) + b"]"
+
+    yield "users.images[5x150KB]", images_before, images_after
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--filter")
+    parser.add_argument("--round-time", type=float, default=0.2)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", dest="json_path")
+    args = parser.parse_args()
+
+    runner = Runner(
+        round_time=args.round_time, repeat=args.repeat, name_filter=args.filter
+    )
+    speedups = []
+    for name, before, after in cases():
+        old = runner.bench(f"{name}.before", before)
+        new = runner.bench(f"{name}.after", after)
+        if old and new:
+            speedups.append((name, old.ns_per_op, new.ns_per_op))
+    runner.close()
+
+    print()
+    for name, old, new in speedups:
+        print(
+            f"{name:<28} {format_ns(old):>10} -> {format_ns(new):>10}  "
+            f"x{old / new:.1f}"
+        )
+    if args.json_path:
+        Path(args.json_path).write_text(
+            json.dumps(results_json(runner.results), indent=2)
+        )
+
+
+if __name__ == "__main__":
+    main()
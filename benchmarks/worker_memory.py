@@ -0,0 +1,141 @@
+"""
+مقایسه مصرف حافظه workerها با و بدون preload در master
+
+Starts `gunicorn -c gunicorn.conf.py main:app` twice (GUNICORN_PRELOAD=true
+and false, CV_LAZY_LOAD=false so every worker holds the models), waits for
+/ready and reads /proc/<pid>/smaps_rollup of every worker. PSS is the number
+to compare: shared pages are split between the processes sharing them.
+
+Needs Linux, gunicorn and a reachable database (same settings as the app).
+Measured numbers are in worker_memory_results.md next to this script.
+
+Usage:
+    python benchmarks/worker_memory.py [--workers 4] [--port 8765] [--json out.json]
+"""
+
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+from typing import Dict, List
+
+ROOT = Path(__file__).resolve().parent.parent
+FIELDS = (
+    "Rss",
+    "Pss",
+    "Shared_Clean",
+    "Shared_Dirty",
+    "Private_Clean",
+    "Private_Dirty",
+)
+
+
+def read_smaps_rollup(pid: int) -> Dict[str, float]:
+    """Memory fields of one process in MiB"""
+    values = {}
+    for line in Path(f"/proc/{pid}/smaps_rollup").read_text().splitlines():
+        key, _, rest = line.partition(":")
+        if key in FIELDS:
+            values[key] = int(rest.split()[0]) / 1024.0
+    values["Uss"] = values.get("Private_Clean", 0.0) + values.get("Private_Dirty", 0.0)
+    return values
+
+
+def child_pids(pid: int) -> List[int]:
+    children = Path(f"/proc/{pid}/task/{pid}/children").read_text().split()
+    return [int(child) for child in children]
+
+
+def wait_ready(port: int, workers: int, master: subprocess.Popen, timeout: float):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if master.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with {master.returncode}")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/ready", timeout=1):
+                if len(child_pids(master.pid)) >= workers:
+                    # Give the remaining workers time to finish their lifespan
+                    time.sleep(2)
+                    return
+        except (urllib.error.URLError, ConnectionError, OSError):
+            pass
+        time.sleep(0.5)
+    raise TimeoutError("workers did not become ready")
+
+
+def measure(preload: bool, workers: int, port: int, timeout: float) -> Dict:
+    env = dict(
+        os.environ,
+        GUNICORN_PRELOAD=str(preload).lower(),
+        GUNICORN_BIND=f"127.0.0.1:{port}",
+        WEB_CONCURRENCY=str(workers),
+        CV_LAZY_LOAD="false",
+    )
+    master = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "main:app"],
+        cwd=ROOT,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_ready(port, workers, master, timeout)
+        per_worker = [read_smaps_rollup(pid) for pid in child_pids(master.pid)]
+        master_memory = read_smaps_rollup(master.pid)
+    finally:
+        master.send_signal(signal.SIGTERM)
+        master.wait(timeout=30)
+
+    total_pss = master_memory["Pss"] + sum(w["Pss"] for w in per_worker)
+    return {
+        "preload": preload,
+        "workers": per_worker,
+        "master": master_memory,
+        "avg_worker_rss_mib": round(
+            sum(w["Rss"] for w in per_worker) / len(per_worker), 1
+        ),
+        "avg_worker_pss_mib": round(
+            sum(w["Pss"] for w in per_worker) / len(per_worker), 1
+        ),
+        "avg_worker_uss_mib": round(
+            sum(w["Uss"] for w in per_worker) / len(per_worker), 1
+        ),
+        "total_pss_mib": round(total_pss, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--json", dest="json_path")
+    args = parser.parse_args()
+
+    results = [
+        measure(preload, args.workers, args.port, args.timeout)
+        for preload in (False, True)
+    ]
+
+    print(
+        f"{'preload':<8} {'avg RSS':>10} {'avg PSS':>10} {'avg USS':>10} {'total PSS':>11}"
+    )
+    for r in results:
+        print(
+            f"{str(r['preload']):<8} {r['avg_worker_rss_mib']:>8.1f}Mi "
+            f"{r['avg_worker_pss_mib']:>8.1f}Mi {r['avg_worker_uss_mib']:>8.1f}Mi "
+            f"{r['total_pss_mib']:>9.1f}Mi"
+        )
+
+    if args.json_path:
+        Path(args.json_path).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
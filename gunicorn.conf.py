@@ -0,0 +1,41 @@
+"""
+اجرای چند worker با gunicorn و اشتراک مدل‌ها بین آن‌ها
+
+    gunicorn -c gunicorn.conf.py main:app
+
+With GUNICORN_PRELOAD=true (default) the app and the CV models are loaded
+once in the master and shared copy-on-write by every worker; see
+app/prefork.py. Set it to false to load everything per worker instead.
+"""
+
+import os
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+worker_class = "uvicorn.workers.UvicornWorker"
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+preload_app = os.getenv("GUNICORN_PRELOAD", "true").lower() == "true"
+
+
+def on_starting(server):
+    # Per-worker metric files from a previous run would be summed into this one
+    metrics_dir = os.getenv("METRICS_MULTIPROC_DIR")
+    if metrics_dir and os.path.isdir(metrics_dir):
+        for name in os.listdir(metrics_dir):
+            if name.endswith((".json", ".tmp")):
+                os.remove(os.path.join(metrics_dir, name))
+
+
+def when_ready(server):
+    if preload_app:
+        from app.prefork import preload_shared
+
+        preload_shared()
+
+
+def post_fork(server, worker):
+    if preload_app:
+        from app.prefork import reinit_after_fork
+
+        reinit_after_fork()
@@ -0,0 +1,79 @@
+"""
+تصاویر چهره‌ی مصنوعی برای تست بار
+
+Drawn with OpenCV (skin-tone oval, eyes, brows, nose, mouth) with random
+size, position, lighting, slight rotation and noise, so requests exercise
+decode, blur, Haar and FaceMesh with realistic image sizes. Some of them
+will not pass the quality checks, which is also realistic.
+"""
+
+import random
+from pathlib import Path
+from typing import List
+
+import cv2
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+SAMPLE_DIR = ROOT / "media"
+
+
+def synthetic_face(rng: random.Random, size: int = 640) -> bytes:
+    image = np.full((size, size, 3), rng.randint(150, 230), np.uint8)
+    center = (size // 2 + rng.randint(-40, 40), size // 2 + rng.randint(-30, 30))
+    face_w, face_h = int(size * rng.uniform(0.22, 0.3)), int(
+        size * rng.uniform(0.3, 0.38)
+    )
+    skin = (rng.randint(120, 180), rng.randint(150, 200), rng.randint(190, 240))
+    cv2.ellipse(image, center, (face_w, face_h), 0, 0, 360, skin, -1)
+
+    eye_dx, eye_y = face_w // 2, center[1] - face_h // 4
+    for side in (-1, 1):
+        eye = (center[0] + side * eye_dx, eye_y)
+        cv2.ellipse(
+            image, eye, (face_w // 6, face_h // 14), 0, 0, 360, (255, 255, 255), -1
+        )
+        cv2.circle(image, eye, face_h // 18, (40, 30, 20), -1)
+        brow = (eye[0] - face_w // 6, eye_y - face_h // 7)
+        cv2.line(image, brow, (brow[0] + face_w // 3, brow[1]), (40, 40, 60), 6)
+    cv2.line(
+        image,
+        (center[0], eye_y + 10),
+        (center[0] - 8, center[1] + face_h // 6),
+        (90, 110, 160),
+        5,
+    )
+    cv2.ellipse(
+        image,
+        (center[0], center[1] + face_h // 2 - 30),
+        (face_w // 3, face_h // 12),
+        0,
+        0,
+        180,
+        (60, 60, 150),
+        5,
+    )
+
+    angle = rng.uniform(-12, 12)
+    matrix = cv2.getRotationMatrix2D(center, angle, 1.0)
+    image = cv2.warpAffine(image, matrix, (size, size), borderMode=cv2.BORDER_REPLICATE)
+    noise = np.random.default_rng(rng.randint(0, 2**32 - 1)).normal(0, 6, image.shape)
+    image = np.clip(image.astype(np.float32) * rng.uniform(0.8, 1.2) + noise, 0, 255)
+    ok, encoded = cv2.imencode(
+        ".jpg", image.astype(np.uint8), [cv2.IMWRITE_JPEG_QUALITY, 90]
+    )
+    return encoded.tobytes()
+
+
+def sample_images() -> List[bytes]:
+    """Real photos shipped in media/ (if any) are used alongside synthetic ones"""
+    return [
+        path.read_bytes()
+        for path in sorted(SAMPLE_DIR.rglob("*"))
+        if path.suffix.lower() in (".jpg", ".jpeg", ".png")
+    ][:8]
+
+
+def image_pool(count: int = 16, seed: int = 7) -> List[bytes]:
+    rng = random.Random(seed)
+    return sample_images() + [synthetic_face(rng) for _ in range(count)]
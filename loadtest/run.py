@@ -0,0 +1,396 @@
+"""
+تست بار end-to-end برای پیدا کردن نقطه‌ی شکست منحنی تاخیر
+
+Boots the app with uvicorn against a local database (SQLite file by
+default), seeds users and photos, then runs a request mix at increasing
+concurrency. Writes to loadtest/results/<timestamp>/:
+
+    report.json    throughput, latency percentiles, error rate per step and op
+    requests.jsonl every request (replayable with --replay)
+    server.log     the app's own log
+
+Usage:
+    python loadtest/run.py                              # SQLite, default steps
+    python loadtest/run.py --concurrency 1,4,16,64 --duration 30
+    python loadtest/run.py --database postgresql+asyncpg://u:p@localhost/lt
+    python loadtest/run.py --url http://127.0.0.1:8000  # already running server
+    python loadtest/run.py --replay loadtest/results/<ts>/requests.jsonl
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import requests
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from loadtest.faces import image_pool  # noqa: E402
+from loadtest.seed import PASSWORD, seed, usernames  # noqa: E402
+
+ROOT = Path(__file__).resolve().parent.parent
+RESULTS = ROOT / "loadtest" / "results"
+DEFAULT_MIX = "me=50,login=10,register=5,check_quality=20,upload=15"
+
+
+class VirtualUser:
+    """One client with its own HTTP connection and access token"""
+
+    def __init__(self, base_url: str, username: str, images: List[bytes], seed_: int):
+        self.base_url = base_url
+        self.username = username
+        self.images = images
+        self.rng = random.Random(seed_)
+        self.http = requests.Session()
+        self.token: Optional[str] = None
+        self.user_id: Optional[int] = None
+
+    def _auth(self) -> dict:
+        return {"Authorization": f"Bearer {self.token}"} if self.token else {}
+
+    def login(self) -> requests.Response:
+        response = self.http.post(
+            f"{self.base_url}/auth/login",
+            json={"username": self.username, "password": PASSWORD},
+        )
+        if response.status_code == 200:
+            self.token = response.json()["access_token"]
+        return response
+
+    def me(self) -> requests.Response:
+        response = self.http.get(f"{self.base_url}/auth/me", headers=self._auth())
+        if response.status_code == 200:
+            self.user_id = response.json()["id"]
+        return response
+
+    def register(self) -> requests.Response:
+        return self.http.post(
+            f"{self.base_url}/auth/register",
+            json={"username": f"lt-{uuid.uuid4().hex[:12]}", "password": PASSWORD},
+        )
+
+    def check_quality(self) -> requests.Response:
+        return self.http.post(
+            f"{self.base_url}/image/check-quality",
+            headers=self._auth(),
+            files={"image": ("face.jpg", self.rng.choice(self.images), "image/jpeg")},
+        )
+
+    def upload(self) -> requests.Response:
+        if self.user_id is None:
+            self.me()
+        return self.http.post(
+            f"{self.base_url}/user/upload-photo/",
+            params={"user_id": self.user_id},
+            headers=self._auth(),
+            files={"file": ("face.jpg", self.rng.choice(self.images), "image/jpeg")},
+        )
+
+    def ensure_logged_in(self) -> None:
+        if self.token is None:
+            self.login()
+            self.me()
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        if not hasattr(VirtualUser, name.strip()):
+            raise SystemExit(f"unknown operation in --mix: {name}")
+        weights[name.strip()] = float(weight)
+    return weights
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(
+        int(round(pct / 100 * len(sorted_values) + 0.5)) - 1, len(sorted_values) - 1
+    )
+    return sorted_values[max(index, 0)]
+
+
+def summarize(records: List[dict], elapsed: float) -> dict:
+    latencies = sorted(r["ms"] for r in records)
+    # 4xx answers (bad photo, wrong password) are expected outcomes of the mix
+    errors = [r for r in records if r["status"] is None or r["status"] >= 500]
+    return {
+        "requests": len(records),
+        "throughput_rps": round(len(records) / elapsed, 2) if elapsed else 0.0,
+        "error_rate": round(len(errors) / len(records), 4) if records else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p90_ms": round(percentile(latencies, 90), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "max_ms": round(latencies[-1], 2) if latencies else 0.0,
+        "statuses": {
+            str(status): sum(1 for r in records if r["status"] == status)
+            for status in sorted({r["status"] for r in records}, key=str)
+        },
+    }
+
+
+class Recorder:
+    def __init__(self, log_path: Path):
+        self.records: List[dict] = []
+        self._lock = threading.Lock()
+        self._log = open(log_path, "a", encoding="utf-8")
+
+    def call(self, step: int, vu: int, op: str, fn: Callable, t0: float) -> None:
+        start = time.perf_counter()
+        status, error = None, None
+        try:
+            status = fn().status_code
+        except requests.RequestException as e:
+            error = type(e).__name__
+        record = {
+            "step": step,
+            "vu": vu,
+            "op": op,
+            "t": round(start - t0, 4),
+            "status": status,
+            "ms": round((time.perf_counter() - start) * 1000, 3),
+        }
+        if error:
+            record["error"] = error
+        with self._lock:
+            self.records.append(record)
+            self._log.write(json.dumps(record) + "\n")
+
+    def take(self) -> List[dict]:
+        with self._lock:
+            records, self.records = self.records, []
+        self._log.flush()
+        return records
+
+    def close(self) -> None:
+        self._log.close()
+
+
+def run_step(
+    base_url, concurrency, duration, warmup, mix, names, images, recorder
+) -> dict:
+    ops, weights = zip(*mix.items())
+    users = [
+        VirtualUser(base_url, names[i % len(names)], images, seed_=i)
+        for i in range(concurrency)
+    ]
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(lambda u: u.ensure_logged_in(), users))
+
+    stop_at = time.perf_counter() + warmup + duration
+    measure_from = time.perf_counter() + warmup
+    t0 = time.perf_counter()
+
+    def drive(vu: int) -> None:
+        user = users[vu]
+        while time.perf_counter() < stop_at:
+            op = user.rng.choices(ops, weights)[0]
+            recorder.call(concurrency, vu, op, getattr(user, op), t0)
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(drive, range(concurrency)))
+
+    records = [r for r in recorder.take() if t0 + r["t"] >= measure_from]
+    step = {"concurrency": concurrency, **summarize(records, duration)}
+    step["ops"] = {
+        op: summarize([r for r in records if r["op"] == op], duration) for op in ops
+    }
+    return step
+
+
+def find_knee(steps: List[dict]) -> Optional[int]:
+    """
+    First concurrency where throughput gains less than 10% while p95 latency
+    grows by more than 50%: past this point requests only queue
+    """
+    for previous, current in zip(steps, steps[1:]):
+        if not previous["throughput_rps"] or not previous["p95_ms"]:
+            continue
+        gain = current["throughput_rps"] / previous["throughput_rps"] - 1
+        slowdown = current["p95_ms"] / previous["p95_ms"] - 1
+        if gain < 0.10 and slowdown > 0.50:
+            return current["concurrency"]
+    return None
+
+
+def replay(base_url, log_file: Path, names, images, recorder, speed: float) -> dict:
+    """Re-issue a recorded run with the same ops, users and timing (open loop)"""
+    records = [json.loads(line) for line in log_file.read_text().splitlines() if line]
+    users: Dict[tuple, VirtualUser] = {}
+    for r in records:
+        key = (r["step"], r["vu"])
+        if key not in users:
+            users[key] = VirtualUser(
+                base_url, names[r["vu"] % len(names)], images, r["vu"]
+            )
+            users[key].ensure_logged_in()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max(r["step"] for r in records) * 2) as pool:
+        for step in sorted({r["step"] for r in records}):
+            step_records = sorted(
+                (r for r in records if r["step"] == step), key=lambda r: r["t"]
+            )
+            base = time.perf_counter()
+            for r in step_records:
+                delay = base + r["t"] / speed - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                user = users[(step, r["vu"])]
+                pool.submit(
+                    recorder.call, step, r["vu"], r["op"], getattr(user, r["op"]), base
+                )
+    elapsed = time.perf_counter() - started
+    return summarize(recorder.take(), elapsed)
+
+
+def boot_server(args, out_dir: Path, admin: str) -> subprocess.Popen:
+    env = dict(
+        os.environ,
+        DATABASE_URL=args.database,
+        DB_AUTO_CREATE="true",
+        LOG_FILE=str(out_dir / "server.log"),
+        LOG_SUCCESS_SAMPLE_RATE=os.getenv("LOG_SUCCESS_SAMPLE_RATE", "0"),
+        INTERNAL_ENDPOINTS_ENABLED="true",
+        # /internal/* needs the admin scope; the report logs in as this user
+        ADMIN_USERNAMES=admin,
+    )
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "main:app",
+            "--host",
+            "127.0.0.1",
+            "--port",
+            str(args.port),
+            "--workers",
+            str(args.workers),
+            "--no-access-log",
+        ],
+        cwd=ROOT,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=open(out_dir / "server.stderr", "w"),
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise SystemExit(f"server exited, see {out_dir / 'server.stderr'}")
+        try:
+            if requests.get(f"http://127.0.0.1:{args.port}/ready", timeout=1).ok:
+                return server
+        except requests.RequestException:
+            pass
+        time.sleep(0.3)
+    server.terminate()
+    raise SystemExit("server did not become ready within 60s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--url", help="target an already running server")
+    parser.add_argument(
+        "--database",
+        default=f"sqlite+aiosqlite:///{RESULTS / 'loadtest.db'}",
+        help="SQLAlchemy URL of the database to boot the app against",
+    )
+    parser.add_argument("--port", type=int, default=8799)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--photos", type=int, default=2, help="seeded photos per user")
+    parser.add_argument("--concurrency", default="1,2,4,8,16,32")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds per step")
+    parser.add_argument(
+        "--warmup", type=float, default=3.0, help="unmeasured seconds per step"
+    )
+    parser.add_argument("--mix", default=DEFAULT_MIX)
+    parser.add_argument("--replay", type=Path, help="requests.jsonl of an earlier run")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed factor")
+    parser.add_argument("--out", type=Path)
+    args = parser.parse_args()
+
+    out_dir = args.out or RESULTS / datetime.now().strftime("%Y%m%d-%H%M%S")
+    out_dir.mkdir(parents=True, exist_ok=True)
+    images = image_pool()
+    names = usernames(args.users)
+
+    server = None
+    report = {"started_at": datetime.now().isoformat(), "args": vars(args).copy()}
+    report["args"] = {
+        k: str(v) if isinstance(v, Path) else v for k, v in report["args"].items()
+    }
+    if args.url:
+        base_url = args.url.rstrip("/")
+    else:
+        sample = next((ROOT / "media").rglob("*.jpg"), None)
+        report["seed"] = seed(args.database, args.users, args.photos, str(sample or ""))
+        server = boot_server(args, out_dir, names[0])
+        base_url = f"http://127.0.0.1:{args.port}"
+
+    recorder = Recorder(out_dir / "requests.jsonl")
+    try:
+        if args.replay:
+            report["replay"] = replay(
+                base_url, args.replay, names, images, recorder, args.speed
+            )
+            print(json.dumps(report["replay"], indent=2))
+        else:
+            mix = parse_mix(args.mix)
+            report["mix"] = mix
+            report["steps"] = []
+            print(
+                f"{'conc':>5} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'err%':>6}"
+            )
+            for concurrency in [int(c) for c in args.concurrency.split(",")]:
+                step = run_step(
+                    base_url,
+                    concurrency,
+                    args.duration,
+                    args.warmup,
+                    mix,
+                    names,
+                    images,
+                    recorder,
+                )
+                report["steps"].append(step)
+                print(
+                    f"{concurrency:>5} {step['throughput_rps']:>8.1f} "
+                    f"{step['p50_ms']:>7.1f}ms {step['p95_ms']:>7.1f}ms "
+                    f"{step['p99_ms']:>7.1f}ms {step['error_rate'] * 100:>5.1f}%"
+                )
+            report["knee_concurrency"] = find_knee(report["steps"])
+            print(f"knee: {report['knee_concurrency'] or 'not reached'}")
+        try:
+            admin = VirtualUser(base_url, names[0], images, 0)
+            admin.login()
+            report["server_pool"] = requests.get(
+                f"{base_url}/internal/db/pool", headers=admin._auth(), timeout=2
+            ).json()
+        except (requests.RequestException, ValueError):
+            pass
+    finally:
+        recorder.close()
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+
+    (out_dir / "report.json").write_text(json.dumps(report, indent=2))
+    print(f"results in {out_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+ساخت کاربران و عکس‌های آزمایشی در دیتابیس تست بار
+
+Writes straight to the database with a synchronous engine: N users sharing
+one precomputed password hash (hashing N passwords with bcrypt would take
+minutes) and a few photo rows per user. Re-running only adds what is
+missing.
+"""
+
+from datetime import datetime, timedelta
+from typing import List
+
+import sqlalchemy as sa
+from sqlalchemy import URL, make_url
+
+USERNAME_PREFIX = "loadtest-user-"
+PASSWORD = "loadtest-password"
+
+
+def sync_url(url: str) -> URL:
+    """The async URL the app uses, with a synchronous driver"""
+    parsed = make_url(url)
+    driver = {
+        "sqlite+aiosqlite": "sqlite",
+        "postgresql+asyncpg": "postgresql+psycopg2",
+    }.get(parsed.drivername, parsed.drivername)
+    # asyncpg-only query options mean nothing to psycopg2
+    return parsed.set(drivername=driver).difference_update_query(
+        ["prepared_statement_cache_size"]
+    )
+
+
+def usernames(count: int) -> List[str]:
+    return [f"{USERNAME_PREFIX}{i}" for i in range(count)]
+
+
+def seed(url: str, users: int, photos_per_user: int, photo_path: str) -> dict:
+    from app.db.session import Base
+    from app.models.user import User, UserPhoto
+    from app.utils.security import pwd_context
+
+    engine = sa.create_engine(sync_url(url))
+    Base.metadata.create_all(engine)
+    hashed = pwd_context.hash(PASSWORD)
+    now = datetime.now()
+
+    with engine.begin() as conn:
+        existing = set(
+            conn.scalars(
+                sa.select(User.username).where(
+                    User.username.startswith(USERNAME_PREFIX)
+                )
+            )
+        )
+        missing = [name for name in usernames(users) if name not in existing]
+        for start in range(0, len(missing), 1000):
+            conn.execute(
+                sa.insert(User),
+                [
+                    {
+                        "username": name,
+                        "hashed_password": hashed,
+                        "firstname": "Load",
+                        "lastname": name.rsplit("-", 1)[-1],
+                        "is_active": True,
+                        "created_at": now,
+                    }
+                    for name in missing[start : start + 1000]
+                ],
+            )
+
+        new_ids = (
+            list(conn.scalars(sa.select(User.id).where(User.username.in_(missing))))
+            if missing
+            else []
+        )
+        photos = [
+            {
+                "user_id": user_id,
+                "image_path": photo_path,
+                "created_at": now - timedelta(minutes=n),
+            }
+            for user_id in new_ids
+            for n in range(photos_per_user)
+        ]
+        for start in range(0, len(photos), 1000):
+            conn.execute(sa.insert(UserPhoto), photos[start : start + 1000])
+
+    engine.dispose()
+    return {"users_created": len(missing), "photos_created": len(photos)}
@@ -0,0 +1,68 @@
+"""initial schema (what Base.metadata.create_all used to build)
+
+Revision ID: 0001_initial_schema
+Revises:
+Create Date: 2026-10-19
+
+Databases that were created by the old startup create_all already have
+these tables; mark them with `alembic stamp 0001_initial_schema` and then
+run `alembic upgrade head`.
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "0001_initial_schema"
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "users",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("username", sa.String(), nullable=False),
+        sa.Column("hashed_password", sa.String(), nullable=False),
+        sa.Column("mobile", sa.String(), nullable=True),
+        sa.Column("firstname", sa.String(), nullable=True),
+        sa.Column("lastname", sa.String(), nullable=True),
+        sa.Column("email", sa.String(), nullable=True),
+        sa.Column("national_id", sa.String(), nullable=True),
+        sa.Column("is_active", sa.Boolean(), nullable=False),
+        sa.Column("verification_code", sa.String(), nullable=True),
+        sa.Column("verification_code_expires", sa.DateTime(), nullable=True),
+        sa.Column("access_token", sa.String(), nullable=True),
+        sa.Column("refresh_token", sa.String(), nullable=True),
+        sa.Column("token_expires_at", sa.DateTime(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("email"),
+        sa.UniqueConstraint("national_id"),
+    )
+    op.create_index("ix_users_id", "users", ["id"])
+    op.create_index("ix_users_mobile", "users", ["mobile"], unique=True)
+    op.create_index("ix_users_username", "users", ["username"], unique=True)
+
+    op.create_table(
+        "user_photos",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=True),
+        sa.Column("image_path", sa.String(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_user_photos_id", "user_photos", ["id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_user_photos_id", table_name="user_photos")
+    op.drop_table("user_photos")
+    op.drop_index("ix_users_username", table_name="users")
+    op.drop_index("ix_users_mobile", table_name="users")
+    op.drop_index("ix_users_id", table_name="users")
+    op.drop_table("users")
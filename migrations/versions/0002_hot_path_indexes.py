@@ -0,0 +1,62 @@
+"""indexes for photo listing and token lookups
+
+Revision ID: 0002_hot_path_indexes
+Revises: 0001_initial_schema
+Create Date: 2026-10-19
+
+On Postgres the indexes are built CONCURRENTLY so the upgrade does not lock
+writes on tables that are already large.
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "0002_hot_path_indexes"
+down_revision: Union[str, None] = "0001_initial_schema"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        # Photo listing / verification: WHERE user_id = ? ORDER BY created_at DESC
+        op.create_index(
+            "ix_user_photos_user_id_created_at",
+            "user_photos",
+            ["user_id", sa.text("created_at DESC")],
+            postgresql_concurrently=True,
+        )
+        # Only users with an active session carry tokens, so keep these small
+        op.create_index(
+            "ix_users_refresh_token",
+            "users",
+            ["refresh_token"],
+            postgresql_where=sa.text("refresh_token IS NOT NULL"),
+            sqlite_where=sa.text("refresh_token IS NOT NULL"),
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            "ix_users_access_token",
+            "users",
+            ["access_token"],
+            postgresql_where=sa.text("access_token IS NOT NULL"),
+            sqlite_where=sa.text("access_token IS NOT NULL"),
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_users_access_token", table_name="users", postgresql_concurrently=True
+        )
+        op.drop_index(
+            "ix_users_refresh_token", table_name="users", postgresql_concurrently=True
+        )
+        op.drop_index(
+            "ix_user_photos_user_id_created_at",
+            table_name="user_photos",
+            postgresql_concurrently=True,
+        )
@@ -0,0 +1,573 @@
+"""
+ورود دسته‌ای کاربران (و عکس‌هایشان) از فایل CSV یا NDJSON
+
+Instead of one /auth/register call per user (one bcrypt and about six
+queries each), this:
+
+    - hashes passwords on a process pool, one chunk per worker;
+    - loads users a batch at a time: COPY into a temp table + one
+      INSERT ... SELECT ... ON CONFLICT DO NOTHING on Postgres, multi-row
+      INSERT ... ON CONFLICT DO NOTHING elsewhere (SQLite);
+    - prepares (validates, filters existing usernames, hashes) the next batch
+      while the current one is being written;
+    - runs photos through the same checks and storage as upload_photo
+      (store_user_photo) on a thread pool.
+
+Input columns: username, password (or an existing bcrypt hashed_password),
+and optionally mobile, email, firstname, lastname, photo (a path relative to
+--photo-dir, the input's directory by default).
+
+Progress is saved after every batch in <input>.progress.json; re-running the
+same command resumes after the last finished batch. Rows that cannot be
+imported go to <input>.rejects.jsonl with the reason.
+
+Usage:
+    python provisioning/import_users.py users.csv
+    python provisioning/import_users.py users.ndjson --batch-size 5000 --hash-workers 16
+    python provisioning/import_users.py users.csv --database sqlite+aiosqlite:///kiosk.db
+"""
+
+import argparse
+import asyncio
+import csv
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+USER_COLUMNS = (
+    "username",
+    "hashed_password",
+    "mobile",
+    "email",
+    "firstname",
+    "lastname",
+    "is_active",
+    "created_at",
+    "updated_at",
+)
+OPTIONAL_FIELDS = ("mobile", "email", "firstname", "lastname", "photo")
+
+
+# ─────────────────────────────
+# 📄 خواندن ورودی
+# ─────────────────────────────
+@dataclass
+class Record:
+    line: int
+    username: str
+    password: Optional[str] = None
+    hashed_password: Optional[str] = None
+    mobile: Optional[str] = None
+    email: Optional[str] = None
+    firstname: Optional[str] = None
+    lastname: Optional[str] = None
+    photo: Optional[str] = None
+
+
+def read_records(
+    path: Path, input_format: str
+) -> Iterator[Tuple[int, Union[dict, str]]]:
+    """(line number, CSV row or raw NDJSON line); NDJSON is parsed in parse_record"""
+    with open(path, newline="", encoding="utf-8") as f:
+        if input_format == "csv":
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row
+        else:
+            for number, line in enumerate(f, 1):
+                if line.strip():
+                    yield number, line
+
+
+def raw_username(raw: Union[dict, str]) -> Optional[str]:
+    """Best-effort username for a reject entry, whatever the row looks like"""
+    if isinstance(raw, str):
+        try:
+            raw = json.loads(raw)
+        except ValueError:
+            return None
+    return raw.get("username") if isinstance(raw, dict) else None
+
+
+def parse_record(line: int, raw: Union[dict, str]) -> Record:
+    """Raises ValueError with the reject reason"""
+    if isinstance(raw, str):
+        try:
+            raw = json.loads(raw)
+        except ValueError as e:
+            raise ValueError(f"invalid JSON: {e}")
+    if not isinstance(raw, dict):
+        raise ValueError("row is not a JSON object")
+
+    def value(name: str) -> Optional[str]:
+        item = raw.get(name)
+        # CSV has no null: empty cells mean "not given"
+        return str(item).strip() or None if item is not None else None
+
+    username = value("username")
+    if not username:
+        raise ValueError("missing username")
+    password = raw.get("password") or None
+    if password is not None and not isinstance(password, str):
+        # bcrypt in the worker process would fail the whole batch
+        raise ValueError("password is not a string")
+    record = Record(
+        line=line,
+        username=username,
+        password=password,
+        hashed_password=value("hashed_password"),
+        **{name: value(name) for name in OPTIONAL_FIELDS},
+    )
+    if record.hashed_password and not record.hashed_password.startswith("$2"):
+        raise ValueError("hashed_password is not a bcrypt hash")
+    if not record.password and not record.hashed_password:
+        raise ValueError("missing password")
+    return record
+
+
+# ─────────────────────────────
+# 🔐 هش موازی رمزها
+# ─────────────────────────────
+def hash_chunk(passwords: List[str]) -> List[str]:
+    # Runs in a worker process; same CryptContext (and cost) as the app
+    from app.utils.security import pwd_context
+
+    return [pwd_context.hash(password) for password in passwords]
+
+
+async def hash_passwords(
+    pool: ProcessPoolExecutor, passwords: List[str], workers: int
+) -> List[str]:
+    if not passwords:
+        return []
+    loop = asyncio.get_running_loop()
+    size = max(1, -(-len(passwords) // workers))
+    chunks = [passwords[i : i + size] for i in range(0, len(passwords), size)]
+    hashed = await asyncio.gather(
+        *(loop.run_in_executor(pool, hash_chunk, chunk) for chunk in chunks)
+    )
+    return list(itertools.chain.from_iterable(hashed))
+
+
+# ─────────────────────────────
+# 📈 پیشرفت و ادامه‌ی کار
+# ─────────────────────────────
+@dataclass
+class Progress:
+    input: str
+    input_size: int
+    offset: int = 0
+    created: int = 0
+    existing: int = 0
+    rejected: int = 0
+    photos_stored: int = 0
+    photos_rejected: int = 0
+
+    @classmethod
+    def load(cls, path: Path, input_path: Path, restart: bool) -> "Progress":
+        fresh = cls(str(input_path.resolve()), input_path.stat().st_size)
+        if restart or not path.exists():
+            return fresh
+        saved = cls(**json.loads(path.read_text()))
+        if (saved.input, saved.input_size) != (fresh.input, fresh.input_size):
+            raise SystemExit(
+                f"{path} belongs to a different input file; use --restart to "
+                "start over"
+            )
+        return saved
+
+    def save(self, path: Path) -> None:
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(asdict(self), indent=2))
+        os.replace(tmp, path)
+
+
+class Reporter:
+    def __init__(self, total: int, progress: Progress):
+        self.total = total
+        self.progress = progress
+        self.started = time.monotonic()
+        self.start_offset = progress.offset
+
+    def report(self) -> None:
+        p = self.progress
+        elapsed = time.monotonic() - self.started
+        rate = (p.offset - self.start_offset) / elapsed if elapsed else 0.0
+        eta = (self.total - p.offset) / rate if rate else 0.0
+        print(
+            f"[{p.offset:>8}/{self.total} {p.offset / max(self.total, 1):6.1%}] "
+            f"{rate:7.0f} rows/s  created {p.created}  existing {p.existing}  "
+            f"rejected {p.rejected}  photos {p.photos_stored}"
+            f"/{p.photos_rejected} rejected  "
+            f"ETA {timedelta(seconds=int(eta))}",
+            file=sys.stderr,
+            flush=True,
+        )
+
+
+# ─────────────────────────────
+# 🗄️ نوشتن در دیتابیس
+# ─────────────────────────────
+@dataclass
+class Batch:
+    end_offset: int
+    records: List[Record] = field(default_factory=list)
+    new_rows: List[dict] = field(default_factory=list)
+    existing: int = 0
+    rejects: List[dict] = field(default_factory=list)
+
+
+async def existing_usernames(names: List[str]) -> set:
+    import sqlalchemy as sa
+
+    from app.db.session import engine
+    from app.models.user import User
+
+    async with engine.connect() as conn:
+        result = await conn.execute(
+            sa.select(User.username).where(User.username.in_(names))
+        )
+        return set(result.scalars())
+
+
+async def prepare_batch(
+    lines: List[Tuple[int, Union[dict, str]]],
+    end_offset: int,
+    hash_pool: ProcessPoolExecutor,
+    hash_workers: int,
+) -> Batch:
+    batch = Batch(end_offset)
+    seen = set()
+    for line, raw in lines:
+        try:
+            record = parse_record(line, raw)
+            if record.username in seen:
+                raise ValueError("duplicate username in input")
+        except (ValueError, TypeError) as e:
+            batch.rejects.append(
+                {"line": line, "username": raw_username(raw), "reason": str(e)}
+            )
+            continue
+        seen.add(record.username)
+        batch.records.append(record)
+
+    existing = await existing_usernames([r.username for r in batch.records])
+    batch.existing = len(existing)
+    to_create = [r for r in batch.records if r.username not in existing]
+    to_hash = [r for r in to_create if not r.hashed_password]
+    hashed = await hash_passwords(
+        hash_pool, [r.password for r in to_hash], hash_workers
+    )
+    for record, value in zip(to_hash, hashed):
+        record.hashed_password = value
+
+    now = datetime.now()
+    batch.new_rows = [
+        {
+            "username": r.username,
+            "hashed_password": r.hashed_password,
+            "mobile": r.mobile,
+            "email": r.email,
+            "firstname": r.firstname,
+            "lastname": r.lastname,
+            "is_active": True,
+            "created_at": now,
+            "updated_at": now,
+        }
+        for r in to_create
+    ]
+    return batch
+
+
+async def copy_users(conn, rows: List[dict]) -> List[str]:
+    """Postgres: COPY into a temp table, then one set-based INSERT"""
+    import sqlalchemy as sa
+
+    columns = ", ".join(USER_COLUMNS)
+    await conn.execute(
+        sa.text(
+            f"CREATE TEMP TABLE import_users ON COMMIT DROP AS "
+            f"SELECT {columns} FROM users WITH NO DATA"
+        )
+    )
+    raw = await conn.get_raw_connection()
+    await raw.driver_connection.copy_records_to_table(
+        "import_users",
+        records=[tuple(row[c] for c in USER_COLUMNS) for row in rows],
+        columns=list(USER_COLUMNS),
+    )
+    result = await conn.execute(
+        sa.text(
+            f"INSERT INTO users ({columns}) SELECT {columns} FROM import_users "
+            "ON CONFLICT DO NOTHING RETURNING username"
+        )
+    )
+    return list(result.scalars())
+
+
+async def insert_users(conn, rows: List[dict]) -> List[str]:
+    """Multi-row INSERT ... ON CONFLICT DO NOTHING (SQLite and others)"""
+    import sqlalchemy as sa
+    from sqlalchemy.dialects import postgresql, sqlite
+
+    from app.models.user import User
+
+    dialect_insert = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}.get(
+        conn.dialect.name
+    )
+    if dialect_insert is None:
+        statement = sa.insert(User)
+    else:
+        statement = dialect_insert(User).on_conflict_do_nothing()
+    # executemany + RETURNING is sent as batched multi-row INSERTs
+    result = await conn.execute(statement.returning(User.username), rows)
+    return list(result.scalars())
+
+
+async def not_inserted(batch: Batch, created: List[str]) -> Tuple[int, List[dict]]:
+    """
+    Rows sent but not inserted: (how many already exist, rejects for the rest)
+
+    The next batch is prepared while this one is written, so a username it
+    repeats passes the existing check and is only stopped by ON CONFLICT;
+    it counts as existing, like on a re-run. Only a username that is still
+    new means ON CONFLICT hit another unique column.
+    """
+    missing = {row["username"] for row in batch.new_rows} - set(created)
+    if not missing:
+        return 0, []
+    existing = await existing_usernames(list(missing))
+    new = missing - existing
+    conflicts = [
+        {
+            "line": r.line,
+            "username": r.username,
+            "reason": "mobile or email already in use",
+        }
+        for r in batch.records
+        if r.username in new
+    ]
+    return len(existing), conflicts
+
+
+async def load_batch(batch: Batch, use_copy: bool) -> List[str]:
+    from app.db.session import engine
+
+    if not batch.new_rows:
+        return []
+    async with engine.begin() as conn:
+        if use_copy and conn.dialect.driver == "asyncpg":
+            return await copy_users(conn, batch.new_rows)
+        return await insert_users(conn, batch.new_rows)
+
+
+# ─────────────────────────────
+# 🖼️ عکس‌ها
+# ─────────────────────────────
+def store_photo(user_id: int, path: Path) -> Tuple[Optional[str], Optional[str]]:
+    """(stored path, None) or (None, reject reason); runs on a worker thread"""
+    from fastapi import HTTPException
+
+    from app.services.user_service import store_user_photo
+
+    try:
+        return store_user_photo(user_id, path.read_bytes()), None
+    except HTTPException as e:
+        return None, str(e.detail)
+    except OSError as e:
+        return None, f"cannot read photo: {e}"
+    except Exception as e:
+        # One broken image must not abort an import of thousands of users
+        return None, f"photo processing failed: {e!r}"
+
+
+async def import_photos(
+    batch: Batch, photo_dir: Path, photo_pool: ThreadPoolExecutor
+) -> Tuple[int, List[dict]]:
+    import sqlalchemy as sa
+
+    from app.db.session import engine
+    from app.models.user import User, UserPhoto
+
+    wanted = {r.username: r for r in batch.records if r.photo}
+    if not wanted:
+        return 0, []
+    # Users that still have no photo: new ones, and ones whose photos were not
+    # written yet when an earlier run stopped
+    async with engine.connect() as conn:
+        result = await conn.execute(
+            sa.select(User.id, User.username).where(
+                User.username.in_(list(wanted)),
+                ~sa.exists().where(UserPhoto.user_id == User.id),
+            )
+        )
+        targets = result.all()
+
+    loop = asyncio.get_running_loop()
+    outcomes = await asyncio.gather(
+        *(
+            loop.run_in_executor(
+                photo_pool, store_photo, user_id, photo_dir / wanted[username].photo
+            )
+            for user_id, username in targets
+        )
+    )
+
+    now = datetime.now()
+    photo_rows, rejects = [], []
+    for (user_id, username), (stored, reason) in zip(targets, outcomes):
+        if stored:
+            photo_rows.append(
+                {"user_id": user_id, "image_path": stored, "created_at": now}
+            )
+        else:
+            record = wanted[username]
+            rejects.append({"line": record.line, "username": username, "photo": reason})
+    if photo_rows:
+        async with engine.begin() as conn:
+            await conn.execute(sa.insert(UserPhoto), photo_rows)
+    return len(photo_rows), rejects
+
+
+# ─────────────────────────────
+# ▶️ اجرا
+# ─────────────────────────────
+def batches(
+    records: Iterator[Tuple[int, Union[dict, str]]], offset: int, size: int
+) -> Iterator[Tuple[List[Tuple[int, Union[dict, str]]], int]]:
+    records = itertools.islice(records, offset, None)
+    while True:
+        chunk = list(itertools.islice(records, size))
+        if not chunk:
+            return
+        offset += len(chunk)
+        yield chunk, offset
+
+
+async def run(args: argparse.Namespace) -> Progress:
+    from app.config import get_settings
+    from app.db.session import (
+        check_schema_version,
+        create_tables,
+        engine,
+        init_db,
+        replicas,
+    )
+
+    settings = get_settings()
+    if settings.DB_AUTO_CREATE:
+        await init_db()
+        await create_tables()
+    else:
+        await check_schema_version()
+
+    state_path = args.state or args.input.with_name(args.input.name + ".progress.json")
+    rejects_path = args.input.with_name(args.input.name + ".rejects.jsonl")
+    progress = Progress.load(state_path, args.input, args.restart)
+    if args.restart and rejects_path.exists():
+        rejects_path.unlink()
+    total = sum(1 for _ in read_records(args.input, args.format))
+    if progress.offset:
+        print(f"resuming after record {progress.offset}", file=sys.stderr)
+    reporter = Reporter(total, progress)
+
+    hash_pool = ProcessPoolExecutor(
+        args.hash_workers, mp_context=multiprocessing.get_context("spawn")
+    )
+    photo_pool = ThreadPoolExecutor(args.photo_workers, thread_name_prefix="photo")
+    photo_dir = args.photo_dir or args.input.parent
+    pending = batches(
+        read_records(args.input, args.format), progress.offset, args.batch_size
+    )
+
+    async def prepare(item) -> Optional[Batch]:
+        if item is None:
+            return None
+        return await prepare_batch(*item, hash_pool, args.hash_workers)
+
+    try:
+        next_batch = asyncio.ensure_future(prepare(next(pending, None)))
+        with open(rejects_path, "a", encoding="utf-8") as rejects_file:
+            while True:
+                batch = await next_batch
+                if batch is None:
+                    break
+                # Validate and hash the next batch while this one is written
+                next_batch = asyncio.ensure_future(prepare(next(pending, None)))
+
+                created = await load_batch(batch, use_copy=not args.no_copy)
+                existing, conflicts = await not_inserted(batch, created)
+                stored, photo_rejects = (
+                    await import_photos(batch, photo_dir, photo_pool)
+                    if not args.skip_photos
+                    else (0, [])
+                )
+
+                for reject in batch.rejects + conflicts + photo_rejects:
+                    rejects_file.write(json.dumps(reject, ensure_ascii=False) + "\n")
+                rejects_file.flush()
+
+                progress.offset = batch.end_offset
+                progress.created += len(created)
+                progress.existing += batch.existing + existing
+                progress.rejected += len(batch.rejects) + len(conflicts)
+                progress.photos_stored += stored
+                progress.photos_rejected += len(photo_rejects)
+                progress.save(state_path)
+                reporter.report()
+    finally:
+        hash_pool.shutdown(cancel_futures=True)
+        photo_pool.shutdown()
+        await replicas.stop()
+        await engine.dispose()
+    return progress
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("input", type=Path, help="CSV or NDJSON file")
+    parser.add_argument("--format", choices=("csv", "ndjson"))
+    parser.add_argument("--database", help="overrides DATABASE_URL")
+    parser.add_argument("--batch-size", type=int, default=2000)
+    parser.add_argument("--hash-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--photo-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--photo-dir", type=Path)
+    parser.add_argument("--skip-photos", action="store_true")
+    parser.add_argument(
+        "--no-copy", action="store_true", help="multi-row INSERT even on Postgres"
+    )
+    parser.add_argument("--state", type=Path, help="progress file to resume from")
+    parser.add_argument("--restart", action="store_true", help="ignore saved progress")
+    args = parser.parse_args()
+
+    if args.format is None:
+        args.format = "csv" if args.input.suffix.lower() == ".csv" else "ndjson"
+    # Settings are read at import time, so these go in before any app import
+    if args.database:
+        os.environ["DATABASE_URL"] = args.database
+    os.environ.setdefault("FACE_MESH_POOL_SIZE", str(args.photo_workers))
+    os.environ.setdefault("CV_LAZY_LOAD", "true")
+
+    started = time.monotonic()
+    progress = asyncio.run(run(args))
+    print(
+        json.dumps(
+            {**asdict(progress), "seconds": round(time.monotonic() - started, 1)},
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
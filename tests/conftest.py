@@ -0,0 +1,64 @@
+"""
+تنظیمات مشترک تست‌ها: SQLite موقت به جای PostgreSQL
+
+Settings are read from the environment when app modules are imported, so
+the environment is set up here, before any test module imports ``app``.
+"""
+
+import asyncio
+import os
+import tempfile
+from typing import Dict, List, Tuple
+
+_tmp = tempfile.mkdtemp(prefix="app-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{_tmp}/test.db")
+os.environ.setdefault("DB_AUTO_CREATE", "true")
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+os.environ.setdefault("LOG_FILE", "")
+os.environ.setdefault("METRICS_ENABLED", "false")
+
+
+async def call_app(
+    app, method: str, path: str, body: bytes = b"", headers=()
+) -> Tuple[int, bytes]:
+    """Drive the ASGI app directly (httpx is not a dependency of the app)"""
+    status, _, content = await call_app_headers(app, method, path, body, headers)
+    return status, content
+
+
+async def call_app_headers(
+    app, method: str, path: str, body: bytes = b"", headers=()
+) -> Tuple[int, Dict[str, str], bytes]:
+    """call_app, also returning the response headers"""
+    messages: List[dict] = []
+    request_sent = False
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await asyncio.Event().wait()
+
+    async def send(message):
+        messages.append(message)
+
+    path, _, query = path.partition("?")
+    scope = {
+        "type": "http",
+        "method": method,
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query.encode(),
+        "headers": [(k.lower().encode(), v.encode()) for k, v in headers],
+        "client": ("test", 1),
+        "server": ("test", 80),
+        "scheme": "http",
+        "http_version": "1.1",
+        "root_path": "",
+    }
+    await app(scope, receive, send)
+    start = messages[0]
+    response_headers = {k.decode(): v.decode() for k, v in start["headers"]}
+    content = b"".join(m.get("body", b"") for m in messages[1:])
+    return start["status"], response_headers, content
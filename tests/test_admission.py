@@ -0,0 +1,116 @@
+"""Adaptive limit, 503 rejections and cancelled waiters of AdmissionController"""
+
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app.admission import AdmissionController
+
+
+def _finish_jobs(controller: AdmissionController, latency: float, count: int) -> None:
+    """Complete ``count`` jobs of ``latency`` seconds with every slot busy"""
+    for _ in range(count):
+        controller.in_flight = int(controller.limit)
+        controller._release(latency, completed=True)
+    controller.in_flight = 0
+
+
+def test_limit_shrinks_when_latency_rises_and_grows_back():
+    controller = AdmissionController("test", initial_limit=4, min_limit=1, max_limit=32)
+
+    _finish_jobs(controller, 0.01, 50)
+    grown = controller.limit
+    _finish_jobs(controller, 0.1, 100)
+    shrunk = controller.limit
+    _finish_jobs(controller, 0.01, 100)
+    recovered = controller.limit
+
+    assert grown > 4
+    assert controller.min_limit <= shrunk < grown / 2
+    assert recovered > shrunk * 2
+
+
+def _assert_503(error: pytest.ExceptionInfo) -> None:
+    assert error.value.status_code == 503
+    assert int(error.value.headers["Retry-After"]) >= 1
+
+
+def test_full_queue_is_rejected_with_retry_after():
+    controller = AdmissionController(
+        "test", initial_limit=1, min_limit=1, max_limit=1, queue_limit=1
+    )
+
+    async def scenario():
+        await controller._acquire("a", 1.0)
+        waiting = asyncio.ensure_future(controller._acquire("b", 1.0))
+        await asyncio.sleep(0)
+        with pytest.raises(HTTPException) as error:
+            await controller._acquire("c", 1.0)
+        waiting.cancel()
+        return error
+
+    _assert_503(asyncio.run(scenario()))
+    assert controller.rejected["queue_full"] == 1
+
+
+def test_expired_wait_is_rejected_with_retry_after():
+    controller = AdmissionController(
+        "test", initial_limit=1, min_limit=1, max_limit=1, max_wait=0.05
+    )
+
+    async def scenario():
+        await controller._acquire("a", 1.0)
+        with pytest.raises(HTTPException) as error:
+            await controller._acquire("b", 1.0)
+        return error
+
+    _assert_503(asyncio.run(scenario()))
+    assert controller.rejected["timeout"] == 1
+    assert (controller.in_flight, controller.queued) == (1, 0)
+    assert not controller._tenant_queued
+
+
+def test_cancelled_while_queued_leaves_the_queue():
+    controller = AdmissionController("test", initial_limit=1, min_limit=1, max_limit=1)
+
+    async def scenario():
+        await controller._acquire("a", 1.0)
+        waiting = asyncio.ensure_future(controller._acquire("b", 1.0))
+        await asyncio.sleep(0)
+        assert controller.queued == 1
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        queued = (controller.in_flight, controller.queued)
+        controller._release(0.01, completed=True)
+        # The slot is free again, nobody is left to hand it to
+        await asyncio.wait_for(controller._acquire("c", 1.0), 1)
+        return queued
+
+    assert asyncio.run(scenario()) == (1, 0)
+    assert (controller.in_flight, controller.queued) == (1, 0)
+    assert not controller._tenant_queued
+
+
+def test_cancelled_after_being_woken_passes_the_slot_on():
+    controller = AdmissionController("test", initial_limit=1, min_limit=1, max_limit=1)
+
+    async def scenario():
+        await controller._acquire("a", 1.0)
+        woken = asyncio.ensure_future(controller._acquire("b", 1.0))
+        next_in_line = asyncio.ensure_future(controller._acquire("c", 1.0))
+        await asyncio.sleep(0)
+        assert controller.queued == 2
+        # Hands a's slot to b, which is cancelled before it gets to run
+        controller._release(0.01, completed=True)
+        woken.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await woken
+        await asyncio.wait_for(next_in_line, 1)
+
+    asyncio.run(scenario())
+
+    assert (controller.in_flight, controller.queued) == (1, 0)
+    assert controller.admitted == 2  # a and c
+    assert not controller._tenant_queued
@@ -0,0 +1,57 @@
+"""Weighted fair queuing must hold with the limit above two workers"""
+
+import asyncio
+import threading
+import time
+
+from app.admission import AdmissionController
+from app.services.image_jobs import ImageJobs, JobOwner
+
+
+def test_light_user_is_not_queued_behind_a_looping_user():
+    limit = 4
+    jobs = ImageJobs(
+        AdmissionController(
+            "test",
+            initial_limit=limit,
+            min_limit=limit,
+            max_limit=limit,
+            queue_limit=64,
+            tenant_queue_limit=64,
+            max_wait=30,
+        )
+    )
+    lock = threading.Lock()
+    running = 0
+    most_running = 0
+    started = []
+
+    def work(owner: str) -> None:
+        nonlocal running, most_running
+        with lock:
+            running += 1
+            most_running = max(most_running, running)
+            started.append(owner)
+        time.sleep(0.02)
+        with lock:
+            running -= 1
+
+    async def scenario():
+        heavy = [
+            asyncio.ensure_future(jobs.run(work, "heavy", owner=JobOwner(user_id=1)))
+            for _ in range(24)
+        ]
+        await asyncio.sleep(0)
+        light = asyncio.ensure_future(jobs.run(work, "light", owner=JobOwner(2)))
+        await asyncio.gather(*heavy, light)
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        jobs.shutdown()
+
+    # Admitted jobs start right away: no hidden queue in the executor
+    assert most_running == limit
+    # The light job goes right after the slots already taken, not after all
+    # 24 heavy jobs
+    assert started.index("light") <= limit + 1
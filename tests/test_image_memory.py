@@ -0,0 +1,52 @@
+"""Memory budget decisions made from the image header"""
+
+import cv2
+import numpy as np
+import pytest
+from fastapi import HTTPException
+
+from app.metrics import detector_invocations, image_bytes
+from app.services.image_memory import ImageMemory, image_size
+
+
+def _jpeg(width: int, height: int) -> bytes:
+    image = np.zeros((height, width, 3), np.uint8)
+    return cv2.imencode(".jpg", image)[1].tobytes()
+
+
+@pytest.mark.parametrize("ext", [".jpg", ".png", ".webp", ".bmp"])
+def test_image_size_reads_header(ext):
+    contents = cv2.imencode(ext, np.zeros((123, 456, 3), np.uint8))[1].tobytes()
+    assert image_size(contents)[1:] == (456, 123)
+
+
+def test_quality_check_is_downscaled_to_fit():
+    memory = ImageMemory(budget_mb=50, over_budget="downscale")
+    plan = memory.plan("quality", _jpeg(4000, 3000))
+    assert plan.reduction > 1
+    assert plan.estimated_bytes <= memory.budget
+
+
+def test_avatar_is_rejected_even_when_downscaling_is_allowed():
+    memory = ImageMemory(budget_mb=50, over_budget="downscale")
+    with pytest.raises(HTTPException) as error:
+        memory.plan("avatar", _jpeg(4000, 3000))
+    assert error.value.status_code == 413
+
+
+def test_job_counts_are_reported_by_record():
+    # Jobs only count on the plan; metrics are updated on the event loop
+    memory = ImageMemory()
+    plan = memory.plan("quality", _jpeg(40, 30))
+    plan.bytes_decoded += plan.upload_bytes
+    plan.detectors.append("haar_cascade")
+    before = (
+        image_bytes.values.get((), 0.0),
+        detector_invocations.values.get((("detector", "haar_cascade"),), 0.0),
+    )
+    memory.record(plan)
+    after = (
+        image_bytes.values[()],
+        detector_invocations.values[(("detector", "haar_cascade"),)],
+    )
+    assert after == (before[0] + plan.upload_bytes, before[1] + 1)
@@ -0,0 +1,74 @@
+"""Bad input rows are rejected one by one instead of aborting the import"""
+
+import asyncio
+import importlib.util
+from pathlib import Path
+
+import pytest
+
+_path = Path(__file__).resolve().parent.parent / "provisioning" / "import_users.py"
+_spec = importlib.util.spec_from_file_location("import_users", _path)
+import_users = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(import_users)
+
+
+@pytest.mark.parametrize(
+    "raw, reason",
+    [
+        ("{bad json", "invalid JSON"),
+        ("[1, 2]", "not a JSON object"),
+        ('{"username": "a", "password": 12345}', "password is not a string"),
+        ({"username": "", "password": "x"}, "missing username"),
+    ],
+)
+def test_bad_rows_raise_value_error(raw, reason):
+    with pytest.raises(ValueError, match=reason):
+        import_users.parse_record(1, raw)
+
+
+def test_ndjson_and_csv_rows_parse():
+    line = '{"username": "a", "password": "secret", "mobile": 9120000000}'
+    record = import_users.parse_record(1, line)
+    assert (record.username, record.password, record.mobile) == (
+        "a",
+        "secret",
+        "9120000000",
+    )
+    row = {"username": "b", "password": "secret", "email": ""}
+    assert import_users.parse_record(2, row).email is None
+
+
+def test_read_records_survives_malformed_lines(tmp_path):
+    path = tmp_path / "users.ndjson"
+    path.write_text('{"username": "a", "password": "x"}\n{bad\n\n')
+    assert [n for n, _ in import_users.read_records(path, "ndjson")] == [1, 2]
+
+
+def test_username_repeated_in_a_later_batch_counts_as_existing():
+    from app.db.session import async_session, create_tables, init_db
+    from app.models.user import User
+
+    async def scenario():
+        await init_db()
+        await create_tables()
+        async with async_session() as db:
+            # Written by the previous batch while this one was prepared
+            db.add(User(username="repeated", mobile="09120000002", hashed_password="x"))
+            await db.commit()
+        batch = import_users.Batch(end_offset=2)
+        for line, username in enumerate(["repeated", "mobile-taken"], 1):
+            row = {"username": username, "password": "secret"}
+            batch.records.append(import_users.parse_record(line, row))
+            batch.new_rows.append({"username": username})
+        return await import_users.not_inserted(batch, created=[])
+
+    existing, conflicts = asyncio.run(scenario())
+
+    assert existing == 1
+    assert conflicts == [
+        {
+            "line": 2,
+            "username": "mobile-taken",
+            "reason": "mobile or email already in use",
+        }
+    ]
@@ -0,0 +1,27 @@
+"""/internal/* diagnostics are for admin tokens only"""
+
+import asyncio
+
+from app.config import get_settings
+from app.main import create_app
+from app.utils.security import create_access_token
+
+from conftest import call_app
+
+
+def _bearer(*scopes: str) -> list:
+    token = create_access_token({"sub": "1", "scopes": list(scopes)}, get_settings())
+    return [("authorization", f"Bearer {token}")]
+
+
+def test_internal_endpoints_require_admin_scope():
+    app = create_app()
+
+    async def statuses(path: str):
+        return [
+            (await call_app(app, "GET", path, headers=headers))[0]
+            for headers in ([], _bearer("user"), _bearer("user", "admin"))
+        ]
+
+    for path in ("/internal/db/pool", "/internal/admission", "/internal/image-memory"):
+        assert asyncio.run(statuses(path)) == [401, 403, 200], path
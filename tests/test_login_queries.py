@@ -0,0 +1,56 @@
+"""POST /auth/login must stay at one SELECT plus one UPDATE ... RETURNING"""
+
+import asyncio
+import json
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.db.session import async_session, create_tables, init_db
+from app.main import create_app
+from app.models.user import User
+from app.utils.security import hash_password
+
+from conftest import call_app
+
+
+def test_login_issues_one_select_and_one_update():
+    async def scenario():
+        await init_db()
+        await create_tables()
+        async with async_session() as db:
+            db.add(
+                User(
+                    username="login-queries",
+                    mobile="09120000001",
+                    hashed_password=hash_password("secret-password"),
+                )
+            )
+            await db.commit()
+
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement.strip().split(None, 1)[0].upper())
+
+        # Engine-wide, so reads routed to a replica/reader engine count too
+        event.listen(Engine, "before_cursor_execute", record)
+        try:
+            status, body = await call_app(
+                create_app(),
+                "POST",
+                "/auth/login",
+                json.dumps(
+                    {"username": "login-queries", "password": "secret-password"}
+                ).encode(),
+                headers=[("content-type", "application/json")],
+            )
+        finally:
+            event.remove(Engine, "before_cursor_execute", record)
+        return status, body, statements
+
+    status, body, statements = asyncio.run(scenario())
+
+    assert status == 200, body
+    assert "access_token" in json.loads(body)
+    assert statements == ["SELECT", "UPDATE"]
@@ -0,0 +1,129 @@
+"""X-Profile requests: who gets profiled, skips, and serving the result"""
+
+import asyncio
+import collections
+import json
+import time
+
+import pytest
+
+from app.config import get_settings
+from app.main import create_app
+from app.profiling import profiler
+from app.utils.security import create_access_token
+
+from conftest import call_app, call_app_headers
+
+
+def _headers(*scopes: str, profile: bool = True) -> list:
+    headers = [("x-profile", "1")] if profile else []
+    if scopes:
+        token = create_access_token(
+            {"sub": "1", "scopes": list(scopes)}, get_settings()
+        )
+        headers.append(("authorization", f"Bearer {token}"))
+    return headers
+
+
+@pytest.fixture
+def fresh_profiler(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiler, "directory", tmp_path / "profiles")
+    monkeypatch.setattr(profiler, "_recent", collections.deque())
+    monkeypatch.setattr(profiler, "max_per_minute", 6)
+    return profiler
+
+
+def _profile(app, *scopes: str) -> dict:
+    async def scenario():
+        return await call_app_headers(
+            app, "GET", "/internal/db/pool", headers=_headers(*scopes)
+        )
+
+    return asyncio.run(scenario())[1]
+
+
+def test_only_admins_are_profiled(fresh_profiler):
+    app = create_app()
+    started = fresh_profiler.started
+
+    assert _profile(app)["x-profile-skipped"] == "forbidden"
+    assert _profile(app, "user")["x-profile-skipped"] == "forbidden"
+    assert fresh_profiler.started == started
+
+
+def test_busy_and_rate_limited_requests_are_skipped(fresh_profiler, monkeypatch):
+    app = create_app()
+
+    async def while_another_is_profiled():
+        held, _ = fresh_profiler.start("another request")
+        try:
+            return await call_app_headers(
+                app, "GET", "/internal/db/pool", headers=_headers("user", "admin")
+            )
+        finally:
+            fresh_profiler.stop(held)
+
+    _, headers, _ = asyncio.run(while_another_is_profiled())
+    assert headers["x-profile-skipped"] == "busy"
+
+    monkeypatch.setattr(fresh_profiler, "max_per_minute", 2)
+    # The held profile above took one of the two starts this minute
+    assert "x-profile-id" in _profile(app, "user", "admin")
+    assert _profile(app, "user", "admin")["x-profile-skipped"] == "rate_limited"
+
+
+def test_admin_profile_is_served_by_internal_profiles(fresh_profiler):
+    app = create_app()
+    admin = _headers("user", "admin", profile=False)
+
+    profile_id = _profile(app, "user", "admin")["x-profile-id"]
+    # Written by the sampler thread once the request has finished
+    deadline = time.monotonic() + 5
+    while fresh_profiler.path_for(profile_id, "collapsed") is None:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+    async def fetch(query: str):
+        path = f"/internal/profiles/{profile_id}{query}"
+        return await call_app(app, "GET", path, headers=admin)
+
+    status, body = asyncio.run(fetch(""))
+    assert status == 200
+    assert json.loads(body)["exporter"] == "app.profiling"
+    status, _ = asyncio.run(fetch("?format=collapsed"))
+    assert status == 200
+    status, _ = asyncio.run(
+        call_app(app, "GET", f"/internal/profiles/{profile_id}", headers=_headers())
+    )
+    assert status == 401
+
+
+@pytest.mark.parametrize(
+    "profile_id",
+    [
+        "../outside",
+        "20261019T101500-42-0123abcd/../../outside",
+        "20261019T101500-42-0123ABCD",
+        "20261019T101500-42",
+        "",
+    ],
+)
+def test_path_for_rejects_ids_not_matching_profile_id(fresh_profiler, profile_id):
+    # The file exists; only the id check keeps it from being served
+    path = fresh_profiler.directory / f"{profile_id}.speedscope.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text("{}")
+    assert path.is_file()
+
+    assert fresh_profiler.path_for(profile_id, "speedscope") is None
+
+
+def test_path_for_finds_a_stored_profile(fresh_profiler):
+    profile_id = "20261019T101500-42-0123abcd"
+    fresh_profiler.directory.mkdir()
+    path = fresh_profiler.directory / f"{profile_id}.speedscope.json"
+    path.write_text("{}")
+
+    assert fresh_profiler.path_for(profile_id, "speedscope") == path
+    assert fresh_profiler.path_for(profile_id, "collapsed") is None
+    assert fresh_profiler.path_for(profile_id, "pstats") is None
@@ -0,0 +1,163 @@
+"""Replica routing with two SQLite files standing in for the replicas"""
+
+import asyncio
+from pathlib import Path
+from typing import List, Tuple
+
+import sqlalchemy as sa
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
+
+from app.db.routing import ReplicaSet, RoutingSession
+
+
+class Base(DeclarativeBase):
+    pass
+
+
+class Item(Base):
+    __tablename__ = "items"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    name: Mapped[str]
+
+
+async def _databases(
+    tmp_path: Path, replica_urls: Tuple[str, ...] = ()
+) -> Tuple[AsyncEngine, ReplicaSet, async_sessionmaker]:
+    """A primary and two replicas, each holding one row named after itself"""
+    primary = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/primary.db")
+    urls = replica_urls or tuple(
+        f"sqlite+aiosqlite:///{tmp_path}/replica{i}.db" for i in range(2)
+    )
+    engines = [create_async_engine(url) for url in urls]
+    for name, engine in [("primary", primary)] + [
+        (f"replica{i}", e) for i, e in enumerate(engines)
+    ]:
+        try:
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.create_all)
+                await conn.execute(sa.insert(Item).values(id=1, name=name))
+        except sa.exc.OperationalError:
+            pass  # an unreachable replica
+    replicas = ReplicaSet(engines)
+
+    class Session(RoutingSession):
+        pass
+
+    Session.replicas = replicas
+    maker = async_sessionmaker(
+        bind=primary, class_=AsyncSession, sync_session_class=Session
+    )
+    return primary, replicas, maker
+
+
+async def _names(db: AsyncSession) -> List[str]:
+    return list((await db.scalars(sa.select(Item.name).order_by(Item.id))).all())
+
+
+def _drop_connections(engine: AsyncEngine) -> dict:
+    """Make every statement on ``engine`` fail like a closed aiosqlite connection"""
+    dropped = {"on": False}
+
+    @event.listens_for(engine.sync_engine, "do_execute")
+    def fail(cursor, statement, parameters, context):
+        if dropped["on"]:
+            raise context.dialect.dbapi.OperationalError("no active connection")
+
+    return dropped
+
+
+async def _dispose(primary: AsyncEngine, replicas: ReplicaSet) -> None:
+    await replicas.stop()
+    await primary.dispose()
+
+
+def test_reads_go_round_robin_to_replicas(tmp_path):
+    async def scenario():
+        primary, replicas, maker = await _databases(tmp_path)
+        try:
+            async with maker() as db:
+                names = [(await _names(db))[0] for _ in range(3)]
+            async with maker() as db:
+                names.append((await _names(db))[0])
+        finally:
+            await _dispose(primary, replicas)
+        return names, replicas.routed
+
+    names, routed = asyncio.run(scenario())
+
+    assert names == ["replica0", "replica1", "replica0", "replica1"]
+    assert routed == [2, 2]
+
+
+def test_reads_after_a_flush_see_the_requests_writes(tmp_path):
+    async def scenario():
+        primary, replicas, maker = await _databases(tmp_path)
+        try:
+            async with maker() as db:
+                db.add(Item(id=2, name="written"))
+                await db.flush()
+                names = await _names(db)
+                await db.rollback()
+        finally:
+            await _dispose(primary, replicas)
+        return names, replicas.routed
+
+    names, routed = asyncio.run(scenario())
+
+    assert names == ["primary", "written"]
+    assert routed == [0, 0]
+
+
+def test_read_falls_back_to_primary_when_a_replica_cannot_connect(tmp_path):
+    unreachable = f"sqlite+aiosqlite:///{tmp_path}/missing/replica.db"
+    reachable = f"sqlite+aiosqlite:///{tmp_path}/replica1.db"
+
+    async def scenario():
+        primary, replicas, maker = await _databases(tmp_path, (unreachable, reachable))
+        try:
+            async with maker() as db:
+                names = [(await _names(db))[0] for _ in range(3)]
+        finally:
+            await _dispose(primary, replicas)
+        return names, replicas
+
+    names, replicas = asyncio.run(scenario())
+
+    # The failed read is retried on the primary, then the replica is skipped
+    assert names == ["primary", "replica1", "replica1"]
+    assert replicas.fallbacks == 1
+    assert [r["healthy"] for r in replicas.stats()] == [False, True]
+
+
+def test_replica_dropping_mid_session_does_not_lose_the_commit(tmp_path):
+    async def scenario():
+        primary, replicas, maker = await _databases(tmp_path)
+        dropped = [_drop_connections(engine) for engine in replicas.engines]
+        try:
+            async with maker() as db:
+                # Both replica connections join the session's transaction
+                names = [(await _names(db))[0] for _ in range(2)]
+                for flag in dropped:
+                    flag["on"] = True
+                names.append((await _names(db))[0])
+                db.add(Item(id=2, name="written"))
+                await db.commit()
+            async with primary.connect() as conn:
+                stored = (await conn.scalars(sa.select(Item.name))).all()
+        finally:
+            await _dispose(primary, replicas)
+        return names, stored, replicas.fallbacks
+
+    names, stored, fallbacks = asyncio.run(scenario())
+
+    assert names == ["replica0", "replica1", "primary"]
+    assert fallbacks == 1
+    assert sorted(stored) == ["primary", "written"]